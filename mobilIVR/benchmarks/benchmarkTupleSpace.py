@@ -0,0 +1,80 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2009 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+#    http://epydoc.sf.net                                                    #
+
+"""
+@author: Bryan McAlister
+
+Measures the throughput of local tuple space operations of a single
+StaticTupleSpacePeer (no network communication is involved).
+
+Usage: benchmarkTupleSpace.py [NUMBER_OF_TUPLES]
+"""
+
+import sys, time
+sys.path.append('../')
+
+from network.staticTupleSpace import StaticTupleSpacePeer
+
+
+def timeOperation(name, numberOfOperations, operation):
+    start = time.time()
+    operation()
+    duration = time.time() - start
+    print '%-28s %8.3f s  %10.0f ops/s' % (name, duration, numberOfOperations / duration)
+
+def run(numberOfTuples):
+    peer = StaticTupleSpacePeer(id='benchmarkPeer')
+    tuples = [('resource', 'ivr', peer.id, 'SIP/%d' % i) for i in xrange(numberOfTuples)]
+    
+    def put():
+        for sTuple in tuples:
+            peer.put(sTuple)
+    def readExact():
+        for sTuple in tuples:
+            peer.readIfExists(sTuple)
+    def readTemplate():
+        for sTuple in tuples:
+            peer.readIfExists(('resource', 'ivr', str, sTuple[3]))
+    def take():
+        for sTuple in tuples:
+            peer.getIfExists(('resource', 'ivr', str, sTuple[3]))
+    
+    print 'Local operations on %d tuples:' % numberOfTuples
+    timeOperation('put', numberOfTuples, put)
+    timeOperation('read (exact tuple)', numberOfTuples, readExact)
+    timeOperation('read (template)', numberOfTuples, readTemplate)
+    timeOperation('get (template)', numberOfTuples, take)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        run(100000)
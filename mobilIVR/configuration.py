@@ -84,6 +84,32 @@ def parseSMSConfig(filename):
             settings['tx']['port'] = 13013
     return settings
 
+def parseChannels(channelsOption):
+    """ Parses a comma-separated list of Asterisk channels, each optionally
+    followed by the number of simultaneous calls it supports, e.g.
+    "DAHDI/g1:30, SIP/provider"
+    
+    @return: The list of channel names, and a dict with the capacity of each
+             channel (1 if not specified)
+    @rtype: tuple
+    """
+    channels = []
+    capacities = {}
+    for channel in channelsOption.split(','):
+        channel = channel.strip()
+        if channel == '':
+            continue
+        capacity = 1
+        if ':' in channel:
+            name, count = channel.rsplit(':', 1)
+            if count.strip().isdigit():
+                channel = name.strip()
+                capacity = int(count)
+        if channel not in capacities:
+            channels.append(channel)
+        capacities[channel] = capacity
+    return channels, capacities
+
 def parseIVRConfig(filename):
     """ Parses Asterisk IVR gateway configuration file, and returns a dict with its values """
     config = SafeConfigParser()
@@ -117,10 +143,12 @@ def parseIVRConfig(filename):
     if txEnabled:
         settings['tx'] = {}
         if config.has_option( 'outgoing', 'channels' ):
-            channels = config.get( 'outgoing', 'channels' ).split(',')
+            channels, capacities = parseChannels(config.get( 'outgoing', 'channels' ))
             settings['tx']['channels'] = channels
+            settings['tx']['channel_capacity'] = capacities
         else:
             settings['tx']['channels'] = ['Console/dsp']
+            settings['tx']['channel_capacity'] = {'Console/dsp': 1}
         if config.has_option( 'outgoing', 'gateway_address' ):
             gateway_address = config.get( 'outgoing', 'gateway_address' )
             settings['tx']['gateway_address'] = gateway_address
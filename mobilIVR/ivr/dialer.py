@@ -37,7 +37,8 @@
 """
 
 import time
-import random
+import itertools
+import threading
 
 import twisted.internet.reactor
 
@@ -45,6 +46,9 @@ import mobilIVR.resources
 
 import manager_api
 
+# Source of unique FastAGI handler IDs for outgoing calls
+_handlerIDs = itertools.count()
+
 class ResourceNotFound(Exception):
     """ Raised when an outgoing ivr resource could not be located
     """
@@ -68,41 +72,40 @@ class IVRDialer(mobilIVR.resources.Resource):
         self._resourceTuple = None
         self._rogueHandler = False
    
-    def getResource(self):
+    def getResource(self, timeout=None):
         """ Find and retrieve an instance of this resource; blocking operation
         
-        This is used for initiating outgoing calls.
+        This is used for initiating outgoing calls. If no outgoing line is
+        available, this waits until another application releases one.
+        
+        @param timeout: The maximum time (in seconds) to wait for an outgoing
+                        line; if not specified, wait indefinitely
+        @type timeout: float
         
         @raise ResourceNotFound: Raised if the resource cannot be located
         """
         #TODO: stop this dialer object from claiming more than one resource
-        def gotResourceDetails(remoteContact, resourceInfo, resourceTuple):
-            self._gotResource = True
-            if resourceInfo != None:
-                self._localNode.claimedResources += 1
-                self._astManAPIAddress, self._astManAPIPort, self._astManAPIChannel, self._astManAPIUsername, self._astManAPIPassword, self.gateway_address, self.prefix, self.internal_extension_length = resourceInfo
-                self._resourceTuple = resourceTuple
-                if self._astManAPIAddress in ('127.0.0.1', 'localhost') and remoteContact != None:
-                    self._astManAPIAddress = remoteContact.address
-            else:
-                self._resourceTuple = None
-                self._localNode._log.error('No outgoing ivr resource could be located!')
-                raise ResourceNotFound('No outgoing ivr resource could be located!')
-        self._gotResource = False
         self._localNode._log.info('Attempting to locate outgoing ivr resource')
-        twisted.internet.reactor.callFromThread(self._localNode.getResource, 'ivr', gotResourceDetails, removeResource=True)
-        while self._gotResource == False:
-            time.sleep(0.1)
+        self._requestResource(blocking=True, timeout=timeout)
+        if self._resourceTuple == None:
+            self._localNode._log.error('No outgoing ivr resource could be located!')
+            raise ResourceNotFound('No outgoing ivr resource could be located!')
     
     def getResourceIfExists(self):
         """ Find and retrieve an instance of this resource; non-blocking operation
         
         This is used for initiating outgoing calls.
         
-        @raise ResourceNotFound: Raised if the resource cannot be located
+        @return: True if an outgoing ivr resource was located
+        @rtype: bool
         """
+        self._requestResource(blocking=False)
+        return self._astManAPIAddress != None
+    
+    def _requestResource(self, blocking, timeout=None):
+        """ Asks the local node for an outgoing ivr resource, and waits (without
+        polling) until the node's reactor thread has answered """
         def gotResourceDetails(remoteContact, resourceInfo, resourceTuple):
-            self._gotResource = True
             if resourceInfo != None:
                 self._localNode.claimedResources += 1
                 self._astManAPIAddress, self._astManAPIPort, self._astManAPIChannel, self._astManAPIUsername, self._astManAPIPassword, self.gateway_address, self.prefix, self.internal_extension_length = resourceInfo
@@ -111,12 +114,19 @@ class IVRDialer(mobilIVR.resources.Resource):
                     self._astManAPIAddress = remoteContact.address
             else:
                 self._resourceTuple = None
-                raise ResourceNotFound('No outgoing ivr resource could be located!')
-        self._gotResource = False
-        twisted.internet.reactor.callFromThread(self._localNode.getResource, 'ivr', gotResourceDetails, blocking=False, removeResource=True)
-        while self._gotResource == False:
-            time.sleep(0.1)
-        return self._astManAPIAddress != None
+            resourceFound.set()
+        def requestFailed(failure):
+            # Report the failure as "no resource found", rather than leaving
+            # the calling thread waiting forever
+            self._localNode._log.error('Error while locating outgoing ivr resource: ' + failure.getErrorMessage())
+            self._resourceTuple = None
+            resourceFound.set()
+        def requestResource():
+            df = self._localNode.getResource('ivr', gotResourceDetails, blocking=blocking, removeResource=True, timeout=timeout)
+            df.addErrback(requestFailed)
+        resourceFound = threading.Event()
+        twisted.internet.reactor.callFromThread(requestResource) #IGNORE:E1101
+        resourceFound.wait()
     
     def releaseResource(self):
         """ Release this resource (call this when done with it).
@@ -128,14 +138,19 @@ class IVRDialer(mobilIVR.resources.Resource):
         def releaseCompleted():
             self._localNode.claimedResources -= 1
             self._resourceTuple = None
-            self._gotResource = False
+            resourceReleased.set()
         
         if self._resourceTuple != None:
             # Release the resource (put it back into the tuple space)
-            self._gotResource = True
-            twisted.internet.reactor.callFromThread(self._localNode.publishResource, 'ivr', originalPublisherID=self._resourceTuple[2], returnCallbackFunc=releaseCompleted) #IGNORE:E1101
-            while self._gotResource == True:
-                time.sleep(0.1)
+            def releaseFailed(failure):
+                self._localNode._log.error('Error while releasing outgoing ivr resource: ' + failure.getErrorMessage())
+                releaseCompleted()
+            def release():
+                df = self._localNode.releaseResource(self._resourceTuple, returnCallbackFunc=releaseCompleted)
+                df.addErrback(releaseFailed)
+            resourceReleased = threading.Event()
+            twisted.internet.reactor.callFromThread(release) #IGNORE:E1101
+            resourceReleased.wait()
         
     def dial(self, number):
         """ Dial a number; this returns when the call is active; this object can then be used for IVR interaction
@@ -151,7 +166,8 @@ class IVRDialer(mobilIVR.resources.Resource):
         if self._resourceTuple == None:
             raise ResourceNotFound('No outgoing ivr resource could be located!')
         # Prime server for incoming FastAGI request
-        handlerID = self._astManAPIChannel+str(random.randint(0, 999))
+        # Several calls may share a channel, so the handler ID must be unique per call
+        handlerID = self._astManAPIChannel+str(_handlerIDs.next())
         self._localNode.fastAGIServer.setIVRHandler(handlerID, self)
                 
         # do ManAPI calling thing
@@ -0,0 +1,352 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2009 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+#    http://epydoc.sf.net                                                    #
+
+
+"""
+@author: Bryan McAlister
+
+Provides the Bloom filter summaries of the tuples held by Static Tuple Space
+peers
+"""
+
+#!/usr/bin/env python
+
+import hashlib
+import struct
+from array import array
+
+from rpc import constants
+from rpc.encoding import Bencode, DecodeError
+from datastore import serializeKey
+from tupleindex import isExact, fieldMatches
+from wireformat import DataFormatError, encodeTuple, decodeTuple
+
+_encoder = Bencode()
+
+
+def _normalize(value):
+    """ Gives equal numbers the same serialized form (e.g. C{1} and C{1.0}),
+    since they match each other in templates """
+    if isinstance(value, (int, long, float)):
+        try:
+            if value == int(value):
+                return int(value)
+        except (OverflowError, ValueError):
+            pass
+    return value
+
+
+class BloomFilter(object):
+    """ A Bloom filter, as received from another peer
+
+    Membership tests may give false positives, but never false negatives.
+    """
+    def __init__(self, bits, hashes=None):
+        """
+        @param bits: The bit array of the filter, as returned by
+                     C{CountingBloomFilter.bits()}
+        @type bits: str
+        @param hashes: The number of hash functions of the filter; defaults to
+                       C{constants.summaryHashes}
+        @type hashes: int
+        """
+        if hashes == None:
+            hashes = constants.summaryHashes
+        self._bits = bits
+        self.size = len(bits) * 8
+        self.hashes = hashes
+
+    def __contains__(self, item):
+        bits = self._bits
+        for position in self._positions(item):
+            if not ord(bits[position >> 3]) & (1 << (position & 7)):
+                return False
+        return True
+
+    def _positions(self, item):
+        """ The bit positions of an item, derived from a single SHA-1 hash of
+        its serialized form (by double hashing) """
+        digest = hashlib.sha1(serializeKey(item)).digest()
+        first, second = struct.unpack('>II', digest[:8])
+        second |= 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+
+class CountingBloomFilter(BloomFilter):
+    """ A Bloom filter from which items can also be removed
+
+    Every bit is a counter of the items mapped to it; the plain bit array
+    (in which a bit is set if its counter is not zero) is what is sent to
+    other peers.
+    """
+    def __init__(self, size=None, hashes=None):
+        """
+        @param size: The number of bits of the filter (a multiple of 8);
+                     defaults to C{constants.summaryBits}
+        @type size: int
+        @param hashes: The number of hash functions of the filter; defaults to
+                       C{constants.summaryHashes}
+        @type hashes: int
+        """
+        if size == None:
+            size = constants.summaryBits
+        if hashes == None:
+            hashes = constants.summaryHashes
+        self.size = size
+        self.hashes = hashes
+        self._counters = array('I', [0]) * size
+
+    def __contains__(self, item):
+        counters = self._counters
+        for position in self._positions(item):
+            if counters[position] == 0:
+                return False
+        return True
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._counters[position] += 1
+
+    def remove(self, item):
+        """ Removes an item that was added (and not removed yet) """
+        for position in self._positions(item):
+            self._counters[position] -= 1
+
+    def bits(self):
+        """ Returns the bit array of the filter
+
+        @rtype: str
+        """
+        data = bytearray(self.size / 8)
+        for position, counter in enumerate(self._counters):
+            if counter:
+                data[position >> 3] |= 1 << (position & 7)
+        return str(data)
+
+
+def _groupItems(sTuple, group):
+    """ The items added to the filter of a tuple's group: the arity of the
+    tuple, and the arity, position and value of each of its other fields """
+    arity = len(sTuple)
+    items = [(arity,)]
+    for position in range(len(group), arity):
+        items.append((arity, position, _normalize(sTuple[position])))
+    return items
+
+def _templateItems(template, group):
+    """ The items a filter must contain for the tuples of a group to possibly
+    match a template (its arity, and its exact fields) """
+    arity = len(template)
+    items = [(arity,)]
+    for position in range(len(group), arity):
+        field = template[position]
+        if isExact(field):
+            items.append((arity, position, _normalize(field)))
+    return items
+
+def groupKey(group):
+    """ Identifies a group of tuples in the summaries exchanged by peers: the
+    Bencode encoding of the group in the wire format (see
+    C{wireformat.encodeTuple()})
+
+    @rtype: str
+    """
+    try:
+        return _encoder.encode(encodeTuple(group))
+    except DataFormatError:
+        # Groups that cannot be sent to other peers are only summarised locally
+        return repr(group)
+
+def groupFromKey(key):
+    """ Recreates a group of tuples from its key (see C{groupKey()}), as
+    received from another peer
+
+    @raise DataFormatError: The key does not identify a group in the wire
+                            format
+
+    @rtype: tuple
+    """
+    if type(key) is not str or len(key) == 0:
+        raise DataFormatError("Error, expected a tuple group key")
+    try:
+        data = _encoder.decode(key)
+    except (DecodeError, IndexError, ValueError):
+        raise DataFormatError("Error, invalid tuple group key")
+    return decodeTuple(data)
+
+def groupMatches(template, group):
+    """ Checks whether the tuples of a group could match a template """
+    if len(template) < len(group):
+        return False
+    for position in range(len(group)):
+        if not fieldMatches(template[position], group[position]):
+            return False
+    return True
+
+
+class TupleSummary(object):
+    """ Bloom filter summaries of the tuples held by a peer
+
+    Tuples are grouped by their first C{constants.partitionFields} fields
+    (e.g. C{('resource', 'ivr')}), and every group is summarised by a
+    counting Bloom filter of the other fields of its tuples. Each group has
+    a version, which changes whenever a tuple is added to or removed from
+    it, so other peers only need to fetch the filters that changed since
+    they last did (see C{changes()}).
+
+    @note: The filters summarise distinct tuples; copies of a tuple do not
+           change them
+    """
+    def __init__(self, size=None, hashes=None):
+        self._size = size
+        self._hashes = hashes
+        # { <group key>: [<group>, <version>, <number of tuples>, <CountingBloomFilter>] }
+        self._groups = {}
+        self._version = 0
+
+    def __len__(self):
+        return len(self._groups)
+
+    def add(self, sTuple):
+        group = tuple(sTuple[:constants.partitionFields])
+        key = groupKey(group)
+        entry = self._groups.get(key)
+        if entry == None:
+            entry = self._groups[key] = [group, 0, 0, CountingBloomFilter(self._size, self._hashes)]
+        for item in _groupItems(sTuple, group):
+            entry[3].add(item)
+        entry[2] += 1
+        self._changed(entry)
+
+    def remove(self, sTuple):
+        """ Removes a tuple that was added (and not removed yet) """
+        group = tuple(sTuple[:constants.partitionFields])
+        key = groupKey(group)
+        entry = self._groups[key]
+        entry[2] -= 1
+        if entry[2] == 0:
+            del self._groups[key]
+            self._version += 1
+            return
+        for item in _groupItems(sTuple, group):
+            entry[3].remove(item)
+        self._changed(entry)
+
+    def mayMatch(self, template):
+        """ Checks whether the summarised tuples may contain a match for a
+        template (false positives are possible, false negatives are not) """
+        return _mayMatch(self._groups.itervalues(), template)
+
+    def changes(self, versions):
+        """ Returns the filters of the groups that changed since another
+        peer last fetched them
+
+        @param versions: The versions of the groups the other peer has, as
+                         C{{<group key>: <version>}}
+        @type versions: dict
+
+        @return: A list of C{[<group key>, <version>, <bits>]} entries
+                 for the groups that are new or changed, and entries with
+                 version 0 and no bits for the groups that were removed
+        @rtype: list
+        """
+        changes = []
+        for key, entry in self._groups.iteritems():
+            if versions.get(key) != entry[1]:
+                changes.append([key, entry[1], entry[3].bits()])
+        for key in versions:
+            if key not in self._groups:
+                changes.append([key, 0, ''])
+        return changes
+
+    def _changed(self, entry):
+        self._version += 1
+        entry[1] = self._version
+
+
+class PeerSummary(object):
+    """ The copy of another peer's L{TupleSummary}, kept up to date with
+    the changes it returns """
+    def __init__(self):
+        # { <group key>: [<group>, <version>, <BloomFilter>] }
+        self._groups = {}
+        # The time at which the changes were last fetched from the peer
+        self.updated = None
+
+    def versions(self):
+        """ Returns the versions of the groups known, to send to the peer
+
+        @rtype: dict
+        """
+        versions = {}
+        for key, entry in self._groups.iteritems():
+            versions[key] = entry[1]
+        return versions
+
+    def update(self, changes):
+        """ Applies the changes returned by the peer's C{TupleSummary.changes()}
+
+        Malformed entries (including the groups the peer could only
+        summarise locally) are skipped; their tuples are not found through
+        this summary.
+        """
+        for entry in changes:
+            if not isinstance(entry, list) or len(entry) != 3:
+                continue
+            key, version, bits = entry
+            if version == 0:
+                self._groups.pop(key, None)
+                continue
+            if type(version) not in (int, long) or type(bits) is not str or len(bits) == 0:
+                continue
+            try:
+                group = groupFromKey(key)
+            except DataFormatError:
+                continue
+            self._groups[key] = [group, version, BloomFilter(bits)]
+
+    def mayMatch(self, template):
+        """ Checks whether the peer may hold a match for a template """
+        return _mayMatch([(entry[0], entry[1], None, entry[2]) for entry in self._groups.itervalues()], template)
+
+
+def _mayMatch(entries, template):
+    """ Checks whether the filter of any group matching a template contains
+    all of the template's items """
+    for entry in entries:
+        group, filter = entry[0], entry[-1]
+        if groupMatches(template, group):
+            for item in _templateItems(template, group):
+                if item not in filter:
+                    break
+            else:
+                return True
+    return False
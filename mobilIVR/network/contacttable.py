@@ -0,0 +1,184 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2009 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+#    http://epydoc.sf.net                                                    #
+
+
+"""
+@author: Bryan McAlister
+
+Provides the contact table of a Static Tuple Space peer
+"""
+
+#!/usr/bin/env python
+
+from collections import OrderedDict
+from binascii import hexlify
+
+from rpc import constants
+from rpc.contact import Contact
+
+def distance(keyOne, keyTwo):
+    """ Calculates the XOR distance between two node IDs (or keys)
+
+    @rtype: long
+    """
+    return long(hexlify(keyOne) or '0', 16) ^ long(hexlify(keyTwo) or '0', 16)
+
+
+class ContactTable(object):
+    """ The contacts known to a peer, keyed by node ID
+
+    There is only ever one C{Contact} object per node ID, so the liveness
+    information the network protocol records on it (last-seen time, smoothed
+    round-trip time and consecutive failures) accumulates over time, and is
+    available in constant time when choosing between peers. Contacts are
+    iterated in the order in which they were added.
+    """
+    def __init__(self):
+        # { <contactID>: <Contact> }
+        self._contacts = OrderedDict()
+
+    def __len__(self):
+        return len(self._contacts)
+
+    def __iter__(self):
+        return iter(self._contacts.values())
+
+    def __contains__(self, contactID):
+        if isinstance(contactID, Contact):
+            contactID = contactID.id
+        return contactID in self._contacts
+
+    def get(self, contactID):
+        """ Returns the contact with the specified node ID, or None """
+        return self._contacts.get(contactID)
+
+    def add(self, contact):
+        """ Adds a contact to the table
+
+        If a contact with the same node ID is already known, its address is
+        updated, and the existing object is kept.
+
+        @return: The contact object stored in the table
+        @rtype: Contact
+        """
+        existing = self._contacts.get(contact.id)
+        if existing == None:
+            self._insert(contact)
+            return contact
+        existing.address = contact.address
+        existing.port = contact.port
+        self._touch(existing)
+        return existing
+
+    def intern(self, contactID, address, port, networkProtocol):
+        """ Returns the contact with the specified node ID and address,
+            creating it only if it is not known yet
+
+        @rtype: Contact
+        """
+        contact = self._contacts.get(contactID)
+        if contact == None:
+            contact = Contact(contactID, address, port, networkProtocol)
+            self._insert(contact)
+            return contact
+        elif contact.address != address or contact.port != port:
+            # The node has moved (e.g. it was restarted on another address)
+            contact.address = address
+            contact.port = port
+        self._touch(contact)
+        return contact
+
+    def remove(self, contactID):
+        """ Removes a contact from the table (if present) """
+        self._contacts.pop(contactID, None)
+
+    def contactFailed(self, contactID):
+        """ Records that a contact did not respond to an RPC
+
+        The contact is removed once it has failed C{contactFailureLimit}
+        times in a row.
+
+        @return: True if the contact was removed
+        @rtype: bool
+        """
+        contact = self._contacts.get(contactID)
+        if contact == None:
+            return False
+        contact.failed()
+        if contact.failures >= constants.contactFailureLimit:
+            self.remove(contactID)
+            return True
+        return False
+
+    def rank(self, contactID):
+        """ Returns a sort key that orders contacts from the most to the least
+            preferable: responsive contacts before ones that recently failed,
+            and lower round-trip times first
+
+        Unknown contacts are ranked last; contacts whose RTT has not been
+        measured yet are ranked after measured contacts with the same number
+        of failures.
+        """
+        contact = self._contacts.get(contactID)
+        if contact == None:
+            return (constants.contactFailureLimit, True, 0)
+        return (contact.failures, contact.rtt == None, contact.rtt)
+
+    def preferred(self, contactIDs):
+        """ Sorts node IDs by the preference of their contacts (see C{rank()})
+
+        @rtype: list
+        """
+        return sorted(contactIDs, key=self.rank)
+
+    def findCloseContacts(self, key, count=None, excludeID=None):
+        """ Finds the contacts closest to a key (by XOR distance)
+
+        @param count: The maximum number of contacts to return; defaults to
+                      C{constants.k}
+        @param excludeID: The node ID of a contact to leave out (such as the
+                          node that is asking)
+
+        @return: The closest contacts, closest first
+        @rtype: list
+        """
+        if count == None:
+            count = constants.k
+        contacts = [contact for contact in self._contacts.itervalues() if contact.id != excludeID]
+        contacts.sort(key=lambda contact: distance(key, contact.id))
+        return contacts[:count]
+
+    def _insert(self, contact):
+        """ Stores a contact that is not in the table yet """
+        self._contacts[contact.id] = contact
+
+    def _touch(self, contact):
+        """ Called when a known contact is added (or interned) again """
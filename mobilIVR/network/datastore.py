@@ -40,12 +40,50 @@ published via the "STORE" RPC) for the Static Tuple Space
 #!/usr/bin/env python
 
 import UserDict
+import logging
 import sqlite3
 import cPickle as pickle
 import time
 import os
+import mmap
+import struct
+import zlib
 
 
+def serializeKey(key):
+    """ Serializes a data store key for persistent storage
+    
+    Keys may be any hashable value built from strings, numbers and tuples
+    (such as tuple space tuples); the serialized form of equal keys is the
+    same, since the pickle memo (which depends on object identity) is not
+    used.
+    
+    @rtype: str
+    """
+    pickler = pickle.Pickler(2)
+    pickler.fast = 1
+    pickler.dump(key)
+    return pickler.getvalue()
+
+def deserializeKey(data):
+    """ Recreates a data store key from its serialized form """
+    return pickle.loads(data)
+
+
+def _indexPublisher(publishers, originalPublisherID, key):
+    keys = publishers.get(originalPublisherID)
+    if keys == None:
+        publishers[originalPublisherID] = set([key])
+    else:
+        keys.add(key)
+
+def _unindexPublisher(publishers, originalPublisherID, key):
+    keys = publishers.get(originalPublisherID)
+    if keys != None:
+        keys.discard(key)
+        if len(keys) == 0:
+            del publishers[originalPublisherID]
+
 class DataStore(UserDict.DictMixin):
     """ Interface for classes implementing physical storage (for data
     published via the "STORE" RPC) for the Kademlia DHT
@@ -79,6 +117,48 @@ class DataStore(UserDict.DictMixin):
         pair to the current time
         """
 
+    def setItems(self, items):
+        """ Set several C{(key, value)} pairs at once
+        
+        @param items: A sequence of C{(key, value, lastPublished,
+                      originallyPublished, originalPublisherID)} tuples
+        """
+        for item in items:
+            self.setItem(*item)
+
+    def getRecord(self, key):
+        """ Get the value identified by C{key} together with its metadata
+        
+        @return: A tuple in the format C{(value, lastPublished,
+                 originallyPublished, originalPublisherID)}
+        """
+        return (self[key], self.lastPublished(key), self.originalPublishTime(key), self.originalPublisherID(key))
+
+    def publisherKeys(self, originalPublisherID):
+        """ Return a list of the keys of the values published by the node
+        with the specified ID """
+        return [key for key in self.keys() if self.originalPublisherID(key) == originalPublisherID]
+
+    def removeItems(self, keys):
+        """ Delete several keys (and their values) at once """
+        for key in keys:
+            del self[key]
+
+    def compact(self, force=False, maxBytes=None):
+        """ Reclaims the space used by overwritten and deleted items, if the
+        data store has grown wasteful enough to need it (or if C{force} is
+        set); this is called periodically by the peer
+        
+        If C{maxBytes} is specified, data stores that compact incrementally
+        do at most (about) that much work per call, and resume the compaction
+        with the next call (see C{compactionPending()}).
+        """
+
+    def compactionPending(self):
+        """ Returns True if an incremental compaction was started by
+        C{compact()}, and has not been completed yet """
+        return False
+
     def __getitem__(self, key):
         """ Get the value identified by C{key} """
 
@@ -90,21 +170,54 @@ class DataStore(UserDict.DictMixin):
     def __delitem__(self, key):
         """ Delete the specified key (and its value) """
 
+class _Record(object):
+    """ A value stored in a C{DictDataStore}, together with its metadata """
+    __slots__ = ('value', 'lastPublished', 'originallyPublished', 'originalPublisherID')
+
+    def __init__(self, value, lastPublished, originallyPublished, originalPublisherID):
+        self.value = value
+        self.lastPublished = lastPublished
+        self.originallyPublished = originallyPublished
+        self.originalPublisherID = originalPublisherID
+
+
 class DictDataStore(DataStore):
-    """ A datastore using an in-memory Python dictionary """
+    """ A datastore using an in-memory Python dictionary
+    
+    Values are stored as they are (they are not copied or serialized), in
+    compact C{__slots__} records that are updated in place when a key is set
+    again. The keys are also indexed by original publisher.
+    """
     def __init__(self):
         # Dictionary format:
-        # { <key>: (<value>, <lastPublished>, <originallyPublished> <originalPublisherID>) }
+        # { <key>: <_Record> }
         self._dict = {}
+        # { <originalPublisherID>: set(<key>, ...) }
+        self._publishers = {}
 
     def keys(self):
         """ Return a list of the keys in this data store """
         return self._dict.keys()
 
+    def __iter__(self):
+        return iter(self._dict)
+
+    def iterkeys(self):
+        return iter(self._dict)
+
+    def __len__(self):
+        return len(self._dict)
+
+    def has_key(self, key):
+        return key in self._dict
+
+    def __contains__(self, key):
+        return key in self._dict
+
     def lastPublished(self, key):
         """ Get the time the C{(key, value)} pair identified by C{key}
         was last published """
-        return self._dict[key][1]
+        return self._dict[key].lastPublished
 
     def originalPublisherID(self, key):
         """ Get the original publisher of the data's node ID
@@ -115,31 +228,60 @@ class DictDataStore(DataStore):
         @return: Return the node ID of the original publisher of the
         C{(key, value)} pair identified by C{key}.
         """
-        return self._dict[key][3]
+        return self._dict[key].originalPublisherID
 
     def originalPublishTime(self, key):
         """ Get the time the C{(key, value)} pair identified by C{key}
         was originally published """
-        return self._dict[key][2]
+        return self._dict[key].originallyPublished
 
     def setItem(self, key, value, lastPublished, originallyPublished, originalPublisherID):
         """ Set the value of the (key, value) pair identified by C{key};
         this should set the "last published" value for the (key, value)
         pair to the current time
         """
-        self._dict[key] = (value, lastPublished, originallyPublished, originalPublisherID)
+        record = self._dict.get(key)
+        if record == None:
+            self._dict[key] = _Record(value, lastPublished, originallyPublished, originalPublisherID)
+            _indexPublisher(self._publishers, originalPublisherID, key)
+        else:
+            if record.originalPublisherID != originalPublisherID:
+                _unindexPublisher(self._publishers, record.originalPublisherID, key)
+                _indexPublisher(self._publishers, originalPublisherID, key)
+            record.value = value
+            record.lastPublished = lastPublished
+            record.originallyPublished = originallyPublished
+            record.originalPublisherID = originalPublisherID
+
+    def getRecord(self, key):
+        """ Get the value identified by C{key} together with its metadata """
+        record = self._dict[key]
+        return (record.value, record.lastPublished, record.originallyPublished, record.originalPublisherID)
+
+    def publisherKeys(self, originalPublisherID):
+        """ Return a list of the keys of the values published by the node
+        with the specified ID """
+        return list(self._publishers.get(originalPublisherID, ()))
 
     def __getitem__(self, key):
         """ Get the value identified by C{key} """
-        return self._dict[key][0]
+        return self._dict[key].value
 
     def __delitem__(self, key):
         """ Delete the specified key (and its value) """
-        del self._dict[key]
+        record = self._dict.pop(key)
+        _unindexPublisher(self._publishers, record.originalPublisherID, key)
 
 
 class SQLiteDataStore(DataStore):
-    """ Example of a SQLite database-based datastore
+    """ A SQLite database-based datastore
+    
+    Keys are serialized with C{serializeKey()}, and stored as the primary key
+    (BLOB) of the table, so every lookup is
+    a single index search, and all the columns of a row are fetched at once
+    with C{getRecord()}. The original publisher IDs are indexed as well. File databases use write-ahead logging, which makes
+    each write a single sequential append instead of a rewrite of the
+    modified pages.
     """
     def __init__(self, dbFile=':memory:'):
         """
@@ -147,28 +289,54 @@ class SQLiteDataStore(DataStore):
                        unspecified, an in-memory database is used.
         @type dbFile: str
         """
-        createDB = not os.path.exists(dbFile)
         self._db = sqlite3.connect(dbFile)
         self._db.isolation_level = None
         self._db.text_factory = str
-        if createDB:
-            self._db.execute('CREATE TABLE data(key, value, lastPublished, originallyPublished, originalPublisherID)')
+        if dbFile != ':memory:':
+            self._db.execute('PRAGMA journal_mode=WAL')
+            # In WAL mode, this is still safe against corruption; only the
+            # last few writes may be lost on a power failure
+            self._db.execute('PRAGMA synchronous=NORMAL')
         self._cursor = self._db.cursor()
+        columns = self._cursor.execute('PRAGMA table_info(data)').fetchall()
+        if len(columns) == 0:
+            self._createTable()
+        elif not [column for column in columns if column[1] == 'key' and column[5] > 0]:
+            self._upgradeTable()
+        self._db.execute('CREATE INDEX IF NOT EXISTS data_publisher ON data(originalPublisherID)')
+    
+    def _createTable(self):
+        self._db.execute('CREATE TABLE data(key BLOB PRIMARY KEY, value BLOB, lastPublished INTEGER, '
+                         'originallyPublished INTEGER, originalPublisherID BLOB) WITHOUT ROWID')
+    
+    def _upgradeTable(self):
+        """ Replaces a table created by an older version of this class, in
+            which keys were hex-encoded digests and not indexed
+            
+            The tuples cannot be recovered from the digests, so the old rows
+            are dropped; the tuples are published (and replicated) again once
+            the peer rejoins the network.
+        """
+        count = self._cursor.execute('SELECT COUNT(*) FROM data').fetchone()[0]
+        self._cursor.execute('BEGIN')
+        try:
+            self._cursor.execute('DROP TABLE data')
+            self._createTable()
+        except:
+            self._cursor.execute('ROLLBACK')
+            raise
+        self._cursor.execute('COMMIT')
+        if count > 0:
+            logging.getLogger('mobilIVR').warning('Dropped %d entries in an unsupported old format from the data store' % count)
 
     def keys(self):
         """ Return a list of the keys in this data store """
-        keys = []
-        try:
-            self._cursor.execute("SELECT key FROM data")
-            for row in self._cursor:
-                keys.append(row[0].decode('hex'))
-        finally:
-            return keys
+        return [deserializeKey(str(row[0])) for row in self._db.execute('SELECT key FROM data')]
 
     def lastPublished(self, key):
         """ Get the time the C{(key, value)} pair identified by C{key}
         was last published """
-        return int(self._dbQuery(key, 'lastPublished'))
+        return self._fetch(key, 'lastPublished')
 
     def originalPublisherID(self, key):
         """ Get the original publisher of the data's node ID
@@ -179,37 +347,440 @@ class SQLiteDataStore(DataStore):
         @return: Return the node ID of the original publisher of the
         C{(key, value)} pair identified by C{key}.
         """
-        return self._dbQuery(key, 'originalPublisherID')
+        return self._decodeID(self._fetch(key, 'originalPublisherID'))
 
     def originalPublishTime(self, key):
         """ Get the time the C{(key, value)} pair identified by C{key}
         was originally published """
-        return int(self._dbQuery(key, 'originallyPublished'))
+        return self._fetch(key, 'originallyPublished')
+
+    def getRecord(self, key):
+        """ Get the value of C{key} together with all of its metadata, in a
+        single query """
+        self._cursor.execute('SELECT value, lastPublished, originallyPublished, originalPublisherID FROM data WHERE key=?', (buffer(serializeKey(key)),))
+        row = self._cursor.fetchone()
+        if row == None:
+            raise KeyError, key
+        return (pickle.loads(str(row[0])), row[1], row[2], self._decodeID(row[3]))
 
     def setItem(self, key, value, lastPublished, originallyPublished, originalPublisherID):
-        # Encode the key so that it doesn't corrupt the database
-        encodedKey = key.encode('hex')
-        self._cursor.execute("select key from data where key=:reqKey", {'reqKey': encodedKey})
-        if self._cursor.fetchone() == None:
-            self._cursor.execute('INSERT INTO data(key, value, lastPublished, originallyPublished, originalPublisherID) VALUES (?, ?, ?, ?, ?)', (encodedKey, buffer(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)), lastPublished, originallyPublished, originalPublisherID))
-        else:
-            self._cursor.execute('UPDATE data SET value=?, lastPublished=?, originallyPublished=?, originalPublisherID=? WHERE key=?', (buffer(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)), lastPublished, originallyPublished, originalPublisherID, encodedKey))
+        self._cursor.execute(self._upsert, self._row(key, value, lastPublished, originallyPublished, originalPublisherID))
+
+    def setItems(self, items):
+        """ Set several C{(key, value)} pairs at once, in a single transaction
         
-    def _dbQuery(self, key, columnName, unpickle=False):
+        @param items: A sequence of C{(key, value, lastPublished,
+                      originallyPublished, originalPublisherID)} tuples
+        """
+        self._cursor.execute('BEGIN')
+        try:
+            self._cursor.executemany(self._upsert, [self._row(*item) for item in items])
+        except:
+            self._cursor.execute('ROLLBACK')
+            raise
+        self._cursor.execute('COMMIT')
+
+    def publisherKeys(self, originalPublisherID):
+        """ Return a list of the keys of the values published by the node
+        with the specified ID """
+        return [deserializeKey(str(row[0])) for row in \
+                self._db.execute('SELECT key FROM data WHERE originalPublisherID IS ?', (self._encodeID(originalPublisherID),))]
+
+    def removeItems(self, keys):
+        """ Delete several keys (and their values) at once, in a single
+        transaction """
+        self._cursor.execute('BEGIN')
         try:
-            self._cursor.execute("SELECT %s FROM data WHERE key=:reqKey" % columnName, {'reqKey': key.encode('hex')})
-            row = self._cursor.fetchone()
-            value = str(row[0])
-        except TypeError:
+            self._cursor.executemany('DELETE FROM data WHERE key=?', [(buffer(serializeKey(key)),) for key in keys])
+        except:
+            self._cursor.execute('ROLLBACK')
+            raise
+        self._cursor.execute('COMMIT')
+
+    _upsert = 'INSERT INTO data(key, value, lastPublished, originallyPublished, originalPublisherID) VALUES (?, ?, ?, ?, ?) ' \
+              'ON CONFLICT(key) DO UPDATE SET value=excluded.value, lastPublished=excluded.lastPublished, ' \
+              'originallyPublished=excluded.originallyPublished, originalPublisherID=excluded.originalPublisherID'
+
+    def _row(self, key, value, lastPublished, originallyPublished, originalPublisherID):
+        return (buffer(serializeKey(key)), buffer(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)), lastPublished, originallyPublished, self._encodeID(originalPublisherID))
+
+    def _fetch(self, key, columnName):
+        self._cursor.execute('SELECT %s FROM data WHERE key=?' % columnName, (buffer(serializeKey(key)),))
+        row = self._cursor.fetchone()
+        if row == None:
             raise KeyError, key
-        else:
-            if unpickle:
-                return pickle.loads(value)
-            else:
-                return value
+        return row[0]
+
+    @staticmethod
+    def _encodeID(nodeID):
+        # Node IDs are usually binary strings, which must be stored as BLOBs
+        if isinstance(nodeID, str):
+            return buffer(nodeID)
+        return nodeID
+
+    @staticmethod
+    def _decodeID(nodeID):
+        if isinstance(nodeID, buffer):
+            return str(nodeID)
+        return nodeID
+
+    def has_key(self, key):
+        self._cursor.execute('SELECT 1 FROM data WHERE key=?', (buffer(serializeKey(key)),))
+        return self._cursor.fetchone() != None
+
+    def __contains__(self, key):
+        return self.has_key(key)
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM data').fetchone()[0]
 
     def __getitem__(self, key):
-        return self._dbQuery(key, 'value', unpickle=True)
+        return pickle.loads(str(self._fetch(key, 'value')))
 
     def __delitem__(self, key):
-        self._cursor.execute("DELETE FROM data WHERE key=:reqKey", {'reqKey': key.encode('hex')})
+        self._cursor.execute('DELETE FROM data WHERE key=?', (buffer(serializeKey(key)),))
+        if self._cursor.rowcount == 0:
+            raise KeyError, key
+
+    def close(self):
+        """ Closes the database """
+        self._db.close()
+
+
+class _Compaction(object):
+    """ The state of an incremental C{LogDataStore} compaction """
+    def __init__(self, path, keys):
+        self.path = path
+        self.file = open(path, 'wb')
+        # The keys whose records still have to be rewritten
+        self.pending = keys
+        # The index of the new log (in the format of LogDataStore._index)
+        self.index = {}
+        self.size = 0
+
+
+class LogDataStore(DataStore):
+    """ A datastore that appends every change to a log file
+    
+    Each C{setItem()} and deletion is written as a single record at the end
+    of the log, so writes never seek or rewrite existing data. The metadata
+    and the log offset of every live value are kept in memory; values are
+    read from the log on demand. When a large part of the log consists of
+    overwritten or deleted records, C{compact()} rewrites the live records to
+    a new log, which then replaces the old one; this may be done in bounded
+    steps, between which the data store remains in use.
+    
+    On startup, the log is mapped into memory with C{mmap} and scanned to
+    rebuild the index. Records are checksummed, so an incomplete record left
+    at the end of the log by a crash is detected and discarded.
+    
+    Record format::
+        |  CRC32  |operation|key length|ID length|value length|lastPublished|originallyPublished|key|ID|value|
+        |(4 bytes)|(1 byte) |(2 bytes) |(2 bytes)| (4 bytes)  |  (8 bytes)  |     (8 bytes)     |   |  |     |
+    
+    The CRC32 covers everything after it; the key is serialized with
+    C{serializeKey()}, and the original publisher ID and the value are
+    pickled. Serialized keys are limited to C{maxKeySize} bytes by the
+    size of the key length field.
+    """
+    _crc = struct.Struct('>I')
+    _header = struct.Struct('>BHHIqq')
+    _SET = 1
+    _DELETE = 2
+    #: The log is not compacted before it reaches this size (in bytes)
+    minCompactionSize = 1024 * 1024
+    #: The largest serialized key a record can hold (in bytes)
+    maxKeySize = 0xffff
+    
+    def __init__(self, logFile, compactionRatio=0.5, sync=False):
+        """
+        @param logFile: The name of the log file; it is created if it does
+                        not exist
+        @type logFile: str
+        @param compactionRatio: The fraction of the log that must consist of
+                                dead records before C{compact()} rewrites it
+        @type compactionRatio: float
+        @param sync: If set to True, every write is flushed to disk with
+                     C{fsync()} before returning
+        @type sync: bool
+        """
+        self._path = logFile
+        self._compactionRatio = compactionRatio
+        self._sync = sync
+        # { <key>: (<valueOffset>, <valueLength>, <recordLength>, <lastPublished>, <originallyPublished>, <originalPublisherID>) }
+        self._index = {}
+        # { <originalPublisherID>: set(<key>, ...) }
+        self._publishers = {}
+        # Size of the log, and the part of it taken up by live records (in bytes)
+        self._size = 0
+        self._liveSize = 0
+        # The incremental compaction in progress, if any
+        self._compaction = None
+        self._recover()
+        self._file = open(self._path, 'a+b')
+    
+    def _recover(self):
+        """ Rebuilds the index from an existing log """
+        if not os.path.exists(self._path) or os.path.getsize(self._path) == 0:
+            return
+        logFile = open(self._path, 'r+b')
+        try:
+            log = mmap.mmap(logFile.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                offset = self._scan(log)
+            finally:
+                log.close()
+            if offset < os.path.getsize(self._path):
+                # Discard a record that was not completely written
+                logFile.truncate(offset)
+        finally:
+            logFile.close()
+    
+    def _scan(self, log):
+        """ Applies the records in the log to the index
+        
+        @return: The offset of the end of the last valid record
+        """
+        offset = 0
+        end = len(log)
+        prefixSize = self._crc.size + self._header.size
+        while offset + prefixSize <= end:
+            crc = self._crc.unpack_from(log, offset)[0]
+            operation, keyLength, idLength, valueLength, lastPublished, originallyPublished = \
+                self._header.unpack_from(log, offset + self._crc.size)
+            keyOffset = offset + prefixSize
+            valueOffset = keyOffset + keyLength + idLength
+            recordEnd = valueOffset + valueLength
+            if recordEnd > end or zlib.crc32(log[offset + self._crc.size:recordEnd]) & 0xffffffff != crc:
+                break
+            key = deserializeKey(log[keyOffset:keyOffset + keyLength])
+            self._discard(key)
+            if operation == self._SET:
+                originalPublisherID = pickle.loads(log[keyOffset + keyLength:valueOffset])
+                self._index[key] = (valueOffset, valueLength, recordEnd - offset, lastPublished, originallyPublished, originalPublisherID)
+                _indexPublisher(self._publishers, originalPublisherID, key)
+                self._liveSize += recordEnd - offset
+            offset = recordEnd
+        self._size = offset
+        return offset
+    
+    def _record(self, operation, key, value='', lastPublished=0, originallyPublished=0, originalPublisherID=''):
+        """ Builds a log record, from an already pickled value and ID
+        
+        @raise ValueError: The serialized key is larger than C{maxKeySize}
+        """
+        key = serializeKey(key)
+        if len(key) > self.maxKeySize:
+            raise ValueError('Key too large for the log: %d bytes serialized (at most %d)' % (len(key), self.maxKeySize))
+        body = self._header.pack(operation, len(key), len(originalPublisherID), len(value), lastPublished, originallyPublished) \
+               + key + originalPublisherID + value
+        return self._crc.pack(zlib.crc32(body) & 0xffffffff) + body
+    
+    def _append(self, records):
+        self._file.seek(0, 2)
+        self._file.write(''.join(records))
+        self._file.flush()
+        if self._sync:
+            os.fsync(self._file.fileno())
+    
+    def _setRecord(self, key, value, lastPublished, originallyPublished, originalPublisherID):
+        """ Builds the record for a C{setItem()}
+        
+        @return: The record, and the length of the value in it
+        @rtype: tuple
+        """
+        serializedID = pickle.dumps(originalPublisherID, pickle.HIGHEST_PROTOCOL)
+        serializedValue = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        record = self._record(self._SET, key, serializedValue, lastPublished, originallyPublished, serializedID)
+        return record, len(serializedValue)
+    
+    def _indexRecord(self, key, record, valueLength, lastPublished, originallyPublished, originalPublisherID):
+        """ Updates the index for a record built by C{_setRecord()}
+        (assuming that the record will be appended to the log) """
+        self._discard(key)
+        valueOffset = self._size + len(record) - valueLength
+        self._index[key] = (valueOffset, valueLength, len(record), lastPublished, originallyPublished, originalPublisherID)
+        _indexPublisher(self._publishers, originalPublisherID, key)
+        self._size += len(record)
+        self._liveSize += len(record)
+        if self._compaction != None:
+            # The new value must be rewritten as well
+            self._compaction.pending.append(key)
+    
+    def _discard(self, key):
+        """ Removes a key from the index, and accounts for its record as dead """
+        entry = self._index.pop(key, None)
+        if entry != None:
+            self._liveSize -= entry[2]
+            _unindexPublisher(self._publishers, entry[5], key)
+            if self._compaction != None:
+                # Any record already rewritten for the key is out of date
+                self._compaction.index.pop(key, None)
+    
+    def _readValue(self, entry):
+        self._file.seek(entry[0])
+        return self._file.read(entry[1])
+    
+    def keys(self):
+        """ Return a list of the keys in this data store """
+        return self._index.keys()
+
+    def lastPublished(self, key):
+        """ Get the time the C{(key, value)} pair identified by C{key}
+        was last published """
+        return self._index[key][3]
+
+    def originalPublisherID(self, key):
+        """ Get the original publisher of the data's node ID
+        
+        @param key: The key that identifies the stored data
+        @type key: str
+        
+        @return: Return the node ID of the original publisher of the
+        C{(key, value)} pair identified by C{key}.
+        """
+        return self._index[key][5]
+
+    def originalPublishTime(self, key):
+        """ Get the time the C{(key, value)} pair identified by C{key}
+        was originally published """
+        return self._index[key][4]
+
+    def getRecord(self, key):
+        """ Get the value identified by C{key} together with its metadata """
+        entry = self._index[key]
+        return (pickle.loads(self._readValue(entry)), entry[3], entry[4], entry[5])
+
+    def setItem(self, key, value, lastPublished, originallyPublished, originalPublisherID):
+        """ Set the value of the (key, value) pair identified by C{key}
+        
+        @raise ValueError: The serialized key is larger than C{maxKeySize}
+        """
+        record, valueLength = self._setRecord(key, value, lastPublished, originallyPublished, originalPublisherID)
+        self._indexRecord(key, record, valueLength, lastPublished, originallyPublished, originalPublisherID)
+        self._append([record])
+
+    def setItems(self, items):
+        """ Set several C{(key, value)} pairs at once, with a single write
+        
+        @param items: A sequence of C{(key, value, lastPublished,
+                      originallyPublished, originalPublisherID)} tuples
+        
+        @raise ValueError: A serialized key is larger than C{maxKeySize};
+                           none of the items are written
+        """
+        items = list(items)
+        # Every record is built before the index is updated, so that an
+        # invalid item leaves the data store unchanged
+        records = [self._setRecord(*item) for item in items]
+        for (key, value, lastPublished, originallyPublished, originalPublisherID), (record, valueLength) in zip(items, records):
+            self._indexRecord(key, record, valueLength, lastPublished, originallyPublished, originalPublisherID)
+        self._append([record for record, valueLength in records])
+
+    def compact(self, force=False, maxBytes=None):
+        """ Rewrites the live records to a new log, if at least
+        C{compactionRatio} of the log consists of dead records (or if
+        C{force} is set)
+        
+        @param maxBytes: If specified, the compaction is incremental: at most
+                         (about) this many bytes of records are rewritten by
+                         each call, and the data store may be changed between
+                         the calls. The new log replaces the old one in the
+                         call that completes the compaction.
+        @type maxBytes: int
+        
+        @return: True if the log was compacted (by this call)
+        @rtype: bool
+        """
+        if self._compaction == None:
+            deadSize = self._size - self._liveSize
+            if not force and (self._size < self.minCompactionSize or deadSize < self._size * self._compactionRatio):
+                return False
+            self._compaction = _Compaction(self._path + '.compact', self._index.keys())
+        compaction = self._compaction
+        written = 0
+        try:
+            while len(compaction.pending) > 0 and (maxBytes == None or written < maxBytes):
+                key = compaction.pending.pop()
+                entry = self._index.get(key)
+                if entry == None or key in compaction.index:
+                    continue
+                serializedValue = self._readValue(entry)
+                record = self._record(self._SET, key, serializedValue, entry[3], entry[4],
+                                      pickle.dumps(entry[5], pickle.HIGHEST_PROTOCOL))
+                compaction.file.write(record)
+                compaction.index[key] = (compaction.size + len(record) - len(serializedValue),) + entry[1:2] + (len(record),) + entry[3:]
+                compaction.size += len(record)
+                written += len(record)
+            if len(compaction.pending) > 0:
+                return False
+            compaction.file.flush()
+            os.fsync(compaction.file.fileno())
+        except:
+            self._abortCompaction()
+            raise
+        # Every live key has been rewritten with its current value
+        self._compaction = None
+        compaction.file.close()
+        self._file.close()
+        os.rename(compaction.path, self._path)
+        self._file = open(self._path, 'a+b')
+        self._index = compaction.index
+        self._size = compaction.size
+        self._liveSize = sum([entry[2] for entry in compaction.index.itervalues()])
+        return True
+
+    def compactionPending(self):
+        return self._compaction != None
+
+    def _abortCompaction(self):
+        """ Discards the new log of an incremental compaction """
+        compaction = self._compaction
+        self._compaction = None
+        compaction.file.close()
+        os.remove(compaction.path)
+
+    def publisherKeys(self, originalPublisherID):
+        """ Return a list of the keys of the values published by the node
+        with the specified ID """
+        return list(self._publishers.get(originalPublisherID, ()))
+
+    def removeItems(self, keys):
+        """ Delete several keys (and their values) at once, with a single
+        write """
+        records = []
+        for key in keys:
+            if key in self._index:
+                self._discard(key)
+                record = self._record(self._DELETE, key)
+                self._size += len(record)
+                records.append(record)
+        self._append(records)
+
+    def has_key(self, key):
+        return key in self._index
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getitem__(self, key):
+        """ Get the value identified by C{key} """
+        return pickle.loads(self._readValue(self._index[key]))
+
+    def __delitem__(self, key):
+        """ Delete the specified key (and its value) """
+        if key not in self._index:
+            raise KeyError, key
+        self._discard(key)
+        record = self._record(self._DELETE, key)
+        self._size += len(record)
+        self._append([record])
+
+    def close(self):
+        """ Closes the log file, abandoning any compaction in progress """
+        if self._compaction != None:
+            self._abortCompaction()
+        self._file.close()
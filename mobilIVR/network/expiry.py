@@ -0,0 +1,118 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2009 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+#    http://epydoc.sf.net                                                    #
+
+
+"""
+@author: Bryan McAlister
+
+Provides the lease expiry scheduler used by the Static Tuple Space
+"""
+
+#!/usr/bin/env python
+
+import heapq
+
+
+class ExpiryScheduler(object):
+    """ Expires items (such as tuple leases) at their deadlines
+
+    Deadlines are kept in a heap, and only a single timer is ever pending on
+    the reactor: the one for the earliest deadline. Scheduling an item is
+    O(log n) regardless of the number of items.
+
+    Renewing an item does not search the heap for its previous entry; the
+    new deadline is pushed, and the stale entry is discarded once it reaches
+    the top of the heap.
+    """
+    def __init__(self, expire, clock):
+        """
+        @param expire: Called with an item once its deadline has passed
+        @type expire: callable
+        @param clock: The reactor (or a C{twisted.internet.task.Clock}) used
+                      to time the deadlines
+        """
+        self._expire = expire
+        self._clock = clock
+        # [(<deadline>, <item>), ...]
+        self._heap = []
+        # The current deadline of every scheduled item: { <item>: <deadline> }
+        self._deadlines = {}
+        self._timer = None
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, item):
+        return item in self._deadlines
+
+    def schedule(self, item, timeout):
+        """ Expires an item C{timeout} seconds from now, replacing any
+        deadline already set for it """
+        deadline = self._clock.seconds() + timeout
+        self._deadlines[item] = deadline
+        heapq.heappush(self._heap, (deadline, item))
+        self._resetTimer()
+
+    def cancel(self, item):
+        """ Stops an item from expiring (if it is scheduled) """
+        if self._deadlines.pop(item, None) != None:
+            self._resetTimer()
+
+    def deadline(self, item):
+        """ Returns the deadline of an item, or None if it is not scheduled """
+        return self._deadlines.get(item)
+
+    def _resetTimer(self):
+        """ Makes sure the pending timer fires at the earliest deadline """
+        # Drop stale entries (of renewed or cancelled items) from the top
+        while len(self._heap) > 0 and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if len(self._heap) == 0:
+            if self._timer != None and self._timer.active():
+                self._timer.cancel()
+            self._timer = None
+            return
+        deadline = self._heap[0][0]
+        if self._timer != None and self._timer.active():
+            if self._timer.getTime() == deadline:
+                return
+            self._timer.cancel()
+        self._timer = self._clock.callLater(max(0, deadline - self._clock.seconds()), self._expireDue)
+
+    def _expireDue(self):
+        self._timer = None
+        now = self._clock.seconds()
+        while len(self._heap) > 0 and self._heap[0][0] <= now:
+            deadline, item = heapq.heappop(self._heap)
+            if self._deadlines.get(item) == deadline:
+                del self._deadlines[item]
+                self._expire(item)
+        self._resetTimer()
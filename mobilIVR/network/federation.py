@@ -0,0 +1,388 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2009 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+#    http://epydoc.sf.net                                                    #
+
+
+"""
+@author: Bryan McAlister
+
+Provides the federation of sites (regional clusters) of Static Tuple Space
+peers, through their super-nodes
+"""
+
+#!/usr/bin/env python
+
+from twisted.internet import defer
+from twisted.internet.defer import inlineCallbacks, returnValue
+import twisted.internet.reactor
+
+from rpc import protocol
+from rpc.protocol import rpcmethod
+from contacttable import ContactTable
+from bloom import groupMatches, groupFromKey
+from wireformat import DataFormatError, encodeTuple, decodeTuple, encodeTemplate, decodeTemplate
+
+
+class Federation(object):
+    """ The inter-site side of the super-node of a site
+
+    In hierarchy mode, the peers of a site form a static tuple space of
+    their own, and only the super-node of each site communicates with the
+    other sites, on a separate UDP port: it publishes the aggregated
+    capacity of its site (the number of tuples per group and arity) to the
+    super-nodes of the other sites, and forwards the claims of its site's
+    peers to the sites that have matching tuples. Inter-site traffic
+    therefore grows with the number of sites, not the number of peers.
+
+    This object acts as the node of its own network protocol, with a
+    contact table holding only the super-nodes of the other sites.
+    """
+    def __init__(self, peer, port, networkProtocol=None):
+        """
+        @param peer: The super-node
+        @type peer: StaticTupleSpacePeer
+        @param port: The UDP port of the federation
+        @type port: int
+        @param networkProtocol: The network protocol of the federation;
+                                defaults to a C{KademliaProtocol}, which
+                                listens on C{port} once the federation is
+                                started
+        """
+        self._peer = peer
+        self.id = peer.id
+        self.site = peer.site
+        self.port = port
+        self.contacts = ContactTable()
+        if networkProtocol == None:
+            self._protocol = protocol.KademliaProtocol(self)
+            self._listen = True
+        else:
+            self._protocol = networkProtocol
+            self._listen = False
+        self._listeningPort = None
+        self._knownAddresses = []
+        # The super-node and capacity of every other site known:
+        # { <siteID>: [<contactID>, { (<group>, <arity>): <copies> }] }
+        self._sites = {}
+        # The last capacity summary of this site, and the version of it each
+        # other super-node has been sent: { <contactID>: <version> }
+        self._summary = None
+        self._summaryVersion = 0
+        self._sentVersions = {}
+        # The sites that granted the claims forwarded by this super-node, and
+        # the peers of this site the tuples were claimed for:
+        # { (<ownerID>, <tuple>): [(<siteID>, <claimantID>), ...] }
+        self._claims = {}
+
+    def start(self, knownAddresses=None):
+        """ Starts listening for the other super-nodes, and introduces this
+        super-node to the specified ones
+
+        @param knownAddresses: The addresses of super-nodes of other sites, as
+                               C{(<ip address>, <udp port>)} tuples
+        @type knownAddresses: list
+        """
+        if self._listen and self._listeningPort == None:
+            self._listeningPort = twisted.internet.reactor.listenUDP(self.port, self._protocol) #IGNORE:E1101
+        self._knownAddresses = list(knownAddresses or [])
+        return self.publishSummary()
+
+    def stop(self):
+        """ Stops listening, when this peer is no longer the super-node """
+        if self._listeningPort != None:
+            self._listeningPort.stopListening()
+            self._listeningPort = None
+
+    def internContact(self, contactID, address, port):
+        """ Used by the network protocol for every received message """
+        return self.contacts.intern(contactID, address, port, self._protocol)
+
+    def removeContact(self, contactID):
+        """ Called when a super-node fails to respond to an RPC; its site is
+        forgotten once it is removed from the contact table """
+        if self.contacts.contactFailed(contactID):
+            self._forgetContact(contactID)
+
+    def sites(self):
+        """ Returns the IDs of the other sites known
+
+        @rtype: list
+        """
+        return self._sites.keys()
+
+    def capacity(self, template, siteID=None):
+        """ Returns the number of tuples possibly matching a template that
+        the other sites (or a single one) published
+
+        @rtype: int
+        """
+        total = 0
+        for site, (contactID, summary) in self._sites.iteritems():
+            if siteID == None or site == siteID:
+                total += self._matchingCopies(summary, template)
+        return total
+
+    def publishSummary(self):
+        """ Sends the capacity summary of this site to the super-nodes of the
+        other sites (and the known super-node addresses), if it changed
+        since they were last sent it
+
+        The responses carry their own sites' summaries, and the super-nodes
+        they know, so that every super-node learns of every site.
+
+        @rtype: twisted.internet.defer.Deferred
+        """
+        summary = self._peer._siteSummary()
+        if summary != self._summary:
+            self._summary = summary
+            self._summaryVersion += 1
+        dfs = []
+        contacts = list(self.contacts)
+        knownAddresses = set([(contact.address, contact.port) for contact in contacts])
+        for address, port in self._knownAddresses:
+            if (address, port) not in knownAddresses:
+                contacts.append(protocol.Contact(self._peer._generateID(), address, port, self._protocol))
+        for contact in contacts:
+            if self._sentVersions.get(contact.id) == self._summaryVersion:
+                # Only the known sites are sent, as a heartbeat
+                df = contact.exchangeSummaries(self.site, None, self._siteList(), rawResponse=True)
+            else:
+                df = contact.exchangeSummaries(self.site, self._summary, self._siteList(), rawResponse=True)
+            df.addCallback(self._summariesExchanged, self._summaryVersion)
+            dfs.append(df)
+        return defer.DeferredList(dfs, consumeErrors=True)
+
+    @rpcmethod
+    def exchangeSummaries(self, siteID, summary, sites, _rpcNodeID=None, _rpcNodeContact=None):
+        """ Used by the super-nodes of other sites via RPC to publish their
+            sites' capacity, and learn that of this site
+
+            @param siteID: The calling super-node's site
+            @param summary: The capacity summary of its site, as a list of
+                            C{[<group key>, <arity>, <copies>]} entries (see
+                            C{bloom.groupKey()}), or C{None} if it has not
+                            changed since it was last sent
+            @param sites: The super-nodes the caller knows, as
+                          C{[<siteID>, <nodeID>, <ip address>, <udp port>]}
+                          entries
+
+            @return: C{[<siteID>, <summary>, <sites>]} for this super-node
+            @rtype: list
+        """
+        if _rpcNodeContact != None:
+            self.internContact(_rpcNodeID, _rpcNodeContact.address, _rpcNodeContact.port)
+            self._updateSite(siteID, _rpcNodeID, summary)
+        self._learnSites(sites)
+        return [self.site, self._summary, self._siteList()]
+
+    @inlineCallbacks
+    def claim(self, template, claimantID=None):
+        """ Claims a tuple matching a template from the other sites, trying
+        the sites with the most matching tuples first
+
+        @param claimantID: The peer of this site the tuple is claimed for;
+                           defaults to the super-node itself
+        @type claimantID: str
+
+        @return: The claimed tuple, or None if no site granted a claim
+        @rtype: twisted.internet.defer.Deferred
+        """
+        candidates = []
+        for siteID, (contactID, summary) in self._sites.items():
+            copies = self._matchingCopies(summary, template)
+            if copies > 0:
+                candidates.append((copies, siteID, contactID))
+        candidates.sort(reverse=True)
+        wireTemplate = encodeTemplate(template)
+        for copies, siteID, contactID in candidates:
+            contact = self.contacts.get(contactID)
+            if contact == None:
+                continue
+            try:
+                sTuple = yield contact.siteClaim(wireTemplate)
+            except protocol.TimeoutError:
+                continue
+            if sTuple != None:
+                try:
+                    sTuple = decodeTuple(sTuple)
+                except DataFormatError:
+                    continue
+                self._claims.setdefault(self._peer._tupleKey(sTuple), []).append((siteID, claimantID or self.id))
+                returnValue(sTuple)
+        returnValue(None)
+
+    def release(self, sTuple, claimantID=None):
+        """ Releases a tuple claimed by C{claim()} back to the site it was
+        claimed from
+
+        @param claimantID: The peer of this site the tuple was claimed for;
+                           defaults to the super-node itself
+        @type claimantID: str
+
+        @return: Deferred, which fires once the site has released it, or
+                 None if the tuple was not claimed from another site for
+                 this peer
+        """
+        claimantID = claimantID or self.id
+        key = self._peer._tupleKey(sTuple)
+        claims = self._claims.get(key, [])
+        siteIDs = [siteID for siteID, claimant in claims if claimant == claimantID]
+        if len(siteIDs) == 0:
+            return None
+        claims.remove((siteIDs[-1], claimantID))
+        if len(claims) == 0:
+            del self._claims[key]
+        site = self._sites.get(siteIDs[-1])
+        contact = site and self.contacts.get(site[0])
+        if contact == None:
+            return None
+        df = contact.siteRelease(encodeTuple(sTuple))
+        df.addErrback(lambda error: None)
+        return df
+
+    def releaseClaims(self, claimantID):
+        """ Releases all of the tuples claimed from the other sites for a peer
+        of this site, e.g. when it has failed
+
+        @rtype: twisted.internet.defer.Deferred
+        """
+        dfs = []
+        for key, claims in self._claims.items():
+            for siteID, claimant in list(claims):
+                if claimant == claimantID:
+                    df = self.release(key[1], claimantID)
+                    if df != None:
+                        dfs.append(df)
+        return defer.DeferredList(dfs, consumeErrors=True)
+
+    def hasClaims(self, claimantID):
+        """ Returns whether tuples have been claimed from the other sites for
+        a peer of this site (and not released yet)
+
+        @rtype: bool
+        """
+        for claims in self._claims.itervalues():
+            for siteID, claimant in claims:
+                if claimant == claimantID:
+                    return True
+        return False
+
+    @rpcmethod
+    def siteClaim(self, template, _rpcNodeID=None, _rpcNodeContact=None):
+        """ Used by the super-nodes of other sites via RPC to claim a tuple
+            of this site on behalf of one of their peers
+            
+            @param template: The template, in the wire format
+            
+            @return: Deferred, which fires with the claimed tuple (in the
+                     wire format), or None
+        """
+        df = self._peer.claimTuple(decodeTemplate(template))
+        df.addCallback(lambda sTuple: sTuple != None and encodeTuple(sTuple) or None)
+        return df
+
+    @rpcmethod
+    def siteRelease(self, sTuple, _rpcNodeID=None, _rpcNodeContact=None):
+        """ Used by the super-nodes of other sites via RPC to release a tuple
+            they claimed from this site
+            
+            @param sTuple: The tuple, in the wire format
+        """
+        return self._peer.releaseTuple(decodeTuple(sTuple))
+
+    def _summariesExchanged(self, responseTuple, version):
+        responseMsg = responseTuple[0]
+        if isinstance(responseMsg.response, list):
+            siteID, summary, sites = responseMsg.response
+            address, port = responseTuple[1]
+            self.internContact(responseMsg.nodeID, address, port)
+            self._sentVersions[responseMsg.nodeID] = version
+            self._updateSite(siteID, responseMsg.nodeID, summary)
+            self._learnSites(sites)
+
+    def _updateSite(self, siteID, contactID, summary):
+        if siteID == self.site:
+            return
+        site = self._sites.get(siteID)
+        if site != None and site[0] != contactID:
+            # The site elected another super-node
+            self._forgetContact(site[0])
+            site = None
+        if site == None:
+            site = self._sites[siteID] = [contactID, {}]
+        if isinstance(summary, list):
+            site[1] = self._capacity(summary)
+
+    def _learnSites(self, sites):
+        for siteID, nodeID, address, port in sites:
+            if siteID != self.site and nodeID != self.id and siteID not in self._sites:
+                self.internContact(nodeID, address, port)
+                self._sites[siteID] = [nodeID, {}]
+
+    def _forgetContact(self, contactID):
+        self.contacts.remove(contactID)
+        self._sentVersions.pop(contactID, None)
+        for siteID, site in self._sites.items():
+            if site[0] == contactID:
+                del self._sites[siteID]
+
+    def _siteList(self):
+        sites = []
+        for siteID, (contactID, summary) in self._sites.iteritems():
+            contact = self.contacts.get(contactID)
+            if contact != None:
+                sites.append([siteID, contactID, contact.address, contact.port])
+        return sites
+
+    @staticmethod
+    def _capacity(summary):
+        """ Recreates the groups of a capacity summary received from another
+        site; malformed entries are skipped """
+        capacity = {}
+        for entry in summary:
+            if not isinstance(entry, list) or len(entry) != 3:
+                continue
+            key, arity, copies = entry
+            if type(arity) not in (int, long) or type(copies) not in (int, long) or copies <= 0:
+                continue
+            try:
+                group = groupFromKey(key)
+            except DataFormatError:
+                continue
+            capacity[(group, arity)] = copies
+        return capacity
+
+    @staticmethod
+    def _matchingCopies(summary, template):
+        copies = 0
+        for (group, arity), count in summary.iteritems():
+            if arity == len(template) and groupMatches(template, group):
+                copies += count
+        return copies
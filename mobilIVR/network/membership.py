@@ -0,0 +1,340 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2009 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+#    http://epydoc.sf.net                                                    #
+
+
+"""
+@author: Bryan McAlister
+
+Provides the SWIM-style membership and failure detection of a Static Tuple
+Space peer
+"""
+
+#!/usr/bin/env python
+
+import math
+import random
+
+from twisted.internet import defer
+
+from rpc import constants
+from expiry import ExpiryScheduler
+
+#: Member states, in the order in which they override each other at the same
+#: incarnation number
+ALIVE, SUSPECT, DEAD = range(3)
+
+
+class Membership(object):
+    """ Detects failed peers, and disseminates membership changes
+
+    Once every C{constants.probeInterval} seconds, the next contact in a
+    randomly ordered round of all contacts is pinged. If it does not answer,
+    C{constants.indirectProbes} other contacts are asked to ping it on this
+    peer's behalf; if none of them reaches it either, it is suspected. A
+    suspected peer that does not refute the suspicion within the suspicion
+    timeout is declared dead. Every contact is probed once per round, so a
+    failed peer is detected within two rounds plus the suspicion timeout,
+    while each peer sends a constant number of probes per interval.
+
+    Membership changes are not sent in messages of their own: a few of the
+    most recent ones are piggybacked on every RPC message the peer sends
+    (see C{piggyback()}), and each one is retransmitted a number of times
+    that grows with the logarithm of the network size, so that it reaches
+    every peer with high probability (infection-style dissemination).
+
+    A peer refutes a suspicion (or a declaration of its death) that reaches
+    it by incrementing its incarnation number and disseminating that it is
+    alive; updates with a higher incarnation number override older ones.
+
+    Members are the contacts in the peer's contact table; only peers whose
+    state has changed have an entry in the member table. Dead peers are
+    forgotten after C{constants.deadMemberRetention} seconds.
+    """
+    def __init__(self, node, memberFailed, clock):
+        """
+        @param node: The peer, which provides the contact table
+                     (C{node.contacts}) and C{node.internContact()}
+        @param memberFailed: Called with the node ID of every peer declared
+                             dead
+        @type memberFailed: callable
+        @param clock: The reactor (or a C{twisted.internet.task.Clock}) used
+                      to time probes and suspicions
+        """
+        self._node = node
+        self._memberFailed = memberFailed
+        self._clock = clock
+        self.incarnation = 0
+        # The state of every peer known to have been suspected or declared
+        # dead, or that refuted it: { <nodeID>: [<state>, <incarnation>] }
+        self._members = {}
+        # Suspected peers are declared dead when their suspicion times out
+        self._suspicions = ExpiryScheduler(self._suspicionExpired, clock)
+        # Dead peers are removed from the member table after a while
+        self._departures = ExpiryScheduler(self._forgetMember, clock)
+        # Updates to disseminate, and how many more times each one is sent:
+        # { <nodeID>: [<update>, <transmissions left>] }
+        self._updates = {}
+        # The node IDs of the contacts still to probe in the current round
+        self._round = []
+        self._probing = False
+        self._probeCall = None
+
+    def start(self):
+        """ Starts probing the contacts periodically """
+        if self._probeCall == None:
+            self._probeCall = self._clock.callLater(constants.probeInterval, self._probePeriod)
+
+    def stop(self):
+        """ Stops probing the contacts """
+        if self._probeCall != None and self._probeCall.active():
+            self._probeCall.cancel()
+        self._probeCall = None
+        for nodeID in self._members.keys():
+            self._suspicions.cancel(nodeID)
+            self._departures.cancel(nodeID)
+
+    def state(self, nodeID):
+        """ Returns the state of a peer: C{ALIVE}, C{SUSPECT} or C{DEAD} """
+        member = self._members.get(nodeID)
+        if member == None:
+            return ALIVE
+        return member[0]
+
+    def isSuspect(self, nodeID):
+        return self.state(nodeID) == SUSPECT
+
+    def isDead(self, nodeID):
+        return self.state(nodeID) == DEAD
+
+    def probe(self):
+        """ Probes the next contact of the current round
+
+        @return: Deferred, which fires with the node ID of the contact and
+                 whether it (directly or indirectly) answered, or with
+                 C{None} if there is no contact to probe
+        @rtype: twisted.internet.defer.Deferred
+        """
+        contact = self._nextTarget()
+        if contact == None:
+            return defer.succeed(None)
+        self._probing = True
+        df = contact.ping()
+        df.addCallbacks(lambda result: True, lambda error: self._probeIndirectly(contact))
+        df.addCallback(self._probed, contact)
+        return df
+
+    def pingRequested(self, targetID):
+        """ Pings a peer on behalf of another peer that could not reach it
+
+        The ping is abandoned after C{constants.indirectProbeTimeout}
+        seconds, so that the requesting peer gets an answer before its own
+        RPC times out.
+
+        @return: Deferred, which fires with whether the peer answered
+        @rtype: twisted.internet.defer.Deferred
+        """
+        contact = self._node.contacts.get(targetID)
+        if contact == None:
+            return defer.succeed(False)
+        df = contact.ping()
+        timeoutCall = self._clock.callLater(constants.indirectProbeTimeout, df.cancel)
+        def answered(result):
+            if timeoutCall.active():
+                timeoutCall.cancel()
+            return result
+        df.addCallbacks(lambda result: True, lambda error: False)
+        df.addCallback(answered)
+        return df
+
+    def piggyback(self):
+        """ Returns the membership updates to attach to an outgoing message
+
+        At most C{constants.piggybackSize} updates are returned, those sent
+        the fewest times first.
+
+        @return: A list of C{[<state>, <nodeID>, <address>, <port>,
+                 <incarnation>]} updates
+        @rtype: list
+        """
+        if len(self._updates) == 0:
+            return []
+        entries = sorted(self._updates.itervalues(), key=lambda entry: -entry[1])[:constants.piggybackSize]
+        updates = []
+        for entry in entries:
+            updates.append(entry[0])
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._updates[entry[0][1]]
+        return updates
+
+    def received(self, senderID, updates, address=None):
+        """ Processes a message received from a peer
+
+        @param senderID: The node ID of the peer that sent the message
+        @param updates: The membership updates piggybacked on the message
+        @type updates: list
+        @param address: The address the message was sent from, as
+                        C{(<ip address>, <udp port>)}; used to tell a peer
+                        declared dead (and no longer a contact) of it
+        @type address: tuple
+        """
+        for update in updates:
+            self._applyUpdate(*update)
+        member = self._members.get(senderID)
+        if member != None and member[0] != ALIVE and senderID not in self._updates:
+            # The peer is evidently running; tell it what it is suspected of
+            # (or was declared), so that it refutes it
+            contact = self._node.contacts.get(senderID)
+            if contact != None:
+                self._disseminate(member[0], senderID, contact.address, contact.port, member[1])
+            elif address != None:
+                self._disseminate(member[0], senderID, address[0], address[1], member[1])
+
+    def _probePeriod(self):
+        self._probeCall = self._clock.callLater(constants.probeInterval, self._probePeriod)
+        # A probe outlasting a period is not overlapped by the next one
+        if not self._probing:
+            self.probe()
+
+    def _nextTarget(self):
+        """ Returns the next contact to probe, starting a new round (in a new
+        random order) once every contact has been probed """
+        for attempt in range(2):
+            while len(self._round) > 0:
+                contact = self._node.contacts.get(self._round.pop())
+                if contact != None and self.state(contact.id) != DEAD:
+                    return contact
+            if attempt == 0:
+                self._round = [contact.id for contact in self._node.contacts]
+                random.shuffle(self._round)
+
+    def _probeIndirectly(self, target):
+        helpers = [contact for contact in self._node.contacts
+                   if contact.id != target.id and self.state(contact.id) == ALIVE]
+        helpers = random.sample(helpers, min(constants.indirectProbes, len(helpers)))
+        if len(helpers) == 0:
+            return False
+        results = []
+        for contact in helpers:
+            df = contact.pingRequest(target.id)
+            df.addErrback(lambda error: False)
+            results.append(df)
+        df = defer.DeferredList(results)
+        df.addCallback(lambda results: True in [answered for success, answered in results])
+        return df
+
+    def _probed(self, answered, target):
+        self._probing = False
+        if answered:
+            if self.state(target.id) == SUSPECT:
+                # Another peer's suspicion cannot be refuted on the target's
+                # behalf; ask the target to do so
+                self._disseminate(SUSPECT, target.id, target.address, target.port, self._members[target.id][1])
+        elif self.state(target.id) == ALIVE:
+            member = self._members.get(target.id)
+            if member == None:
+                incarnation = 0
+            else:
+                incarnation = member[1]
+            self._applyUpdate(SUSPECT, target.id, target.address, target.port, incarnation)
+        return (target.id, answered)
+
+    def _applyUpdate(self, state, nodeID, address, port, incarnation):
+        """ Applies a membership update, and disseminates it further if it
+        is news to this peer """
+        if nodeID == self._node.id:
+            if state != ALIVE and incarnation >= self.incarnation:
+                # Refute the suspicion
+                self.incarnation = incarnation + 1
+                self._disseminate(ALIVE, nodeID, address, port, self.incarnation)
+            return
+        member = self._members.get(nodeID)
+        if member == None:
+            if nodeID not in self._node.contacts:
+                if state != ALIVE:
+                    # Nothing to remove, and nothing to learn
+                    return
+                self._node.internContact(nodeID, address, port)
+            currentState, currentIncarnation = ALIVE, 0
+        else:
+            currentState, currentIncarnation = member
+        if state == ALIVE:
+            if incarnation <= currentIncarnation:
+                return
+        elif state == SUSPECT:
+            if currentState == DEAD or incarnation < currentIncarnation or \
+                (incarnation == currentIncarnation and currentState == SUSPECT):
+                return
+        elif currentState == DEAD or incarnation < currentIncarnation:
+            return
+        self._members[nodeID] = [state, incarnation]
+        if state == ALIVE:
+            self._suspicions.cancel(nodeID)
+            if currentState == DEAD:
+                # The peer has rejoined
+                self._departures.cancel(nodeID)
+                self._node.internContact(nodeID, address, port)
+        elif state == SUSPECT:
+            self._suspicions.schedule(nodeID, self._suspicionTimeout())
+        else:
+            self._suspicions.cancel(nodeID)
+            self._departures.schedule(nodeID, constants.deadMemberRetention)
+            self._memberFailed(nodeID)
+        self._disseminate(state, nodeID, address, port, incarnation)
+
+    def _suspicionExpired(self, nodeID):
+        member = self._members.get(nodeID)
+        if member != None and member[0] == SUSPECT:
+            contact = self._node.contacts.get(nodeID)
+            if contact != None:
+                address, port = contact.address, contact.port
+            else:
+                address, port = '', 0
+            self._applyUpdate(DEAD, nodeID, address, port, member[1])
+
+    def _forgetMember(self, nodeID):
+        member = self._members.get(nodeID)
+        if member != None and member[0] == DEAD:
+            del self._members[nodeID]
+
+    def _disseminate(self, state, nodeID, address, port, incarnation):
+        """ Queues an update to be piggybacked on outgoing messages,
+        replacing any older update about the same peer """
+        self._updates[nodeID] = [[state, nodeID, address, port, incarnation], self._retransmissions()]
+
+    def _retransmissions(self):
+        """ The number of times each update is sent """
+        return constants.retransmitMultiplier * int(math.ceil(math.log10(len(self._node.contacts) + 2)))
+
+    def _suspicionTimeout(self):
+        """ The time a suspected peer has to refute the suspicion, which
+        grows with the time an update needs to reach every peer """
+        return constants.suspicionMultiplier * math.log10(len(self._node.contacts) + 2) * constants.probeInterval
@@ -0,0 +1,125 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2009 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+#    http://epydoc.sf.net                                                    #
+
+"""
+@author: Bryan McAlister
+
+Provides the k-bucket routing table used by Static Tuple Space peers in
+partitioned mode
+"""
+
+#!/usr/bin/env python
+
+from rpc import constants
+from contacttable import ContactTable, distance
+
+
+class RoutingTable(ContactTable):
+    """ A contact table organised in k-buckets, as in Kademlia
+
+    Contacts are grouped by the bit length of their XOR distance to the
+    parent node; each bucket holds at most C{k} contacts, ordered from the
+    least to the most recently seen. A contact that does not fit in a full
+    bucket only replaces the bucket's least recently seen contact if that
+    contact has failed to respond; otherwise it is kept as a replacement, to
+    be promoted when a contact is removed. The table thus holds
+    C{O(k log n)} contacts for a network of C{n} nodes, favouring
+    long-lived nodes.
+    """
+    def __init__(self, parentNodeID, k=None):
+        ContactTable.__init__(self)
+        self._parentNodeID = parentNodeID
+        if k == None:
+            k = constants.k
+        self._k = k
+        # { <bucket index>: [<contactID>, ...] }
+        self._buckets = {}
+        # { <bucket index>: [<Contact>, ...] }, least recently seen first
+        self._replacements = {}
+
+    def remove(self, contactID):
+        """ Removes a contact from the table (if present), and promotes the
+            most recently seen replacement contact of its bucket """
+        index = self._bucketIndex(contactID)
+        contact = self._contacts.pop(contactID, None)
+        replacements = self._replacements.get(index, [])
+        if contact == None:
+            for replacement in replacements:
+                if replacement.id == contactID:
+                    replacements.remove(replacement)
+                    break
+        else:
+            bucket = self._buckets[index]
+            bucket.remove(contactID)
+            if len(replacements) > 0:
+                replacement = replacements.pop()
+                bucket.append(replacement.id)
+                self._contacts[replacement.id] = replacement
+            if len(bucket) == 0:
+                del self._buckets[index]
+        if len(replacements) == 0:
+            self._replacements.pop(index, None)
+
+    def bucket(self, contactID):
+        """ Returns the node IDs in the bucket that a node ID belongs to
+
+        @rtype: list
+        """
+        return list(self._buckets.get(self._bucketIndex(contactID), []))
+
+    def _bucketIndex(self, contactID):
+        return distance(self._parentNodeID, contactID).bit_length()
+
+    def _insert(self, contact):
+        index = self._bucketIndex(contact.id)
+        bucket = self._buckets.setdefault(index, [])
+        if len(bucket) < self._k:
+            bucket.append(contact.id)
+            self._contacts[contact.id] = contact
+            return
+        replacements = self._replacements.setdefault(index, [])
+        for replacement in replacements:
+            if replacement.id == contact.id:
+                replacements.remove(replacement)
+                break
+        replacements.append(contact)
+        if len(replacements) > self._k:
+            del replacements[0]
+        leastRecentlySeen = self._contacts[bucket[0]]
+        if leastRecentlySeen.failures > 0:
+            # Removing it promotes the new contact
+            self.remove(leastRecentlySeen.id)
+
+    def _touch(self, contact):
+        bucket = self._buckets.get(self._bucketIndex(contact.id))
+        if bucket != None and contact.id in bucket:
+            bucket.remove(contact.id)
+            bucket.append(contact.id)
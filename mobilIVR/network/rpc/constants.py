@@ -44,3 +44,90 @@ rpcTimeout = 0.5
 #: Max size of a single UDP datagram, in bytes. If a message is larger than this, it will
 #: be spread accross several UDP packets.
 udpDatagramMaxSize = 8192 # 8 KB
+
+#: Interval (in seconds) between anti-entropy passes, in which a peer synchronises
+#: the tuples it replicated from other peers
+refreshInterval = 60
+
+#: Amount of data (in bytes) a peer's data store rewrites in each step of a compaction;
+#: the reactor handles other events between the steps
+compactionStepSize = 256 * 1024
+
+#: Number of changes to its own tuples that a peer remembers; peers that fall further
+#: behind than this receive a full snapshot of the owner's tuples when synchronising
+changeLogSize = 1000
+
+#: Lease period (in seconds) of replicated tuples; replicas are evicted if their owner
+#: has not answered a synchronisation request within this time. It must be longer than
+#: the refresh interval, since that is how often owners are asked to renew their leases
+tupleLease = 3 * refreshInterval
+
+#: Lease period (in seconds) of the claims granted to other peers; the tuples a peer
+#: claimed are put back if no message is received from it within this time (the
+#: failure detection probes reach every contact far more often than this)
+claimLease = tupleLease
+
+#: Weight of a new round-trip time sample in the smoothed RTT of a contact
+rttSmoothing = 0.125
+
+#: Number of consecutive RPC timeouts after which a contact is considered dead, and
+#: is removed from the contact table
+contactFailureLimit = 3
+
+#: Bucket size of the routing table in partitioned mode, which is also the number of
+#: peers each tuple is replicated to
+k = 8
+
+#: Number of concurrent RPCs sent during an iterative lookup in partitioned mode
+alpha = 3
+
+#: Number of leading fields of a tuple that determine the peers it is replicated to in
+#: partitioned mode; templates must specify all of them to be looked up efficiently
+partitionFields = 2
+
+#: Mean interval (in seconds) after which a transaction that could not claim all of its
+#: tuples is retried, if no tuple it is missing is put in the meantime; the actual
+#: interval is randomised, so that competing transactions do not keep colliding
+transactionRetryInterval = 1
+
+#: Interval (in seconds) between the failure detection probes of a peer; each probe
+#: pings one contact, and every contact is probed once per round of probes
+probeInterval = 2
+
+#: Number of contacts asked to ping a probed contact that did not answer a direct ping
+indirectProbes = 3
+
+#: Time (in seconds) a contact waits for the answer to a ping it sends on behalf of
+#: another peer; it must be shorter than the RPC timeout
+indirectProbeTimeout = 0.3
+
+#: Multiplier of the suspicion timeout: a suspected peer is declared dead if it does not
+#: refute the suspicion within suspicionMultiplier * log10(<network size>) probe intervals
+suspicionMultiplier = 4
+
+#: Multiplier of the number of times a membership update is piggybacked on outgoing
+#: messages: retransmitMultiplier * log10(<network size>), rounded up
+retransmitMultiplier = 3
+
+#: Maximum number of membership updates piggybacked on a single message
+piggybackSize = 6
+
+#: Time (in seconds) for which a peer declared dead is remembered, so that late messages
+#: and updates about it do not add it back to the contact table
+deadMemberRetention = 600
+
+#: Multicast group on which peers in multicast discovery mode are found; discovery
+#: requests are sent to this group on the UDP port of the requesting peer
+multicastGroup = '239.192.77.77'
+
+#: Size (in bits) of the Bloom filter summarising each group of tuples held by a peer
+#: (see bloom.TupleSummary); peers only query the peers whose summaries may contain
+#: matches for a template
+summaryBits = 1024
+
+#: Number of hash functions of the Bloom filter summaries
+summaryHashes = 4
+
+#: UDP port on which the super-node of a site communicates with the super-nodes of the
+#: other sites in hierarchy mode (see federation.Federation)
+federationPort = 4100
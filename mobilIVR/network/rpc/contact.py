@@ -38,6 +38,10 @@ Provides a class that encapsulates a remote contact
 
 #!/usr/bin/env python
 
+import time
+
+import constants
+
 class Contact(object):
     """ Encapsulation for remote contact
     
@@ -50,6 +54,10 @@ class Contact(object):
         self.port = udpPort
         self._networkProtocol = networkProtocol
         self.commTime = firstComm
+        # Liveness information, maintained by the network protocol
+        self.lastSeen = 0
+        self.rtt = None
+        self.failures = 0
         
     def __eq__(self, other):
         if isinstance(other, Contact):
@@ -70,6 +78,25 @@ class Contact(object):
     def __str__(self):
         return '<%s.%s object; IP address: %s, UDP port: %d>' % (self.__module__, self.__class__.__name__, self.address, self.port)
     
+    def seen(self, rtt=None):
+        """ Records that a message was received from this contact
+        
+        @param rtt: The round-trip time (in seconds) of the RPC, if the message
+                    was a response; it is added to the smoothed RTT estimate
+        @type rtt: float
+        """
+        self.lastSeen = time.time()
+        self.failures = 0
+        if rtt != None:
+            if self.rtt == None:
+                self.rtt = rtt
+            else:
+                self.rtt += (rtt - self.rtt) * constants.rttSmoothing
+    
+    def failed(self):
+        """ Records that this contact did not respond to an RPC """
+        self.failures += 1
+    
     def __getattr__(self, name):
         """ This override allows the host node to call a method of the remote
         node (i.e. this contact) as if it was a local function.
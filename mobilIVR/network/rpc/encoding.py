@@ -84,12 +84,14 @@ class Bencode(Encoding):
         """ Encoder implementation of the Bencode algorithm
         
         @param data: The data to encode
-        @type data: int, long, tuple, list, dict or str
+        @type data: int, long, bool, tuple, list, dict or str
+        
+        @note: Boolean values are encoded as integers (1 or 0)
         
         @return: The encoded data
         @rtype: str
         """
-        if type(data) in (int, long):
+        if type(data) in (int, long, bool):
             return 'i%de' % data
         elif type(data) == str:
             return '%d:%s' % (len(data), data)
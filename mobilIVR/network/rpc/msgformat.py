@@ -72,7 +72,7 @@ class MessageTranslator(object):
 class DefaultFormat(MessageTranslator):
     """ The default on-the-wire message format for this library """
     typeRequest, typeResponse, typeError = range(3)
-    headerType, headerMsgID, headerNodeID, headerPayload, headerArgs = range(5)
+    headerType, headerMsgID, headerNodeID, headerPayload, headerArgs, headerGossip = range(6)
     
     def fromPrimitive(self, msgPrimitive):
         msgType = msgPrimitive[self.headerType]
@@ -85,6 +85,8 @@ class DefaultFormat(MessageTranslator):
         else:
             # Unknown message, no payload
             msg = msgtypes.Message(msgPrimitive[self.headerMsgID], msgPrimitive[self.headerNodeID])
+        if self.headerGossip in msgPrimitive:
+            msg.gossip = msgPrimitive[self.headerGossip]
         return msg
     
     def toPrimitive(self, message):    
@@ -101,4 +103,6 @@ class DefaultFormat(MessageTranslator):
         elif isinstance(message, msgtypes.ResponseMessage):
             msg[self.headerType] = self.typeResponse
             msg[self.headerPayload] = message.response
+        if message.gossip:
+            msg[self.headerGossip] = message.gossip
         return msg
@@ -46,6 +46,8 @@ class Message(object):
     def __init__(self, rpcID, nodeID):
         self.id = rpcID
         self.nodeID = nodeID
+        # Membership updates piggybacked on the message
+        self.gossip = []
 
 
 class RequestMessage(Message):
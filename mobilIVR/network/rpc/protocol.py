@@ -53,6 +53,16 @@ from contact import Contact
 
 reactor = twisted.internet.reactor
 
+def rpcmethod(func):
+    """ Decorator to expose StaticTupleSpace methods as remote procedure calls
+    
+    Apply this decorator to methods in the StaticTupleSpace class (or a subclass) in order
+    (or in the federation of a super-node) to make them remotely callable via the RPC
+    mechanism.
+    """
+    func.rpcmethod = True
+    return func
+
 class TimeoutError(Exception):
     """ Raised when a RPC times out """
 
@@ -96,14 +106,16 @@ class KademliaProtocol(protocol.DatagramProtocol):
                  if the remote node raised one. If C{rawResponse} is set to
                  C{True}, however, it will always return the actual response
                  message (which may be a C{ResponseMessage} or an
-                 C{ErrorMessage}).
+                 C{ErrorMessage}). Cancelling the deferred stops waiting for
+                 the response (without counting against the remote node).
         @rtype: twisted.internet.defer.Deferred
         """
         msg = msgtypes.RequestMessage(self._node.id, method, args)
+        self._piggyback(msg)
         msgPrimitive = self._translator.toPrimitive(msg)
         encodedMsg = self._encoder.encode(msgPrimitive)
 
-        df = defer.Deferred()
+        df = defer.Deferred(lambda df: self._cancelRPC(msg.id))
         if rawResponse:
             df._rpcRawResponse = True
 
@@ -111,7 +123,7 @@ class KademliaProtocol(protocol.DatagramProtocol):
         timeoutCall = reactor.callLater(constants.rpcTimeout, self._msgTimeout, msg.id) #IGNORE:E1101
         # Transmit the data
         self._send(encodedMsg, msg.id, (contact.address, contact.port))
-        self._sentMessages[msg.id] = (contact.id, df, timeoutCall)
+        self._sentMessages[msg.id] = (contact.id, df, timeoutCall, time.time())
         return df
 
     def datagramReceived(self, datagram, address):
@@ -144,21 +156,33 @@ class KademliaProtocol(protocol.DatagramProtocol):
             return
         
         message = self._translator.fromPrimitive(msgPrimitive)
-        remoteContact = Contact(message.nodeID, address[0], address[1], self)
-        
-        # Refresh the remote node's details in the local node's k-buckets
-        self._node.addContact(remoteContact)
+        if message.nodeID == self._node.id:
+            # Our own multicast message, looped back to us
+            return
+        membership = getattr(self._node, 'membership', None)
+        if membership != None:
+            membership.received(message.nodeID, message.gossip, address)
+        if membership != None and membership.isDead(message.nodeID):
+            # A late message from a peer declared dead does not add it back to
+            # the contact table; only its refutation (with a higher
+            # incarnation number, piggybacked on the message) does
+            remoteContact = Contact(message.nodeID, address[0], address[1], self)
+        else:
+            # Look up (or add) the remote node in the local node's contact table
+            remoteContact = self._node.internContact(message.nodeID, address[0], address[1])
 
         if isinstance(message, msgtypes.RequestMessage):
             # This is an RPC method request
+            remoteContact.seen()
             self._handleRPC(remoteContact, message.id, message.request, message.args)
         elif isinstance(message, msgtypes.ResponseMessage):
             # Find the message that triggered this response
             if self._sentMessages.has_key(message.id):
                 # Cancel timeout timer for this RPC
-                df, timeoutCall = self._sentMessages[message.id][1:3]
+                df, timeoutCall, sentTime = self._sentMessages[message.id][1:4]
                 timeoutCall.cancel()
                 del self._sentMessages[message.id]
+                remoteContact.seen(time.time() - sentTime)
 
                 if hasattr(df, '_rpcRawResponse'):
                     # The RPC requested that the raw response message and originating address be returned; do not interpret it
@@ -188,7 +212,7 @@ class KademliaProtocol(protocol.DatagramProtocol):
             else:
                 # If the original message isn't found, it must have timed out
                 #TODO: we should probably do something with this...
-                pass
+                remoteContact.seen()
 
     def _send(self, data, rpcID, address):
         """ Transmit the specified data over UDP, breaking it up into several
@@ -249,6 +273,7 @@ class KademliaProtocol(protocol.DatagramProtocol):
         """ Send a RPC response to the specified contact
         """
         msg = msgtypes.ResponseMessage(rpcID, self._node.id, response)
+        self._piggyback(msg)
         msgPrimitive = self._translator.toPrimitive(msg)
         encodedMsg = self._encoder.encode(msgPrimitive)
         self._send(encodedMsg, rpcID, (contact.address, contact.port))
@@ -257,10 +282,18 @@ class KademliaProtocol(protocol.DatagramProtocol):
         """ Send an RPC error message to the specified contact
         """
         msg = msgtypes.ErrorMessage(rpcID, self._node.id, exceptionType, exceptionMessage)
+        self._piggyback(msg)
         msgPrimitive = self._translator.toPrimitive(msg)
         encodedMsg = self._encoder.encode(msgPrimitive)
         self._send(encodedMsg, rpcID, (contact.address, contact.port))
 
+    def _piggyback(self, msg):
+        """ Attaches the host node's pending membership updates (if any) to
+        an outgoing message """
+        membership = getattr(self._node, 'membership', None)
+        if membership != None:
+            msg.gossip = membership.piggyback()
+
     def _handleRPC(self, senderContact, rpcID, method, args):
         """ Executes a local function in response to an RPC request """
         # Set up the deferred callchain
@@ -288,16 +321,33 @@ class KademliaProtocol(protocol.DatagramProtocol):
             except Exception, e:
                 df.errback(failure.Failure(e))
             else:
-                df.callback(result)
+                if isinstance(result, defer.Deferred):
+                    # The method answers asynchronously
+                    result.chainDeferred(df)
+                else:
+                    df.callback(result)
         else:
             # No such exposed method
             df.errback( failure.Failure( AttributeError('Invalid method: %s' % method) ) )
 
+    def _cancelRPC(self, messageID):
+        """ Called when the deferred of an RPC request is cancelled; a late
+        response to the request will be ignored """
+        if self._sentMessages.has_key(messageID):
+            timeoutCall = self._sentMessages[messageID][2]
+            if timeoutCall.active():
+                timeoutCall.cancel()
+            del self._sentMessages[messageID]
+        if self._partialMessages.has_key(messageID):
+            del self._partialMessages[messageID]
+        if self._partialMessagesProgress.has_key(messageID):
+            del self._partialMessagesProgress[messageID]
+
     def _msgTimeout(self, messageID):
         """ Called when an RPC request message times out """
         # Find the message that timed out
         if self._sentMessages.has_key(messageID):
-            remoteContactID, df = self._sentMessages[messageID][0:2]
+            remoteContactID, df, timeoutCall, sentTime = self._sentMessages[messageID]
             if self._partialMessages.has_key(messageID):
                 # We are still receiving this message
                 # See if any progress has been made; if not, kill the message
@@ -310,7 +360,7 @@ class KademliaProtocol(protocol.DatagramProtocol):
                         return
                 # Reset the RPC timeout timer
                 timeoutCall = reactor.callLater(constants.rpcTimeout, self._msgTimeout, messageID) #IGNORE:E1101
-                self._sentMessages[messageID] = (remoteContactID, df, timeoutCall)
+                self._sentMessages[messageID] = (remoteContactID, df, timeoutCall, sentTime)
                 return
             del self._sentMessages[messageID]
             # The message's destination node is now considered to be dead;
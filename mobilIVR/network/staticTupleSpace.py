@@ -38,36 +38,148 @@ Provides a Static Tuple Space
 #!/usr/bin/env python
 
 import hashlib, random
-import time
+import sys, time
 import socket
-import cPickle
-from twisted.internet import defer
+from collections import OrderedDict
+from twisted.internet import defer, task
+from twisted.internet.defer import inlineCallbacks, returnValue
 import twisted.internet.reactor
 from twisted.python import failure
 
 from rpc import protocol
+from rpc.protocol import rpcmethod
+from rpc import constants
 from rpc.contact import Contact
 from rpc.msgtypes import ErrorMessage
-from datastore import DictDataStore
+from datastore import DictDataStore, serializeKey
+from tupleindex import TupleIndex, templateMatches, isExact
+from expiry import ExpiryScheduler
+from membership import Membership
+from bloom import TupleSummary, PeerSummary, groupKey
+from federation import Federation
+from wireformat import DataFormatError, encodeTuple, decodeTuple, encodeTemplate, decodeTemplate
+from contacttable import ContactTable, distance
+from routingtable import RoutingTable
 
-def rpcmethod(func):
-    """ Decorator to expose StaticTupleSpace methods as remote procedure calls
-    
-    Apply this decorator to methods in the StaticTupleSpace class (or a subclass) in order
-    to make them remotely callable via the RPC mechanism.
-    """
-    func.rpcmethod = True
-    return func
+reactor = twisted.internet.reactor
 
-class DataFormatError(Exception):
-    """ Raised when the format of data to be published or found is not correct 
+class QuorumError(Exception):
+    """ Raised when fewer of the peers responsible for a tuple than a quorum
+    respond to a write or a read in partitioned mode
     """
 
+class _Waiter(object):
+    """ A blocked C{get()} or C{read()} operation, waiting for a matching tuple """
+    def __init__(self, sequence, template, consume, numberOfResults):
+        self.sequence = sequence
+        self.template = template
+        self.consume = consume
+        self.numberOfResults = numberOfResults
+        self.deferred = None
+        self.timeoutCall = None
+        # Set while a tuple is being claimed from its owner for a get()
+        self.claiming = False
+
+class _Watcher(object):
+    """ A peer subscribed to changes of the tuples owned by this peer """
+    def __init__(self, contact):
+        self.contact = contact
+        self.templates = []
+        # The last change (in the current epoch) that was sent to the watcher
+        self.sentSequence = 0
+
+class _Query(object):
+    """ A C{readDistributed()} operation, waiting for the responses of other peers """
+    def __init__(self, template, numberOfResults, results, quorum=0):
+        self.template = template
+        self.numberOfResults = numberOfResults
+        # The number of peers that must respond before the results are final
+        self.quorum = quorum
+        self.responses = 0
+        self.results = results
+        self.found = set(results)
+        # { <contactID>: <deferred of the outstanding RPC> }
+        self.pending = {}
+        self.dispatched = False
+        self.deferred = None
+        self.timeoutCall = None
+
 class StaticTupleSpacePeer():
     """ Enables tuples to be stored locally, and in turn allows non-local tuples to be located at
         static network locations provided as input at start-up 
     """
-    def __init__(self, id=None, udpPort=4000, dataStore=None, routingTable=None, networkProtocol=None):
+    def __init__(self, id=None, udpPort=4000, dataStore=None, routingTable=None, networkProtocol=None, partitioned=False,
+                 replicaCacheSize=None, replicaCacheBytes=None, sortedFields=(), multicastDiscovery=False,
+                 replicationFactor=None, site=None, superNode=None, federationPort=None, federationAddresses=None,
+                 federationProtocol=None):
+        """
+        @param routingTable: The contact table to use; defaults to a
+                             C{RoutingTable} in partitioned mode, and a flat
+                             C{ContactTable} otherwise
+        @param partitioned: If set, the peer runs in partitioned mode: its
+                            tuples are only replicated to the
+                            C{replicationFactor} peers closest to their
+                            partition key (see C{_partitionKey()}), found
+                            with iterative lookups, instead of to every peer
+                            in the network
+        @type partitioned: bool
+        @param replicationFactor: The number of peers each tuple is replicated
+                                  to in partitioned mode (at most, and by
+                                  default, C{constants.k}); writes (see
+                                  C{putReplicated()}) and reads (see
+                                  C{readDistributed()}) need a majority of
+                                  them to respond
+        @type replicationFactor: int
+        @param replicaCacheSize: The maximum number of other peers' tuples to
+                                 keep replicas of; if set (or if
+                                 C{replicaCacheBytes} is set), the replicas
+                                 are kept in a cache from which the least
+                                 recently used ones are evicted, and fetched
+                                 again from other peers when needed (see
+                                 C{readDistributed()}). The tuples owned by
+                                 this peer are never evicted.
+        @type replicaCacheSize: int
+        @param replicaCacheBytes: The maximum (approximate) memory size, in
+                                  bytes, of the replicas in the cache
+        @type replicaCacheBytes: int
+        @param sortedFields: The numeric fields to keep sorted indexes of, as
+                             C{(<arity>, <position>)} pairs, so that templates
+                             with a C{tupleindex.Range} in such a field are
+                             answered with an index seek (e.g. C{[(5, 3)]}
+                             for the number of free channels in
+                             C{('resource', 'ivr', ownerID, freeChannels,
+                             region)} tuples)
+        @type sortedFields: list
+        @param multicastDiscovery: If set, the peer listens for discovery
+                                   requests on the multicast group
+                                   C{constants.multicastGroup} (on its own UDP
+                                   port), and joins the network through the
+                                   first peer that answers its own request if
+                                   no known nodes are given (see
+                                   C{discoverPeers()})
+        @type multicastDiscovery: bool
+        @param site: The site (regional cluster) of the peer, in hierarchy
+                     mode: the peers of a site form a tuple space of their
+                     own, and only their super-node communicates with the
+                     other sites (see C{federation.Federation})
+        @type site: str
+        @param superNode: Whether this peer is the super-node of its site; if
+                          not specified, the peer with the lowest node ID
+                          among the contacts of a site is elected
+        @type superNode: bool
+        @param federationPort: The UDP port on which the super-node
+                               communicates with the other sites; defaults to
+                               C{constants.federationPort}
+        @type federationPort: int
+        @param federationAddresses: The addresses of super-nodes of other
+                                    sites, as C{(<ip address>, <udp port>)}
+                                    tuples, through which a new super-node
+                                    joins the federation
+        @type federationAddresses: list
+        @param federationProtocol: The network protocol the super-node uses to
+                                   communicate with the other sites; defaults
+                                   to a C{KademliaProtocol}
+        """
         if id != None:
             self.id = id
         else:
@@ -80,12 +192,132 @@ class StaticTupleSpacePeer():
             self._protocol = networkProtocol
         
         self._joinDeferred = None
-        self.contactsList = []
-        self.dataStore = DictDataStore()
+        self.multicastDiscovery = multicastDiscovery
+        self.partitioned = partitioned
+        if replicationFactor == None:
+            self.replicationFactor = constants.k
+        else:
+            self.replicationFactor = min(replicationFactor, constants.k)
+        # Any read quorum overlaps with any write quorum
+        self.quorum = self.replicationFactor / 2 + 1
+        if routingTable != None:
+            self.contacts = routingTable
+        elif partitioned:
+            self.contacts = RoutingTable(self.id)
+        else:
+            self.contacts = ContactTable()
+        if dataStore == None:
+            self.dataStore = DictDataStore()
+        else:
+            self.dataStore = dataStore
+        self._index = TupleIndex(sortedFields)
+        # Bloom filter summaries of the tuples held by this peer, and the
+        # copies of the other peers' summaries: { <peerID>: <PeerSummary> }
+        self._summary = TupleSummary()
+        self._peerSummaries = {}
+        # Blocked get/read operations, in FIFO order per template:
+        # { <template>: [<_Waiter>, ...] }
+        self._waiters = {}
+        self._waiterSequence = 0
+        # Every owner's copies of a tuple are stored under one key, with the
+        # number of copies as the value; tuples with more than one copy are
+        # listed here: { <key>: <copies> }
+        self._copies = {}
+        # Every change to a tuple gives it a new version; the tuples owned by
+        # this peer are numbered with a counter, and replicas take the versions
+        # assigned by their owners: { <key>: <version> }
+        self._versions = {}
+        self._version = 0
+        # Number of outstanding claims on tuples owned by this peer, per
+        # claimant: { <claimantID>: { <key>: <count> } }
+        self._leases = {}
+        # Changes made to replicas ahead of their owners (granted claims and
+        # accepted releases), which are skipped when the owners' change logs
+        # repeat them: { <key>: <copies put, or taken if negative> }
+        self._pendingChanges = {}
+        # Changes to the tuples owned by this peer are numbered, per incarnation
+        # (epoch) of the peer, so that other peers can fetch only what changed.
+        # The epoch, the change log and the synchronisation state below are
+        # only kept in memory, even with a persistent data store: a restarted
+        # peer starts a new epoch, and fetches (and sends) full snapshots
+        self._epoch = self._generateID()
+        self._sequence = 0
+        # [(<sequence>, <operation>, <tuple>, <version>), ...]
+        self._changeLog = []
+        # The last change applied for each owner of replicated tuples:
+        # { <ownerID>: (<epoch>, <sequence>) }
+        self._syncState = {}
+        self._refreshCall = None
+        # The next step of the data store compaction in progress, if any
+        self._compactionCall = None
+        # Failed peers are detected by probing the contacts, and every message
+        # sent carries the latest membership changes (see membership.Membership)
+        self.membership = Membership(self, self._memberFailed, reactor)
+        # Replicas of other peers' tuples are leased: they lapse unless their
+        # owner keeps answering synchronisation requests
+        self._leaseScheduler = ExpiryScheduler(self._leaseExpired, reactor)
+        # Claims granted to other peers are leased as well: the claimed tuples
+        # are put back unless the claimant keeps in touch
+        self._claimScheduler = ExpiryScheduler(self._claimsExpired, reactor)
+        # Peers watching the tuples owned by this peer: { <peerID>: <_Watcher> }
+        self._watchers = {}
+        # Watchers with changes waiting to be pushed to them
+        self._pendingPushes = set()
+        self._pushCall = None
+        # Templates of the remote tuples this peer has subscribed to
+        self._subscriptions = []
+        # The keys of the replicas of other peers' tuples, least recently used
+        # first, if their number or size is bounded: { <key>: <size> }
+        self.replicaCacheSize = replicaCacheSize
+        self.replicaCacheBytes = replicaCacheBytes
+        if replicaCacheSize != None or replicaCacheBytes != None:
+            self._replicaCache = OrderedDict()
+        else:
+            self._replicaCache = None
+        self._replicaCacheUsage = 0
+        # In partitioned mode, the keys of the tuples owned by this peer per
+        # partition key: { <partitionKey>: set(<key>, ...) }
+        self._partitions = {}
+        # Changes to replicate to the peers responsible for them, in order:
+        # [(<operation>, <tuple>, <version>), ...]
+        self._pendingReplication = []
+        self._replicationCall = None
+        # Hierarchy mode: the federation of this site with the other sites,
+        # if this peer is the super-node of its site, and the tuples claimed
+        # from other sites, with the super-nodes that forwarded the claims:
+        # { <key>: [<superNodeID>, ...] }
+        self.site = site
+        self.superNode = superNode
+        if federationPort == None:
+            self.federationPort = constants.federationPort
+        else:
+            self.federationPort = federationPort
+        self.federationAddresses = federationAddresses
+        self._federationProtocol = federationProtocol
+        self.federation = None
+        self._siteClaims = {}
+        # Index the tuples of a (persistent) data store that is not empty
+        for key in self.dataStore.keys():
+            ownerID, sTuple = key
+            copies, version = self.dataStore[key]
+            self._index.add(key, sTuple)
+            self._summary.add(sTuple)
+            if copies > 1:
+                self._copies[key] = copies
+            self._versions[key] = version
+            if ownerID == self.id:
+                # Versions must keep increasing across restarts
+                self._version = max(self._version, version)
+                self._addToPartition(key, sTuple)
+            else:
+                self._cacheReplica(key)
+                if ownerID not in self._leaseScheduler:
+                    self._renewLease(ownerID)
+        self._evictReplicas()
         
 
-    def put(self, sTuple, originalPublisherID=None):
-        """ Used to write a tuple or serialized (string) data into a tuple space
+    def put(self, sTuple, originalPublisherID=None, version=None):
+        """ Used to write a tuple into a tuple space
         
         @note: This method is generally called "out" in tuple space literature,
                but is renamed to "put" in this implementation to match the 
@@ -93,67 +325,186 @@ class StaticTupleSpacePeer():
         
         @param sTuple: The tuple to write into the static tuple space (it
                        is named "sTuple" to avoid a conflict with the Python
-                       C{tuple} data type).
+                       C{tuple} data type). Tuples may have any number of
+                       fields, but every field must be hashable.
         @type sTuple: tuple
+        @param originalPublisherID: The node ID of the tuple's owner; if not
+                                    specified, the third field of the tuple is
+                                    used (as in handler and resource tuples),
+                                    or this peer's ID for shorter tuples
+        @type originalPublisherID: str
+        @param version: The version of the tuple assigned by its owner (for
+                        replicas); tuples owned by this peer are given a new
+                        version whenever they change (see C{cas()})
+        @type version: int
+        
+        @note: The tuple space is a multiset: putting a tuple that is already
+               stored (with the same owner) adds another copy of it, and
+               equal tuples of different owners are stored separately.
         
         @rtype: twisted.internet.defer.Deferred
         """
+        if not isinstance(sTuple, tuple):
+            raise DataFormatError("Error, expected a tuple as input")
         
-        if isinstance(sTuple, tuple):
-            # Parse the tuple
-            sData = (sTuple[0], sTuple[1])
-            ownerID = sTuple[2]
-            
-            # Serialize the data
-            tupleValue = cPickle.dumps(sData)
-        elif isinstance(sTuple, str):
-            tupleValue = sTuple
-            ownerID = originalPublisherID
-        else:
-            raise DataFormatError("Error, expected a tuple or a serialized string as input")
-        
-        # TODO: may need to implement more advanced tuple space, based on data types
-        #       for now tuples need to match exactly (element value as well as element order)     
-        
-        # Generate a hash of the data to be stored        
-        h = hashlib.sha1()
-        h.update(tupleValue)
-        mainKey = h.digest()
+        ownerID = self._tupleOwner(sTuple, originalPublisherID)
+        mainKey = self._tupleKey(sTuple, ownerID)
         
         originallyPublished = 0        
         now = int(time.time())
         
-#        print 'publishing :'
-#        print 'key ' + str((mainKey,)) 
-#        print 'value' + tupleValue 
-        
-        # TODO: Check if the tuple has already been stored, also check that other peers tuples don't replace
-        # locally stored tuples
-        self.dataStore.setItem(mainKey, tupleValue, now, originallyPublished, ownerID)
+        copies = self._addCopies(mainKey, sTuple, 1)
+        version = self._changeVersion(mainKey, version)
+        self.dataStore.setItem(mainKey, (copies, version), now, originallyPublished, ownerID)
+        if ownerID == self.id:
+            self._logChange('put', sTuple, version)
+        elif ownerID not in self._leaseScheduler:
+            self._renewLease(ownerID)
+        self._wakeWaiters(mainKey, sTuple)
+        self._evictReplicas()
         
         df = defer.Deferred() 
         # invoke call-back now
-        df.callback(tupleValue)
+        df.callback(sTuple)
         
         return df
+    
+    def putReplicated(self, sTuple, originalPublisherID=None):
+        """ Writes a tuple owned by this peer into the tuple space, and waits
+        until its replicas are stored
+        
+        In partitioned mode, the tuple is sent to the peers responsible for
+        its partition right away (together with any other pending changes),
+        and the write succeeds once a quorum (a majority of the
+        C{replicationFactor} peers, including this peer if it is one of them)
+        has stored it. Since every read quorum overlaps with the write
+        quorum, a successful write is seen by every subsequent
+        C{readDistributed()}. In the default (fully replicated) mode,
+        replicas are fetched by the other peers, and the write succeeds
+        immediately.
+        
+        @note: If the quorum is not reached, the tuple is still stored
+               locally, and is republished with the next refresh
+        
+        @return: Deferred, which fires with the tuple, or fails with
+                 C{QuorumError} if the quorum was not reached
+        @rtype: twisted.internet.defer.Deferred
+        """
+        df = self.put(sTuple, originalPublisherID)
+        partitionKey = self._partitionKey(sTuple)
+        if not self.partitioned or partitionKey == None or self._tupleOwner(sTuple, originalPublisherID) != self.id:
+            return df
+        def checkQuorum(replicas):
+            if replicas < self.quorum:
+                raise QuorumError('Only %d of %d replicas of the tuple were stored' % (replicas, self.replicationFactor))
+            return sTuple
+        if self._replicationCall != None and self._replicationCall.active():
+            self._replicationCall.cancel()
+        df = self._replicateChanges()[partitionKey]
+        df.addCallback(checkQuorum)
+        return df
+
+    @rpcmethod
+    def putMany(self, tuples, originalPublisherID=None, _rpcNodeID=None, _rpcNodeContact=None):
+        """ Writes several tuples into the tuple space in a single operation
+        
+        This is equivalent to calling C{put()} for each tuple, but the tuples
+        are written to the data store in one batch (a single transaction for
+        persistent data stores), and it can be invoked via RPC to publish many
+        tuples in one round trip.
+        
+        @param tuples: The tuples to write (in the wire format if invoked via
+                       RPC); all of them are checked before any of them is
+                       written
+        @type tuples: list
+        @param originalPublisherID: The node ID of the owner of all the
+                                    tuples; if not specified, it is
+                                    determined for each tuple as in C{put()}
+        @type originalPublisherID: str
+        
+        @note: Tuples written via RPC are owned by the calling peer; the call
+               is refused if C{originalPublisherID} names another peer
+        
+        @raise DataFormatError: A tuple is invalid, or C{originalPublisherID}
+                                is not the calling peer
+        
+        @return: The number of tuples written
+        @rtype: int
+        """
+        if _rpcNodeID != None:
+            if originalPublisherID not in (None, _rpcNodeID):
+                raise DataFormatError("Error, peers may only publish their own tuples")
+            originalPublisherID = _rpcNodeID
+        entries = []
+        for sTuple in tuples:
+            sTuple = self._tuple(sTuple)
+            ownerID = self._tupleOwner(sTuple, originalPublisherID)
+            entries.append((self._tupleKey(sTuple, ownerID), sTuple, ownerID))
+        
+        # The number of copies of each tuple once the batch is written
+        copies = {}
+        versions = []
+        for key, sTuple, ownerID in entries:
+            copies[key] = self._addCopies(key, sTuple, 1)
+            versions.append(self._changeVersion(key))
+        now = int(time.time())
+        self.dataStore.setItems([(key, (count, self._versions[key]), now, 0, key[0]) for key, count in copies.iteritems()])
+        for (key, sTuple, ownerID), version in zip(entries, versions):
+            if ownerID == self.id:
+                self._logChange('put', sTuple, version)
+            elif ownerID not in self._leaseScheduler or ownerID == _rpcNodeID:
+                # Tuples pushed by their owner show that it is still alive
+                self._renewLease(ownerID)
+        # Only hand the tuples to waiting operations once all of them are
+        # stored, since their callbacks may read the tuple space
+        for key, sTuple, ownerID in entries:
+            if key in self._index:
+                self._wakeWaiters(key, sTuple)
+        self._evictReplicas()
+        return len(entries)
 
     
-    def get(self, template):
+    def get(self, template, timeout=None):
         """ Reads and removes (consumes) a tuple from the tuple space (blocking)
         
+        Tuples owned by this peer are taken locally; replicas of other peers'
+        tuples are claimed from their owners (see C{claimTuple()}). If no
+        matching tuple exists, the operation waits until one is put into the
+        tuple space. Waiting operations are served in the order in which they
+        were started, and a tuple is only ever handed to one waiting C{get()}.
+        
         @type template: tuple
+        @param timeout: The maximum time (in seconds) to wait for a matching
+                        tuple; if not specified, wait indefinitely
+        @type timeout: float
         
         @note: This method is generally called "in" in tuple space literature,
                but is renamed to "get" in this implementation to avoid
                a conflict with the Python C{in} keyword.
-        @return: a matching tuple,  or None if no matching tuples were found
+        @return: a matching tuple,  or None if the timeout expired
+        @rtype: twisted.internet.defer.Deferred
         """
-        
-        # TODO: consider to implement blocking mechanism that waits until a tuple is found
-        # TODO: consider to implement mechanism that removes the tuple (resource marshalling)
-        
-     
-        return self.findTuple(template)
+        sTuple = self.getIfExists(template)
+        if sTuple != None:
+            return defer.succeed(sTuple)
+        # Start waiting before claiming replicas from their owners, so that a
+        # matching tuple put while the claims are in progress is not missed
+        waiter = self._addWaiter(template, True, 1, timeout)
+        def claimed(key):
+            if key == None:
+                return
+            if waiter.deferred.called:
+                # Another tuple was handed over (or the timeout expired) first
+                self.releaseTuple(key[1], key[0])
+            else:
+                self._removeWaiter(waiter)
+                waiter.deferred.callback(key[1])
+        def failed(failure):
+            if not waiter.deferred.called:
+                self._removeWaiter(waiter)
+                waiter.deferred.errback(failure)
+        self._claimKey(template).addCallbacks(claimed, failed)
+        return waiter.deferred
 
     
     def getIfExists(self, template, getListenerTuple=False):
@@ -171,11 +522,46 @@ class StaticTupleSpacePeer():
         @note: This method is generally called "in" in tuple space literature,
                but is renamed to "get" in this implementation to avoid
                a conflict with the Python C{in} keyword.
+        @note: Only tuples owned by this peer are taken; use C{claimTuple()}
+               to take the tuples of other peers from their owners
         """
-        return self.findTuple(template)
+        keys = self._findOwnedKeys(template, 1)
+        if len(keys) == 0:
+            return None
+        return self._removeKey(keys[0])
+    
     
+    def getMany(self, templates, numberOfResults=1):
+        """ Reads and removes (consumes) tuples for several templates in a
+        single operation (non-blocking)
+        
+        @param templates: The templates to match
+        @type templates: list
+        @param numberOfResults: The maximum number of tuples to consume for
+                                each template, as in C{readIfExists()}
+        @type numberOfResults: int
+        
+        @note: As with C{getIfExists()}, only tuples owned by this peer are
+               taken; use C{claimTuples()} for the tuples of other peers
+        
+        @return: A list containing, for each template, the consumed tuple (or
+                 list of tuples if C{numberOfResults} is not 1), or None if
+                 no matching tuple was found
+        @rtype: list
+        """
+        results = []
+        for template in templates:
+            tuples = [self._removeKey(key) for key in self._findOwnedKeys(template, numberOfResults)]
+            if numberOfResults == 1:
+                if len(tuples) == 0:
+                    results.append(None)
+                else:
+                    results.append(tuples[0])
+            else:
+                results.append(tuples)
+        return results
     
-    def read(self, template, numberOfResults=1):
+    def read(self, template, numberOfResults=1, timeout=None):
         """ Non-destructively reads a tuple in the tuple space (blocking)
         
         This operation is similar to "get" (or "in") in that the peer builds a
@@ -190,20 +576,18 @@ class StaticTupleSpacePeer():
                                 otherwise return a list of tuples. If set to 0
                                 or lower, return all results.
         @type numberOfResults: int
+        @param timeout: The maximum time (in seconds) to wait for a matching
+                        tuple; if not specified, wait indefinitely
+        @type timeout: float
         
         @return: a matching tuple, or list of tuples (if C{numberOfResults} is
-                 not set to 1, or None if no matching tuples were found
+                 not set to 1, or None if the timeout expired
         @rtype: twisted.internet.defer.Deferred
         """
-        returnedTuple = self.findTuple(template)
-        
-        if returnedTuple != None:
-            #returnTuples = []
-            #returnTuples.append(returnedTuple)
-            #return returnTuples
-            return returnedTuple
-        else:
-            return None
+        result = self.findTuple(template, numberOfResults)
+        if result not in (None, []):
+            return defer.succeed(result)
+        return self._addWaiter(template, False, numberOfResults, timeout).deferred
 
     
     def readIfExists(self, template, numberOfResults=1):
@@ -226,133 +610,1183 @@ class StaticTupleSpacePeer():
                  not set to 1, or None if no matching tuples were found
         @rtype: twisted.internet.defer.Deferred
         """
-        returnedTuple = self.findTuple(template)
+        return self.findTuple(template, numberOfResults)
+    
+    def countTuples(self, template):
+        """ Counts the copies of the tuples matching a template (non-blocking)
         
-        if returnedTuple != None:
-            #returnTuples = []
-            #returnTuples.append(returnedTuple)
-            #return returnTuples
-            return returnedTuple
-        else:
-            return None
+        Unlike C{readIfExists()}, which returns each owner's matching tuple
+        once, this counts every copy put by every owner; e.g. for channel
+        resource tuples, this is the total capacity of all gateway nodes.
+        
+        @type template: tuple
+        
+        @rtype: int
+        """
+        copies = self._copies
+        return sum([copies.get(key, 1) for key in self._findKeys(template, 0)])
 
+    def readDistributed(self, template, numberOfResults=1, contacts=None, timeout=None, useSummaries=True):
+        """ Non-destructively reads tuples from the tuple spaces of other peers
+        (scatter-gather, non-blocking)
+        
+        If this peer's data store does not contain enough matching tuples, the
+        template is sent to the specified peers in parallel. If
+        C{numberOfResults} is 1 the first matching tuple found wins; otherwise
+        the results of the peers are gathered until C{numberOfResults} tuples
+        have been found. As soon as the result is settled (or the timeout
+        expires), the outstanding RPCs are cancelled.
+        
+        In partitioned mode, if no peers are specified, the template is sent
+        to the peers responsible for its partition, and the results are
+        gathered until a quorum of them (see C{putReplicated()}) has
+        responded, so the read survives the failure of a minority of them.
+        
+        @param numberOfResults: The maximum number of matching tuples to return.
+                                If set to 1 (default), return the tuple itself,
+                                otherwise return a list of tuples. If set to 0
+                                or lower, gather all results from every peer.
+        @type numberOfResults: int
+        @param contacts: The peers to query; if not specified, the contacts
+                         whose tuple summaries may contain a match, or are
+                         out of date (see C{refreshSummaries()}) are
+                         queried, or in partitioned mode, the peers
+                         responsible for the template's partition (if all of
+                         its partition fields are specified)
+        @type contacts: list
+        @param timeout: The maximum time (in seconds) to wait for the peers'
+                        responses; if not specified, wait until every peer
+                        has responded (or its RPC has timed out)
+        @type timeout: float
+        @param useSummaries: If not set, every contact is queried, which also
+                             finds the tuples put since the contacts'
+                             summaries were last refreshed
+        @type useSummaries: bool
+        
+        @return: a matching tuple, or list of tuples (if C{numberOfResults} is
+                 not set to 1), or None if no matching tuples were found; in
+                 partitioned mode, fails with C{QuorumError} if no quorum of
+                 the peers responsible for the template responded
+        @rtype: twisted.internet.defer.Deferred
+        """
+        template = self._template(template)
+        if contacts == None and self.partitioned:
+            partitionKey = self._partitionKey(template)
+            if partitionKey != None:
+                # Only the peers responsible for the template's partition
+                # (and the owners of the tuples) can hold matching tuples
+                df = self._iterativeFind(partitionKey)
+                df.addCallback(self._readPartition, partitionKey, template, numberOfResults, timeout)
+                return df
+        if contacts == None:
+            if useSummaries:
+                contacts = [contact for contact in self.contacts if self._mayHold(contact.id, template)]
+            else:
+                contacts = list(self.contacts)
+        return self._query(template, numberOfResults, contacts, timeout)
+    
+    def _readPartition(self, closestContacts, partitionKey, template, numberOfResults, timeout):
+        """ Sends a template to the peers responsible for its partition, and
+        gathers their results until a quorum of them has responded """
+        contacts, responsible = self._responsiblePeers(partitionKey, closestContacts)
+        # This peer answers from its own data store
+        quorum = self.quorum - int(responsible)
+        return self._query(template, numberOfResults, contacts, timeout, quorum)
+    
+    def _query(self, template, numberOfResults, contacts, timeout, quorum=0):
+        """ Sends a template to peers, and gathers their results (see
+        C{readDistributed()}) """
+        query = _Query(template, numberOfResults, [self._index.get(key) for key in self._findKeys(template, numberOfResults)], quorum)
+        query.deferred = defer.Deferred(lambda df: self._settleQuery(query))
+        wireTemplate = encodeTemplate(template)
+        for contact in contacts:
+            if self._querySettled(query):
+                break
+            df = contact.findTuple(wireTemplate, numberOfResults)
+            query.pending[contact.id] = df
+            df.addCallbacks(self._queryResponded, self._queryFailed, callbackArgs=(query, contact.id), errbackArgs=(query, contact.id))
+        query.dispatched = True
+        if self._querySettled(query):
+            self._finishQuery(query)
+        elif timeout != None:
+            query.timeoutCall = reactor.callLater(timeout, self._queryTimedOut, query)
+        return query.deferred
+    
+    @inlineCallbacks
+    def getDistributed(self, template, contacts=None, timeout=None, useSummaries=True):
+        """ Reads and removes (consumes) a tuple from the tuple space, looking
+        in the tuple spaces of other peers if needed (non-blocking)
+        
+        Matching tuples replicated to this peer are claimed first, as with
+        C{claimTuple()}. Otherwise the first matching tuple found by
+        C{readDistributed()} is claimed from its owner (as determined in
+        C{put()}).
+        
+        @param contacts: The peers to query, as in C{readDistributed()}
+        @type contacts: list
+        @param timeout: The maximum time (in seconds) to wait for the peers'
+                        responses to the query
+        @type timeout: float
+        @param useSummaries: If not set, every contact is queried, as in
+                             C{readDistributed()}
+        @type useSummaries: bool
+        
+        @return: The claimed tuple, or None if no matching tuple was found, or
+                 its owner refused the claim
+        @rtype: twisted.internet.defer.Deferred
+        """
+        sTuple = yield self.claimTuple(template)
+        if sTuple != None:
+            returnValue(sTuple)
+        sTuple = yield self.readDistributed(template, 1, contacts, timeout, useSummaries)
+        if sTuple == None:
+            returnValue(None)
+        ownerID = self._tupleOwner(sTuple)
+        if ownerID == self.id:
+            returnValue(self.claim(sTuple))
+        contact = self.findContact(ownerID)
+        claimedTuple = None
+        if contact != None:
+            claimedTuple = yield self._claimFrom(contact, sTuple)
+        returnValue(claimedTuple)
+    
     @rpcmethod
-    def findTuple(self, value):
-        """ Used to search the dataStore for a tuple, if invoked locally it 
-            searches this peers datastore. If it is invoked via RPC it will 
-            search for the tuple at the remote peer
+    def readMany(self, templates, numberOfResults=1, _rpcNodeID=None, _rpcNodeContact=None):
+        """ Non-destructively reads tuples for several templates in a single
+        operation (non-blocking); if invoked via RPC it searches the tuple
+        space at the remote peer
         
-            @param value: The tuple to search for  
-            
-            return: a matching tuple,  or None if no matching tuples were found
+        @param templates: The templates to match (in the wire format if
+                          invoked via RPC)
+        @type templates: list
+        @param numberOfResults: The maximum number of tuples to return for
+                                each template, as in C{readIfExists()}
+        @type numberOfResults: int
+        
+        @return: A list containing, for each template, the result of
+                 C{readIfExists()} (in the wire format if the template is)
+        @rtype: list
         """
+        return [self.findTuple(template, numberOfResults) for template in templates]
+    
+    @rpcmethod
+    def findTuple(self, value, numberOfResults=1):
+        """ Used to search the dataStore for tuples matching a template, if
+            invoked locally it searches this peers datastore. If it is invoked
+            via RPC it will search for the tuple at the remote peer
         
-        if isinstance(value, tuple):
-            # parse the tuple 
-            dataTuple = (value[0], value[1])
+            @param value: The template to search for (in the wire format
+                          if invoked via RPC, see C{wireformat}); C{None}
+                          or a type (e.g. C{str}) in a field of the template
+                          matches any value (of that type) in the same field
+                          of a stored tuple, and a C{tupleindex.Range}
+                          matches the numbers within it
+            @param numberOfResults: The maximum number of matching tuples to
+                                    return. If set to 1 (default), return the
+                                    tuple itself, otherwise return a list of
+                                    tuples. If set to 0 or lower, return all
+                                    results.
+            @type numberOfResults: int
             
-            # Serialize the tuple
-            serialValue = cPickle.dumps(dataTuple)
-        elif isinstance(value, str):
-            serialValue = value
-        else:
-            raise DataFormatError("Error, expected a tuple or a serialized string as input")
+            return: a matching tuple, or list of tuples (if C{numberOfResults}
+                    is not set to 1), or None if no matching tuples were found;
+                    the tuples are in the wire format if the template is
+        """
+        keys = self._findKeys(value, numberOfResults)
+        tuples = [self._index.get(key) for key in keys]
+        if isinstance(value, list):
+            tuples = [encodeTuple(sTuple) for sTuple in tuples]
+        if numberOfResults == 1:
+            if len(tuples) == 0:
+                return None
+            return tuples[0]
+        return tuples
+        
+    
+    @rpcmethod
+    def claim(self, template, _rpcNodeID=None, _rpcNodeContact=None):
+        """ Atomically takes (leases) a tuple owned by this peer
         
-        # print 'searching for ' + serialValue
+        This is invoked (usually via RPC) by peers that want to consume a tuple
+        published by this peer; since only the owner can grant the claim, a
+        tuple is never handed to more than one peer, even if several peers
+        hold a replica of it.
         
-        # Generate a hash of the value       
-        h = hashlib.sha1()
-        h.update(serialValue)
-        mainKey = h.digest()
+        The claim is recorded for the calling peer (the claimant), and only
+        it may release the tuple. Claims of other peers lapse, and the tuples
+        are put back, if no message is received from the claimant for
+        C{constants.claimLease} seconds (e.g. because it died).
         
-        keys = self.dataStore.keys()
+        @param template: The template of the tuple to claim (in the wire
+                         format if invoked via RPC)
         
-        try:
-            dataStoreTuple = self.dataStore.__getitem__(mainKey)
-        except Exception:
-            
-            # The data wasn't found, so return None
+        @return: The claimed tuple (in the wire format if the template is),
+                 or None if no matching tuple owned by this peer is available
+                 (the claim is refused)
+        """
+        claimantID = _rpcNodeID or self.id
+        for key in self._findOwnedKeys(template, 1):
+            sTuple = self._removeKey(key)
+            leases = self._leases.setdefault(claimantID, {})
+            leases[key] = leases.get(key, 0) + 1
+            self._renewClaims(claimantID)
+            if isinstance(template, list):
+                return encodeTuple(sTuple)
+            return sTuple
+        return None
+    
+    @rpcmethod
+    def release(self, sTuple, _rpcNodeID=None, _rpcNodeContact=None):
+        """ Returns a tuple leased with C{claim()} to the tuple space
+        
+        @param sTuple: The claimed tuple (in the wire format if invoked via
+                       RPC)
+        
+        @return: True if the tuple was leased from this peer by the calling
+                 peer (and has now been put back), otherwise False
+        @rtype: bool
+        """
+        sTuple = self._tuple(sTuple)
+        claimantID = _rpcNodeID or self.id
+        key = self._tupleKey(sTuple, self.id)
+        leases = self._leases.get(claimantID)
+        if leases == None or key not in leases:
+            return False
+        leases[key] -= 1
+        if leases[key] == 0:
+            del leases[key]
+            if len(leases) == 0:
+                del self._leases[claimantID]
+                if self.federation == None or not self.federation.hasClaims(claimantID):
+                    self._claimScheduler.cancel(claimantID)
+        self.put(sTuple, self.id)
+        return True
+    
+    def _renewClaims(self, claimantID):
+        """ Extends the lease on the claims granted to another peer (or
+            forwarded to other sites for it, by a super-node) """
+        if claimantID == self.id:
+            return
+        if claimantID in self._leases or (self.federation != None and self.federation.hasClaims(claimantID)):
+            self._claimScheduler.schedule(claimantID, constants.claimLease)
+    
+    def _claimsExpired(self, claimantID):
+        """ Puts back the tuples claimed by a peer that has not been heard
+            from within the claim lease (or has failed), and releases those
+            claimed from other sites for it """
+        self._claimScheduler.cancel(claimantID)
+        if self.federation != None:
+            self.federation.releaseClaims(claimantID)
+        leases = self._leases.pop(claimantID, None)
+        if leases == None:
+            return
+        tuples = []
+        for key, count in leases.iteritems():
+            tuples.extend([key[1]] * count)
+        self.putMany(tuples, self.id)
+    
+    @rpcmethod
+    def cas(self, template, expectedVersion, newTuple, _rpcNodeID=None, _rpcNodeContact=None):
+        """ Atomically replaces a tuple owned by this peer, if it has not
+        changed since it was read (compare-and-swap)
+        
+        This is invoked locally, or via RPC at the owner of the tuple, to
+        update a tuple (such as a counter) in a single operation: a copy of
+        the matching tuple with the expected version is taken, and the new
+        tuple is put, without other peers seeing the tuple missing in
+        between (both changes are pushed and replicated together).
+        
+        @param template: The template of the tuple to replace (in the wire
+                         format if invoked via RPC)
+        @param expectedVersion: The version of the tuple when it was read,
+                                e.g. with C{readVersioned()}
+        @type expectedVersion: int
+        @param newTuple: The tuple to put instead (in the wire format if
+                         invoked via RPC); it is owned by this peer
+        
+        @return: The version of the new tuple, or None if no matching tuple
+                 owned by this peer has the expected version (in which case
+                 nothing is changed)
+        @rtype: int
+        """
+        newTuple = self._tuple(newTuple)
+        newKey = self._tupleKey(newTuple, self.id)
+        for key in self._findKeys(template, 0):
+            if key[0] == self.id and self._versions[key] == expectedVersion:
+                self._removeKey(key)
+                self.put(newTuple, self.id)
+                return self._versions[newKey]
+        return None
+    
+    @rpcmethod
+    def readVersioned(self, template, _rpcNodeID=None, _rpcNodeContact=None):
+        """ Non-destructively reads a tuple, together with its version
+        (non-blocking); if invoked via RPC it searches the tuple space at the
+        remote peer
+        
+        @param template: The template to match (in the wire format if
+                         invoked via RPC)
+        
+        @return: C{[tuple, version]} for a matching tuple (with the tuple in
+                 the wire format if the template is), or None if no matching
+                 tuples were found
+        @rtype: list
+        """
+        keys = self._findKeys(template, 1)
+        if len(keys) == 0:
             return None
+        sTuple = keys[0][1]
+        if isinstance(template, list):
+            sTuple = encodeTuple(sTuple)
+        return [sTuple, self._versions[keys[0]]]
+    
+    @rpcmethod
+    def claimMany(self, templates, _rpcNodeID=None, _rpcNodeContact=None):
+        """ Atomically takes (leases) tuples owned by this peer for several
+        templates, as with C{claim()}, in a single operation
+        
+        @param templates: The templates of the tuples to claim (in the wire
+                          format if invoked via RPC)
+        @type templates: list
+        
+        @return: A list containing, for each template, the claimed tuple, or
+                 None if the claim is refused
+        @rtype: list
+        """
+        return [self.claim(template, _rpcNodeID) for template in templates]
+    
+    def claimTuple(self, template):
+        """ Claims a tuple matching the template from the tuple space
         
+        The matching tuples in this peer's data store are tried in turn: tuples
+        owned by this peer are claimed locally, and other tuples are claimed
+        from their owners via RPC. Replicas of tuples whose owners refuse the
+        claim (or do not respond) are removed, and the next candidate is tried.
         
-        # Note, returning value given as input since it was found in the data store
-        # and it is in tuple format, not serialized as in the data store
-        # TODO: Implement mechanism to handle tuple type (resource/handler)
-        if len(value) == 5:
-            extraArgs = []
-            if value[3] == None:
-                extraArgs.append('')
+        @type template: tuple
+        
+        @return: The claimed tuple, or None if none of the matching tuples
+                 could be claimed
+        @rtype: twisted.internet.defer.Deferred
+        """
+        df = self._claimKey(template)
+        df.addCallback(lambda key: key != None and key[1] or None)
+        return df
+    
+    @inlineCallbacks
+    def _claimKey(self, template):
+        """ Claims a tuple matching the template, as in C{claimTuple()}
+        
+        @return: The key of the claimed tuple (which identifies its owner), or
+                 None
+        @rtype: twisted.internet.defer.Deferred
+        """
+        localCandidates = []
+        remoteCandidates = []
+        for key in self._findKeys(template, 0):
+            if key[0] == self.id:
+                localCandidates.append(key)
             else:
-                extraArgs.append(value[3])
-            if value[4] == None:
-                extraArgs.append('')
+                remoteCandidates.append(key)
+        # Prefer owners that are responsive and close by, and spread concurrent
+        # claims from different peers over equally good owners
+        random.shuffle(remoteCandidates)
+        remoteCandidates.sort(key=lambda key: self.contacts.rank(key[0]))
+        for key in localCandidates + remoteCandidates:
+            if key not in self._index:
+                # Consumed while we were waiting for another owner to respond
+                continue
+            ownerID, sTuple = key
+            if ownerID == self.id:
+                claimedTuple = self.claim(sTuple)
             else:
-                extraArgs.append(value[4])
+                claimedTuple = None
+                contact = self.findContact(ownerID)
+                if contact != None:
+                    claimedTuple = yield self._claimFrom(contact, sTuple)
+                self._replicaClaimed(key, claimedTuple != None)
+            if claimedTuple != None:
+                returnValue((ownerID, claimedTuple))
+        returnValue(None)
+    
+    @inlineCallbacks
+    def _claimFrom(self, contact, sTuple):
+        """ Claims a tuple from its owner via RPC
+        
+        @return: The claimed tuple, or None if the owner refused the claim (or
+                 did not respond)
+        @rtype: twisted.internet.defer.Deferred
+        """
+        try:
+            claimedTuple = yield contact.claim(encodeTemplate(sTuple))
+        except protocol.TimeoutError:
+            returnValue(None)
+        if claimedTuple != None:
+            try:
+                claimedTuple = decodeTuple(claimedTuple)
+            except DataFormatError:
+                claimedTuple = None
+        returnValue(claimedTuple)
+    
+    def claimTuples(self, templates):
+        """ Claims a tuple for each of several templates from the tuple space
+        
+        Each template is matched against this peer's data store (preferring
+        tuples owned by this peer, then owners as ranked in C{claimTuple()}),
+        and the claims are sent to each owner in a single C{claimMany()} RPC.
+        Unlike C{claimTuple()}, other candidates are not tried if an owner
+        refuses a claim; replicas of refused tuples are removed.
+        
+        @param templates: The templates of the tuples to claim
+        @type templates: list
+        
+        @return: A list containing, for each template, the claimed tuple, or
+                 None if it could not be claimed
+        @rtype: twisted.internet.defer.Deferred
+        """
+        df = self._claimKeys(templates)
+        df.addCallback(lambda keys: [key != None and key[1] or None for key in keys])
+        return df
+    
+    @inlineCallbacks
+    def _claimKeys(self, templates):
+        """ Claims a tuple for each of several templates, as in
+        C{claimTuples()}
+        
+        @return: A list containing, for each template, the key of the claimed
+                 tuple (which identifies its owner), or None
+        @rtype: twisted.internet.defer.Deferred
+        """
+        results = [None] * len(templates)
+        # { <ownerID>: [(<position>, <tuple>), ...] }
+        claims = {}
+        # The number of copies of each tuple chosen so far: { <key>: <count> }
+        chosen = {}
+        for position, template in enumerate(templates):
+            best = None
+            for key in self._findKeys(template, 0):
+                if chosen.get(key, 0) >= self._copies.get(key, 1):
+                    continue
+                ownerID = key[0]
+                if ownerID == self.id:
+                    best = (key, ownerID)
+                    break
+                if best == None or self.contacts.rank(ownerID) < self.contacts.rank(best[1]):
+                    best = (key, ownerID)
+            if best != None:
+                chosen[best[0]] = chosen.get(best[0], 0) + 1
+                claims.setdefault(best[1], []).append((position, best[0]))
+        
+        for position, key in claims.pop(self.id, []):
+            if self.claim(key[1]) != None:
+                results[position] = key
+        requests = []
+        for ownerID, ownerClaims in claims.items():
+            contact = self.findContact(ownerID)
+            if contact == None:
+                df = defer.succeed([None] * len(ownerClaims))
+            else:
+                df = contact.claimMany([encodeTemplate(key[1]) for position, key in ownerClaims])
+            requests.append(df)
+        responses = yield defer.DeferredList(requests, consumeErrors=True)
+        for (ownerID, ownerClaims), (success, claimedTuples) in zip(claims.items(), responses):
+            if not success:
+                # The owner did not respond
+                claimedTuples = [None] * len(ownerClaims)
+            for (position, key), claimedTuple in zip(ownerClaims, claimedTuples):
+                self._replicaClaimed(key, claimedTuple != None)
+                if claimedTuple != None:
+                    results[position] = key
+        returnValue(results)
+    
+    @inlineCallbacks
+    def takeAll(self, templates, timeout=None):
+        """ Claims a tuple for every one of several templates, or none of
+        them (a transaction)
+        
+        The tuples are claimed as in C{claimTuples()}. If any of the templates
+        could not be claimed, the tuples that were claimed are released back
+        to their owners before waiting to try again, so tuples are never held
+        while waiting for others; peers competing for the same tuples thus
+        cannot deadlock, or pin scarce tuples with partial claims. The next
+        attempt is made once a tuple matching a missing template is put, or
+        after a randomised interval (see
+        C{constants.transactionRetryInterval}), whichever comes first.
+        
+        @param templates: The templates of the tuples to claim
+        @type templates: list
+        @param timeout: The maximum time (in seconds) to wait for all of the
+                        tuples to be claimed; if not specified, wait
+                        indefinitely. If set to 0, try only once.
+        @type timeout: float
+        
+        @return: A list containing the claimed tuple for each template, or
+                 None if they could not all be claimed
+        @rtype: twisted.internet.defer.Deferred
+        """
+        if timeout != None:
+            deadline = reactor.seconds() + timeout
+        while True:
+            keys = yield self._claimKeys(templates)
+            if None not in keys:
+                returnValue([key[1] for key in keys])
+            # Roll back the partial claim
+            releases = [self.releaseTuple(key[1], key[0]) for key in keys if key != None]
+            yield defer.DeferredList(releases, consumeErrors=True)
+            delay = random.uniform(0.5, 1.5) * constants.transactionRetryInterval
+            if timeout != None:
+                if deadline <= reactor.seconds():
+                    returnValue(None)
+                delay = min(delay, deadline - reactor.seconds())
+            yield self._addWaiter(templates[keys.index(None)], False, 1, delay).deferred
+    
+    @inlineCallbacks
+    def releaseTuple(self, sTuple, originalPublisherID=None):
+        """ Releases a tuple obtained with C{claimTuple()} back to its owner
+        
+        @param originalPublisherID: The node ID of the tuple's owner; if not
+                                    specified, it is determined as in C{put()}
+        @type originalPublisherID: str
+        
+        @return: True if the owner accepted the tuple back
+        @rtype: twisted.internet.defer.Deferred
+        """
+        ownerID = self._tupleOwner(sTuple, originalPublisherID)
+        if ownerID == self.id:
+            returnValue(self.release(sTuple))
+        contact = self.findContact(ownerID)
+        released = False
+        if contact != None:
+            try:
+                released = yield contact.release(encodeTuple(sTuple))
+            except protocol.TimeoutError:
+                released = False
+        if released:
+            # Restore our replica, so that local waiters can claim it again
+            self.put(sTuple, ownerID)
+            self._expectChange(self._tupleKey(sTuple, ownerID), 1)
+        returnValue(released)
+    
+    @inlineCallbacks
+    def claimFederated(self, template):
+        """ Claims a tuple matching the template from this peer's site, or
+        from another site in hierarchy mode
+        
+        The tuple is claimed from this peer's site as with C{claimTuple()} if
+        possible; otherwise the claim is forwarded to the super-node of the
+        site, which claims it from the other sites that published matching
+        tuples (see C{federation.Federation.claim()}).
+        
+        @note: A claim forwarded by another peer of the site must be granted
+               within the RPC timeout
+        
+        @type template: tuple
+        
+        @return: The claimed tuple, or None if none of the matching tuples
+                 could be claimed
+        @rtype: twisted.internet.defer.Deferred
+        """
+        sTuple = yield self.claimTuple(template)
+        if sTuple != None or self.site == None:
+            returnValue(sTuple)
+        if self.federation != None:
+            superNodeID = self.id
+            sTuple = yield self.federation.claim(template)
+        else:
+            contact = self._superNodeContact()
+            if contact == None:
+                returnValue(None)
+            superNodeID = contact.id
+            try:
+                sTuple = yield contact.forwardClaim(encodeTemplate(template))
+            except protocol.TimeoutError:
+                sTuple = None
+            if sTuple != None:
+                try:
+                    sTuple = decodeTuple(sTuple)
+                except DataFormatError:
+                    sTuple = None
+        if sTuple != None:
+            self._siteClaims.setdefault(self._tupleKey(sTuple), []).append(superNodeID)
+        returnValue(sTuple)
+    
+    @inlineCallbacks
+    def releaseFederated(self, sTuple):
+        """ Releases a tuple obtained with C{claimFederated()} back to its
+        owner, through the super-node that claimed it if it is owned by
+        another site
+        
+        @return: True if the owner accepted the tuple back
+        @rtype: twisted.internet.defer.Deferred
+        """
+        key = self._tupleKey(sTuple)
+        superNodeIDs = self._siteClaims.get(key)
+        if superNodeIDs == None:
+            released = yield self.releaseTuple(sTuple)
+            returnValue(released)
+        superNodeID = superNodeIDs.pop()
+        if len(superNodeIDs) == 0:
+            del self._siteClaims[key]
+        released = False
+        if superNodeID == self.id:
+            if self.federation != None:
+                released = yield self.federation.release(sTuple)
+        else:
+            contact = self.findContact(superNodeID)
+            if contact != None:
+                try:
+                    released = yield contact.forwardRelease(encodeTuple(sTuple))
+                except protocol.TimeoutError:
+                    released = False
+        returnValue(bool(released))
+    
+    @rpcmethod
+    def forwardClaim(self, template, _rpcNodeID=None, _rpcNodeContact=None):
+        """ Used by the peers of this super-node's site via RPC to claim a
+            tuple from the other sites
             
-            returnTuple = (value[0], value[1], self.dataStore.originalPublisherID(mainKey), extraArgs[0], extraArgs[1])
+            @param template: The template, in the wire format
+            
+            @return: Deferred, which fires with the claimed tuple (in the
+                     wire format), or None
+        """
+        if self.federation == None:
+            return None
+        claimantID = _rpcNodeID or self.id
+        def claimed(sTuple):
+            if sTuple == None:
+                return None
+            # The tuple is released if the claimant fails, or is not heard
+            # from within the claim lease
+            self._renewClaims(claimantID)
+            return encodeTuple(sTuple)
+        df = self.federation.claim(decodeTemplate(template), claimantID)
+        df.addCallback(claimed)
+        return df
+    
+    @rpcmethod
+    def forwardRelease(self, sTuple, _rpcNodeID=None, _rpcNodeContact=None):
+        """ Used by the peers of this super-node's site via RPC to release a
+            tuple claimed from another site with C{forwardClaim()}
+            
+            @param sTuple: The tuple, in the wire format
+            
+            @return: Deferred, which fires with whether the tuple was released
+        """
+        if self.federation == None:
+            return False
+        return self.federation.release(decodeTuple(sTuple), _rpcNodeID)
+    
+    def _replicaClaimed(self, key, granted):
+        """ Updates the replica of a tuple once its owner has responded to a
+            claim
+        
+        If the claim was granted, one copy of the replica is removed now, and
+        the owner's own record of the change is skipped when it arrives.
+        Otherwise the owner has no copies left (or did not respond), and the
+        replica is removed altogether.
+        """
+        if key not in self._index:
+            return
+        if granted:
+            self._removeKey(key)
+            self._expectChange(key, -1)
+        else:
+            self._removeKey(key, allCopies=True)
+    
+    def _expectChange(self, key, copies):
+        """ Records a change made to a replica ahead of its owner """
+        pending = self._pendingChanges.get(key, 0) + copies
+        if pending == 0:
+            del self._pendingChanges[key]
         else:
-            returnTuple = (value[0], value[1], self.dataStore.originalPublisherID(mainKey))
-        return returnTuple
+            self._pendingChanges[key] = pending
+    
+    def _changeExpected(self, key, copies):
+        """ Checks whether a change received from the owner of a replica was
+            already made ahead of it (see C{_expectChange()}), and if so,
+            marks it as seen
         
+        @rtype: bool
+        """
+        pending = self._pendingChanges.get(key, 0)
+        if pending * copies <= 0:
+            return False
+        self._expectChange(key, -copies)
+        return True
     
     @rpcmethod 
     def getOwnedTuples(self):
         """ Used to obtain all of the tuples owned by this peer via RPC, 
                         
             @return: a list containing all of the tuples and their owner ID's 
-                     in the following format [(ownerID, tuple1), ..., (ownerID, tuple n)]
+                     in the following format [(ownerID, tuple1), ..., (ownerID, tuple n)],
+                     with the tuples in the wire format
             @rtype: list
         """
         
-        dataStoreKeys = self.dataStore.keys()
         tuples = []
         
-        for key in dataStoreKeys:
-            if (self.dataStore.originalPublisherID(key) == self.id):           
-                idTuple = []
-                idTuple.append(self.id)
-                idTuple.append(self.dataStore.__getitem__(key))
-                tuples.append(idTuple)
+        for key in self.dataStore.publisherKeys(self.id):
+            # Every copy of a tuple is listed
+            tuples.extend([[self.id, encodeTuple(key[1])]] * self._copies.get(key, 1))
         
         return tuples
     
+    @rpcmethod
+    def getChanges(self, digest):
+        """ Used to obtain the changes to the tuples owned by this peer via
+            RPC, since the caller last synchronised with this peer
+            
+            @param digest: The synchronisation state of the caller, as a list
+                           of C{[ownerID, epoch, sequence]} entries (one for
+                           each owner the caller holds tuples of)
+            @type digest: list
+            
+            @return: A list in the format C{[epoch, sequence, isSnapshot,
+                     changes]}, where C{changes} is a list of
+                     C{[operation, tuple, version]} entries (with the tuple
+                     in the wire format, see C{wireformat.encodeTuple()}),
+                     operation is "put" or "take", and version is the version
+                     of the tuple after the change (0 if no copies of it are
+                     left). If the caller is not known to be up to
+                     date with a recent enough change of this peer's current
+                     epoch, C{isSnapshot} is set, and C{changes} contains a
+                     "put" entry for every tuple owned by this peer instead.
+            @rtype: list
+            
+            @note: The synchronisation state is not persisted: after either
+                   peer restarts (even with a persistent data store), the
+                   next synchronisation between them is a full snapshot
+        """
+        sinceSequence = None
+        for ownerID, epoch, sequence in digest:
+            if ownerID == self.id and epoch == self._epoch:
+                sinceSequence = sequence
+        if len(self._changeLog) > 0:
+            oldestSequence = self._changeLog[0][0]
+        else:
+            oldestSequence = self._sequence + 1
+        if sinceSequence != None and oldestSequence <= sinceSequence + 1:
+            changes = []
+            for sequence, operation, sTuple, version in self._changeLog[sinceSequence - oldestSequence + 1:]:
+                changes.append([operation, encodeTuple(sTuple), version])
+            return [self._epoch, self._sequence, False, changes]
+        return [self._epoch, self._sequence, True, self._snapshot(self.dataStore.publisherKeys(self.id))]
+    
+    def _snapshot(self, keys):
+        """ Lists a "put" change for every copy of the tuples identified by
+            C{keys}, as in C{getChanges()} """
+        snapshot = []
+        for key in keys:
+            snapshot.extend([['put', encodeTuple(key[1]), self._versions.get(key, 0)]] * self._copies.get(key, 1))
+        return snapshot
+    
+    def getDigest(self):
+        """ Returns the synchronisation state of this peer, as passed to
+            C{getChanges()} """
+        return [[ownerID, epoch, sequence] for ownerID, (epoch, sequence) in self._syncState.items()]
+    
+    def _applyChanges(self, ownerID, changes):
+        """ Applies the result of a C{getChanges()} RPC to the replicas of
+            the tuples owned by C{ownerID} """
+        epoch, sequence, isSnapshot, changeList = changes
+        if ownerID == self.id:
+            return
+        self._applyReplicaChanges(ownerID, changeList, isSnapshot)
+        self._syncState[ownerID] = (epoch, sequence)
+        # The owner is alive, so its tuples remain valid for another lease period
+        self._renewLease(ownerID)
+    
+    def _applyReplicaChanges(self, ownerID, changeList, isSnapshot, partitionKey=None):
+        """ Applies a list of C{[operation, tuple, version]} changes (with
+            the tuples in the wire format) to the replicas of the tuples owned
+            by C{ownerID}, in order
+            
+            @param isSnapshot: If set, C{changeList} contains a "put" entry
+                               for each copy of every tuple of the owner (in
+                               the partition C{partitionKey}, if specified),
+                               and the replicas are made to match it exactly
+            @type isSnapshot: bool
+        """
+        if not isSnapshot:
+            for operation, wireTuple, version in changeList:
+                key = self._tupleKey(decodeTuple(wireTuple), ownerID)
+                if operation == 'put':
+                    if not self._changeExpected(key, 1):
+                        self.put(key[1], ownerID, version)
+                    elif key in self._index:
+                        self._setVersion(key, version)
+                elif operation == 'take':
+                    if not self._changeExpected(key, -1) and key in self._index:
+                        self._removeKey(key, version=version)
+                    elif key in self._index:
+                        self._setVersion(key, version)
+            return
+        inPartition = lambda key: partitionKey == None or self._partitionKey(key[1]) == partitionKey
+        # The snapshot supersedes any changes made ahead of the owner
+        for key in self._pendingChanges.keys():
+            if key[0] == ownerID and inPartition(key):
+                del self._pendingChanges[key]
+        # { <key>: <copies> }
+        snapshot = {}
+        versions = {}
+        for operation, wireTuple, version in changeList:
+            key = self._tupleKey(decodeTuple(wireTuple), ownerID)
+            snapshot[key] = snapshot.get(key, 0) + 1
+            versions[key] = version
+        for key in self.dataStore.publisherKeys(ownerID):
+            if not inPartition(key):
+                continue
+            surplus = self._copies.get(key, 1) - snapshot.pop(key, 0)
+            if surplus < 0:
+                snapshot[key] = -surplus
+            for i in range(surplus):
+                self._removeKey(key)
+        puts = []
+        for key, copies in snapshot.iteritems():
+            puts.extend([key[1]] * copies)
+        self.putMany(puts, ownerID)
+        for key, version in versions.iteritems():
+            if key in self._index:
+                self._setVersion(key, version)
+    
+    def _compactDataStore(self):
+        """ Runs a bounded step of the data store's compaction (see
+            C{constants.compactionStepSize}), and schedules the next one on
+            the reactor until the compaction is complete """
+        self._compactionCall = None
+        self.dataStore.compact(maxBytes=constants.compactionStepSize)
+        if self.dataStore.compactionPending():
+            self._compactionCall = reactor.callLater(0, self._compactDataStore)
+    
+    def _renewLease(self, ownerID):
+        """ Extends the lease on the replicas of the tuples owned by C{ownerID} """
+        if ownerID != self.id:
+            self._leaseScheduler.schedule(ownerID, constants.tupleLease)
+    
+    def _leaseExpired(self, ownerID):
+        """ Evicts the replicas of the tuples of an owner that has not renewed
+            its lease (i.e. has not answered a synchronisation request) in time """
+        self.purgeOwner(ownerID)
+    
+    def purgeOwner(self, ownerID):
+        """ Removes the replicas of all of the tuples published by a peer, in
+            a single data store operation
+            
+            This is used when a peer is known to have left the network (or
+            died), and when the lease on its tuples expires. If the peer comes
+            back, a full snapshot of its tuples is fetched.
+            
+            @note: The tuples owned by this peer itself are never purged
+            
+            @return: The number of tuples removed
+            @rtype: int
+        """
+        if ownerID == self.id:
+            return 0
+        keys = self.dataStore.publisherKeys(ownerID)
+        self.dataStore.removeItems(keys)
+        removed = 0
+        for key in keys:
+            self._index.remove(key)
+            self._summary.remove(key[1])
+            self._uncacheReplica(key)
+            self._versions.pop(key, None)
+            removed += self._copies.pop(key, 1)
+        for key in self._pendingChanges.keys():
+            if key[0] == ownerID:
+                del self._pendingChanges[key]
+        self._leaseScheduler.cancel(ownerID)
+        self._syncState.pop(ownerID, None)
+        self._watchers.pop(ownerID, None)
+        self._peerSummaries.pop(ownerID, None)
+        return removed
+    
+    @rpcmethod
+    def watch(self, templates, digest, _rpcNodeID=None, _rpcNodeContact=None):
+        """ Subscribes the calling peer to changes of the tuples owned by this
+            peer
+            
+            Whenever a tuple matching one of the templates is put or taken,
+            the changes are pushed to the caller via C{notifyChanges()}. Every
+            call replaces the caller's previous templates; an empty list
+            cancels the subscription.
+            
+            @param templates: The templates of the tuples to watch, in the
+                              wire format
+            @type templates: list
+            @param digest: The synchronisation state of the caller, as passed
+                           to C{getChanges()}
+            @type digest: list
+            
+            @return: The changes the caller has not yet seen, as returned by
+                     C{getChanges()}
+            @rtype: list
+        """
+        changes = self.getChanges(digest)
+        if _rpcNodeContact == None or _rpcNodeID == self.id:
+            return changes
+        if len(templates) == 0:
+            self._watchers.pop(_rpcNodeID, None)
+            return changes
+        watcher = self._watchers.get(_rpcNodeID)
+        if watcher == None:
+            watcher = _Watcher(_rpcNodeContact)
+            self._watchers[_rpcNodeID] = watcher
+        watcher.contact = _rpcNodeContact
+        watcher.templates = [decodeTemplate(template) for template in templates]
+        watcher.sentSequence = self._sequence
+        return changes
+    
+    @rpcmethod
+    def notifyChanges(self, sinceSequence, changes, _rpcNodeID=None, _rpcNodeContact=None):
+        """ Used by the owner of watched tuples to push its changes via RPC
+            
+            @param sinceSequence: The sequence number of the last change the
+                                  owner pushed to this peer before
+            @type sinceSequence: int
+            @param changes: The changes since then, as returned by
+                            C{getChanges()}
+            @type changes: list
+        """
+        ownerID = _rpcNodeID
+        if ownerID == None or ownerID == self.id:
+            return
+        epoch, sequence, isSnapshot, changeList = changes
+        if not isSnapshot:
+            state = self._syncState.get(ownerID)
+            if state == None or state[0] != epoch or state[1] < sinceSequence:
+                # Some changes were missed; fetch them from the owner
+                self._resynchronise(ownerID, _rpcNodeContact)
+                return
+            if state[1] >= sequence:
+                # Already seen (e.g. during an anti-entropy pass)
+                self._renewLease(ownerID)
+                return
+            changes = [epoch, sequence, False, changeList[state[1] - sinceSequence:]]
+        self._applyChanges(ownerID, changes)
+    
+    def subscribe(self, *templates):
+        """ Keeps the replicas of remote tuples matching the templates current
+        
+        The owners of such tuples push every change to them to this peer, so
+        they can be read locally without any further network round trips.
+        
+        @param templates: The templates (tuples) to subscribe to
+        
+        @return: Deferred, will call-back once all contacts have responded
+                 (or timed out)
+        @rtype: twisted.internet.defer.Deferred
+        """
+        for template in templates:
+            if template not in self._subscriptions:
+                self._subscriptions.append(template)
+        return self._synchronise(list(self.contacts))
+    
+    def unsubscribe(self, *templates):
+        """ Stops the changes to remote tuples matching the templates from
+            being pushed to this peer
+        
+        @rtype: twisted.internet.defer.Deferred
+        """
+        for template in templates:
+            if template in self._subscriptions:
+                self._subscriptions.remove(template)
+        return self._synchronise(list(self.contacts))
+    
+    def _synchronise(self, contacts):
+        """ Applies the changes of the given contacts' tuples, and (re)sends
+            them this peer's subscriptions """
+        def applyChanges(changes, contact):
+            self._applyChanges(contact.id, changes)
+        
+        digest = self.getDigest()
+        templates = [encodeTemplate(template) for template in self._subscriptions]
+        dfs = []
+        for contact in contacts:
+            df = contact.watch(templates, digest)
+            df.addCallback(applyChanges, contact)
+            dfs.append(df)
+        # Contacts that fail to respond are simply retried in the next pass
+        return defer.DeferredList(dfs, consumeErrors=True)
+    
+    def _resynchronise(self, ownerID, contact=None):
+        if contact == None:
+            contact = self.findContact(ownerID)
+        if contact != None:
+            self._synchronise([contact])
+    
+    def _notifyWatchers(self, sTuple):
+        """ Schedules a push of the latest changes to the watchers of a tuple
+        
+        Changes made in the same reactor iteration are pushed together.
+        """
+        for watcherID, watcher in self._watchers.items():
+            if watcherID in self._pendingPushes:
+                continue
+            for template in watcher.templates:
+                if templateMatches(template, sTuple):
+                    self._pendingPushes.add(watcherID)
+                    break
+        if len(self._pendingPushes) > 0 and self._pushCall == None:
+            self._pushCall = reactor.callLater(0, self._pushChanges)
+    
+    def _pushChanges(self):
+        def dropWatcher(error, watcherID, watcher):
+            # The watcher is unreachable; it will subscribe again during its
+            # next anti-entropy pass
+            if self._watchers.get(watcherID) is watcher:
+                del self._watchers[watcherID]
+        
+        self._pushCall = None
+        pendingPushes = self._pendingPushes
+        self._pendingPushes = set()
+        for watcherID in pendingPushes:
+            watcher = self._watchers.get(watcherID)
+            if watcher == None:
+                continue
+            changes = self.getChanges([[self.id, self._epoch, watcher.sentSequence]])
+            df = watcher.contact.notifyChanges(watcher.sentSequence, changes)
+            df.addErrback(dropWatcher, watcherID, watcher)
+            watcher.sentSequence = self._sequence
+    
     @rpcmethod
     def getAllTuples(self):
         """ Used to obtain all of the tuples stored at a remote peer via RPC, 
                        
             @return: a list containing all of the tuples and their owner ID's 
-                     in the following format [(ownerID, tuple1), ..., (ownerID, tuple n)]
+                     in the following format [(ownerID, tuple1), ..., (ownerID, tuple n)],
+                     with the tuples in the wire format
             @rtype: list
         """
-        dataStoreKeys = self.dataStore.keys()
         tuples = []
         
-        for key in dataStoreKeys:
-            idTuple = []
-            idTuple.append(self.dataStore.originalPublisherID(key))
-            idTuple.append(self.dataStore.__getitem__(key))
-            tuples.append(idTuple)
+        for key in self.dataStore:
+            ownerID, sTuple = key
+            tuples.extend([[ownerID, encodeTuple(sTuple)]] * self._copies.get(key, 1))
             
         return tuples
             
     def findContact(self, contactID):
-        """ Used to search for a contact inside of this peers contactList
+        """ Used to search for a contact inside of this peers contact table
             @return: a contact if it was found
         """
+        return self.contacts.get(contactID)
+    
+    def internContact(self, contactID, address, port):
+        """ Returns the contact object for a node, adding the node to the
+            contact table if it is not known yet
+            
+            This is used by the network protocol for every received message,
+            so that liveness information is recorded on a single object per
+            node.
+            
+            @rtype: rpc.contact.Contact
+        """
+        if contactID in self._claimScheduler:
+            self._renewClaims(contactID)
+        return self.contacts.intern(contactID, address, port, self._protocol)
+    
+    
+    @rpcmethod
+    def getSummaries(self, versions, _rpcNodeID=None, _rpcNodeContact=None):
+        """ Used by other peers via RPC to fetch the Bloom filter summaries of
+            the tuples held by this peer that changed since they last did
+            
+            @param versions: The versions of the summaries the calling peer
+                             has, as C{{<group key>: <version>}} (see
+                             C{bloom.groupKey()})
+            @type versions: dict
+            
+            @return: The changed summaries (see C{bloom.TupleSummary.changes()})
+            @rtype: list
+        """
+        if not isinstance(versions, dict):
+            raise DataFormatError("Error, expected the versions of the summaries as input")
+        return self._summary.changes(versions)
+    
+    def refreshSummaries(self, contacts=None):
+        """ Fetches the changes to the tuple summaries of other peers
         
-        #print 'searching for ' + str((contactID,))
-        for contact in self.contactsList:
-            #print 'contact ' + str((contact.id,))
-                       
-            if contact.id == contactID:
-                return contact
+            A distributed lookup (see C{readDistributed()}) only queries the
+            contacts whose summaries may contain a match for its template, or
+            whose summaries have not been fetched within the refresh interval
+            (or at all). Summaries are refreshed with every anti-entropy
+            pass, so tuples put at a peer since then may be missed until the
+            next one, unless the lookup queries every contact.
             
+            @param contacts: The peers to fetch the summaries of; defaults to
+                             all contacts
+            @type contacts: list
+            
+            @return: Deferred, will call-back once all contacts have responded
+                     (or timed out)
+            @rtype: twisted.internet.defer.Deferred
+        """
+        def applyChanges(changes, contactID):
+            summary = self._peerSummaries.get(contactID)
+            if summary == None:
+                summary = self._peerSummaries[contactID] = PeerSummary()
+            summary.update(changes)
+            summary.updated = reactor.seconds()
+        
+        if contacts == None:
+            contacts = list(self.contacts)
+        dfs = []
+        for contact in contacts:
+            summary = self._peerSummaries.get(contact.id)
+            if summary == None:
+                versions = {}
+            else:
+                versions = summary.versions()
+            df = contact.getSummaries(versions)
+            df.addCallback(applyChanges, contact.id)
+            dfs.append(df)
+        return defer.DeferredList(dfs, consumeErrors=True)
+    
+    def _mayHold(self, peerID, template):
+        """ Checks whether a peer may hold tuples matching a template,
+            according to its tuple summary (if it has been fetched within the
+            refresh interval) """
+        summary = self._peerSummaries.get(peerID)
+        if summary == None or reactor.seconds() - summary.updated > constants.refreshInterval:
+            return True
+        return summary.mayMatch(template)
     
     def refreshDataStore(self):
         """ Refreshs the datastore, ensuring that the tuples obtained from remote peers are still valid and that
-            those peers are still alive """
-        
-        # TODO: Implement this
+            those peers are still alive
+            
+            This is an anti-entropy pass: every contact is sent this peer's
+            synchronisation digest, and replies with the changes to its tuples
+            that have not been applied here yet. Subscriptions are sent along,
+            so that contacts which lost them (e.g. after a restart) resume
+            pushing changes. In partitioned mode, this peer instead
+            republishes its tuples to the peers currently responsible for
+            them. The tuple summaries of the contacts are refreshed as well
+            (see C{refreshSummaries()}), and in hierarchy mode the super-node
+            of the site is elected again, and publishes the site's capacity
+            to the other sites (see C{_electSuperNode()}). The data store is also given the
+            opportunity to compact itself, in steps that are interleaved with
+            other events (see C{_compactDataStore()}).
+            
+            @return: Deferred, will call-back once all contacts have responded
+                     (or timed out)
+            @rtype: twisted.internet.defer.Deferred
+        """
+        if self._compactionCall == None:
+            self._compactDataStore()
+        if self.partitioned:
+            # Replicas are pushed by their owners rather than pulled from
+            # every contact
+            df = self._republish()
+        else:
+            contacts = list(self.contacts)
+            df = defer.DeferredList([self._synchronise(contacts), self.refreshSummaries(contacts)])
+        if self.site != None:
+            df = defer.DeferredList([df, self._electSuperNode()])
+        return df
     
     def joinNetwork(self, knownNodeAddresses=None):
         """ 
@@ -362,12 +1796,72 @@ class StaticTupleSpacePeer():
         @param knownNodeAddresses: A sequence of tuples containing IP address
                                    information for existing nodes on the
                                    Kademlia network, in the format:
-                                   C{(<ip address>, (udp port>)}
+                                   C{(<ip address>, (udp port>)}; if not
+                                   specified in multicast discovery mode, the
+                                   first peer found on the local network is
+                                   used
         @type knownNodeAddresses: tuple
         
         @return: Deferred, will call-back once join has completed
         @rtype: twisted.internet.defer.Deferred
         """
+        # Prepare the underlying Kademlia protocol
+        if self.multicastDiscovery:
+            self._listeningPort = twisted.internet.reactor.listenMulticast(self.port, self._protocol, listenMultiple=True) #IGNORE:E1101
+            self._listeningPort.joinGroup(constants.multicastGroup)
+        else:
+            self._listeningPort = twisted.internet.reactor.listenUDP(self.port, self._protocol) #IGNORE:E1101
+                   
+        self._joinDeferred = defer.Deferred() 
+        if self.partitioned:
+            self._joinDeferred.addCallback(self._joinPartitions)
+        else:
+            self._joinDeferred.addCallback(self._fetchSummaries)
+        if self.site != None:
+            self._joinDeferred.addCallback(self._joinSite)
+        if knownNodeAddresses == None and self.multicastDiscovery:
+            df = self.discoverPeers()
+            df.addCallback(self._contactKnownNodes)
+        else:
+            self._contactKnownNodes(knownNodeAddresses)
+        
+        # Periodically repair any divergence between our replicas and their owners' tuples
+        if self._refreshCall == None:
+            self._refreshCall = task.LoopingCall(self.refreshDataStore)
+            self._refreshCall.clock = reactor
+            self._refreshCall.start(constants.refreshInterval, now=False)
+        self.membership.start()
+        return self._joinDeferred
+    
+    def discoverPeers(self):
+        """ Finds a peer on the local network, by multicasting a ping to the
+        peers listening on the multicast group C{constants.multicastGroup}
+        with the same UDP port as this peer
+        
+        All of the peers that answer are added to the contact table; the
+        request also announces this peer to every one of them.
+        
+        @note: Since the peers share their UDP port, only one peer per host
+               can be discovered
+        
+        @return: Deferred, which fires with a list containing the address of
+                 the first peer to answer, as C{(<ip address>, <udp port>)},
+                 or with C{None} if no peer answers within the RPC timeout
+        @rtype: twisted.internet.defer.Deferred
+        """
+        def discovered(responseTuple):
+            return [responseTuple[1]]
+        def noPeers(error):
+            error.trap(protocol.TimeoutError)
+            return None
+        group = Contact(self._generateID(), constants.multicastGroup, self.port, self._protocol)
+        df = group.ping(rawResponse=True)
+        df.addCallbacks(discovered, noPeers)
+        return df
+    
+    def _contactKnownNodes(self, knownNodeAddresses):
+        """ Polls the known nodes the peer joins the network through, and
+        fires C{self._joinDeferred} once they have answered """
         def addContact(responseTuple):
             """ adds a contact once it has responded to the remote procedure call """
             responseMsg = responseTuple[0]
@@ -379,8 +1873,8 @@ class StaticTupleSpacePeer():
             #print 'address ' + str(originatingAddress)
             
             if contactID != None:
-                activeContact = Contact(contactID, originatingAddress[0], originatingAddress[1], self._protocol)
-                self.contactsList.append(activeContact)
+                activeContact = self.internContact(contactID, originatingAddress[0], originatingAddress[1])
+                joinedContacts.append(activeContact)
                 
                 
                                 
@@ -389,30 +1883,19 @@ class StaticTupleSpacePeer():
                     self._joinDeferred.errback(failure.Failure(Exception('Error response from RPC call: ' + str(responseMsg.response))))
                     #print 'Error response from RPC call: ' + str(responseMsg.response)
                 else:
-                    # Check if any tuples were returned by this contact
+                    # Check if any tuple changes were returned by this contact
                     response = responseMsg.response
                     if isinstance(response, list):
-                        # obtain the tuples and their owner ID's
-                        for item in response:
-                            # Place this item into the local data store
-                            ownerID = item[0]
-                            tupleValue = item[1]
-                            self.put(tupleValue, ownerID)
-                            
-#                        print 'received tuples'
-#                        print response
-#                        
-#                        localTuples = self.getAllTuples()
-#                        print 'locally stored tuples'
-#                        for tuple in localTuples:
-#                            print str(tuple)
+                        if not self.partitioned:
+                            # Place the contact's tuples into the local data store
+                            self._applyChanges(contactID, response)
                     else:
                         self._joinDeferred.errback(failure.Failure(Exception('RPC response from contact invalid, expected a list')))
                         
                 # Check if all the contacts have been reached
-                if len(self.contactsList) == len(knownNodeAddresses):
+                if len(joinedContacts) == len(knownNodeAddresses):
                     # invoke joinDeferred callback to signal that join has completed
-                    self._joinDeferred.callback(self.contactsList)
+                    self._joinDeferred.callback(joinedContacts)
         
         def checkInitStatus(error): 
             """ Invoked when RPC attempt to contact fails
@@ -435,8 +1918,8 @@ class StaticTupleSpacePeer():
                 tentativeContacts.remove(cont)
           
             # Check if all the other contacts have responded (Thus join completed)
-            if (len(self.contactsList) > 0) and  \
-                (len(self.contactsList) == (len(knownNodeAddresses) - (len(knownNodeAddresses) - len(tentativeContacts)))):
+            if (len(joinedContacts) > 0) and  \
+                (len(joinedContacts) == (len(knownNodeAddresses) - (len(knownNodeAddresses) - len(tentativeContacts)))):
                 # invoke joinDeferred errback to signal that join did not complete successfully
                 self._joinDeferred.errback(failure.Failure(Exception('Not all contacts responded')))
             # Check if all of the contacts did not respond
@@ -445,46 +1928,718 @@ class StaticTupleSpacePeer():
                 self._joinDeferred.errback(failure.Failure(Exception('None of the contacts could be reached')))
                 # TODO: log this error
                 
-        # Prepare the underlying Kademlia protocol
-        self._listeningPort = twisted.internet.reactor.listenUDP(self.port, self._protocol) #IGNORE:E1101
-                   
-        self._joinDeferred = defer.Deferred() 
         tentativeContacts = []
+        joinedContacts = []
         
         # Create temporary contact information for the list of addresses of known nodes
         if knownNodeAddresses != None:
-            bootstrapContacts = []
+            digest = self.getDigest()
             for address, port in knownNodeAddresses:
                 contact = Contact(self._generateID(), address, port, self._protocol)
                 
                 tentativeContacts.append(contact)
                                                 
-                # Check that the contact exists, and obtain its actual id and a list of all the tuples stored 
-                # by this contact
-                rpcMethod = getattr(contact, 'getOwnedTuples')
-                df = rpcMethod(rawResponse=True)
+                # Check that the contact exists, and obtain its actual id and the changes to the tuples
+                # it owns since we last synchronised with it (all of them if we never have); in
+                # partitioned mode, obtain the contacts it knows close to this peer instead
+                if self.partitioned:
+                    df = contact.findNode(self.id, rawResponse=True)
+                else:
+                    df = contact.getChanges(digest, rawResponse=True)
                 df.addCallback(addContact)
                 df.addErrback(checkInitStatus)
         # if no known contacts, just call-back without trying to connect to peers
         else:
             self._joinDeferred.callback(None)
-                                
-                #self.contactsList.append(contact)
+            
+    def _fetchSummaries(self, joinedContacts):
+        """ Fetches the tuple summaries of the contacts once the peer has
+            joined the network """
+        self.refreshSummaries()
+        return joinedContacts
+            
+    def _joinPartitions(self, joinedContacts):
+        """ Completes joining the network in partitioned mode: looks up the
+            peers close to this peer to fill the routing table, and publishes
+            this peer's tuples to the peers responsible for them """
+        df = self._iterativeFind(self.id)
+        df.addCallback(lambda closestContacts: self._republish())
+        df.addCallback(lambda result: joinedContacts)
+        return df
+    
+    def _joinSite(self, joinedContacts):
+        """ Elects the super-node of the site once the peer has joined the
+            network in hierarchy mode """
+        df = self._electSuperNode()
+        df.addCallback(lambda result: joinedContacts)
+        return df
+    
+    def _electSuperNode(self):
+        """ Determines whether this peer is the super-node of its site
+        
+            A peer configured as the super-node always is one; otherwise, the
+            peer with the lowest node ID among this peer and its contacts is
+            elected, unless a configured super-node has announced itself. The
+            super-node announces itself with a C{('supernode', <site>,
+            <nodeID>, <configured>)} tuple, and publishes the capacity of the
+            site to the other sites; a peer that is no longer elected takes
+            its tuple back and leaves the federation.
+            
+            @return: Deferred, which fires once the capacity of the site has
+                     been published (if this peer is the super-node)
+            @rtype: twisted.internet.defer.Deferred
+        """
+        if self.superNode != None:
+            elected = self.superNode
+        else:
+            elected = self.id == min([self.id] + [contact.id for contact in self.contacts])
+            for sTuple in self.readIfExists(('supernode', self.site, str, None), 0):
+                if sTuple[3] and sTuple[2] != self.id:
+                    elected = False
+        if elected:
+            if self.federation == None:
+                self.federation = Federation(self, self.federationPort, self._federationProtocol)
+                self.put(('supernode', self.site, self.id, self.superNode == True))
+                return self.federation.start(self.federationAddresses)
+            return self.federation.publishSummary()
+        elif self.federation != None:
+            self.federation.stop()
+            self.federation = None
+            self.getIfExists(('supernode', self.site, self.id, None))
+        return defer.succeed(None)
+    
+    def _superNodeContact(self):
+        """ Returns the contact of the super-node of this peer's site, or
+            None if it is not known """
+        for sTuple in self.readIfExists(('supernode', self.site, str, None), 0):
+            contact = self.findContact(sTuple[2])
+            if contact != None:
+                return contact
+        return None
+    
+    def _siteSummary(self):
+        """ Aggregates the tuples held by this peer (all the tuples of the
+            site, unless it runs in partitioned mode) into the capacity
+            summary the super-node publishes to the other sites
+            
+            @return: A sorted list of C{[<group key>, <arity>, <copies>]}
+                     entries, where the group of a tuple is its first
+                     C{constants.partitionFields} fields (see
+                     C{bloom.groupKey()})
+            @rtype: list
+        """
+        capacity = {}
+        for key in self.dataStore.keys():
+            sTuple = key[1]
+            if sTuple[:1] == ('supernode',):
+                continue
+            entry = (groupKey(tuple(sTuple[:constants.partitionFields])), len(sTuple))
+            capacity[entry] = capacity.get(entry, 0) + self._copies.get(key, 1)
+        return sorted([[key, arity, copies] for (key, arity), copies in capacity.iteritems()])
+    
+    @rpcmethod
+    def findNode(self, key, _rpcNodeID=None, _rpcNodeContact=None):
+        """ Used by iterative lookups via RPC to find the contacts of this
+            peer closest to a key (a node ID or a partition key)
+            
+            @return: Up to C{constants.k} contacts, closest first, in the format
+                     C{[contactID, address, port]}
+            @rtype: list
+        """
+        closestContacts = self.contacts.findCloseContacts(key, constants.k, _rpcNodeID)
+        return [[contact.id, contact.address, contact.port] for contact in closestContacts]
+    
+    @inlineCallbacks
+    def _iterativeFind(self, key):
+        """ Finds the peers closest to a key (a node ID or a partition key)
+        
+        In partitioned mode, the closest contacts known are asked for the
+        contacts they know closest to the key, C{constants.alpha} at a time,
+        until the C{constants.k} closest peers found have all responded. In
+        the default (fully replicated) mode, every peer is a neighbour of
+        every other one, and all contacts are returned.
         
-        # TODO: schedule a call to a statusCheckMethod which ensures that contacts are active
+        @return: The closest peers that responded, closest first
+        @rtype: twisted.internet.defer.Deferred
+        """
+        if not self.partitioned:
+            returnValue(list(self.contacts))
+        keyDistance = lambda contact: distance(key, contact.id)
+        shortlist = self.contacts.findCloseContacts(key, constants.k)
+        knownIDs = set([self.id] + [contact.id for contact in shortlist])
+        queriedIDs = set()
+        closestContacts = []
+        while True:
+            shortlist.sort(key=keyDistance)
+            candidates = [contact for contact in shortlist[:constants.k] if contact.id not in queriedIDs][:constants.alpha]
+            if len(candidates) == 0:
+                break
+            for contact in candidates:
+                queriedIDs.add(contact.id)
+            responses = yield defer.DeferredList([contact.findNode(key) for contact in candidates], consumeErrors=True)
+            for contact, (success, result) in zip(candidates, responses):
+                if not success:
+                    shortlist.remove(contact)
+                    continue
+                closestContacts.append(contact)
+                for contactID, address, port in result:
+                    if contactID in knownIDs:
+                        continue
+                    knownIDs.add(contactID)
+                    # Contacts only enter the routing table once they respond
+                    newContact = self.findContact(contactID)
+                    if newContact == None:
+                        newContact = Contact(contactID, address, port, self._protocol)
+                    shortlist.append(newContact)
+        closestContacts.sort(key=keyDistance)
+        returnValue(closestContacts[:constants.k])
+    
+    @rpcmethod
+    def replicate(self, partitionKey, changes, isSnapshot, _rpcNodeID=None, _rpcNodeContact=None):
+        """ Used in partitioned mode by the owner of tuples to store their
+            replicas at the peers responsible for them via RPC
             
-    def _iterativeFind(self, contactID):
-        """ Used in Distributed Hash Table, still accessed by current mobilIVR system, thus just 
-            here as a blank for interface purposes
+            @param partitionKey: The partition key of the tuples
+            @type partitionKey: str
+            @param changes: A list of C{[operation, tuple, version]}
+                            entries, as returned by C{getChanges()}
+            @type changes: list
+            @param isSnapshot: If set, C{changes} contains a "put" entry for
+                               each copy of every tuple of the caller in the
+                               partition, and the replicas of its tuples in
+                               the partition are made to match it
+            @type isSnapshot: bool
         """
-        emptyList = []
-        return emptyList
+        ownerID = _rpcNodeID
+        if ownerID == None or ownerID == self.id:
+            return
+        self._applyReplicaChanges(ownerID, changes, isSnapshot, partitionKey)
+        self._renewLease(ownerID)
     
     def addContact(self, contact):
-        """ add a contact """
+        """ add a contact
+        
+        @return: The contact object stored in the contact table (which is an
+                 existing object if the node was already known)
+        """
+        return self.contacts.add(contact)
+        
+    @rpcmethod
+    def ping(self, _rpcNodeID=None, _rpcNodeContact=None):
+        """ Answers a failure detection probe """
+        return 'pong'
+    
+    @rpcmethod
+    def pingRequest(self, targetID, _rpcNodeID=None, _rpcNodeContact=None):
+        """ Pings a peer on behalf of a peer that could not reach it directly
+        
+            @return: Deferred, which fires with whether the peer answered
+            @rtype: twisted.internet.defer.Deferred
+        """
+        return self.membership.pingRequested(targetID)
+    
+    def _memberFailed(self, nodeID):
+        """ Called when the membership protocol declares a peer dead: the
+            peer is removed from the contact table, together with the replicas
+            of all of its tuples, and the tuples it claimed are put back """
+        self.contacts.remove(nodeID)
+        self.purgeOwner(nodeID)
+        self._claimsExpired(nodeID)
+    
+    def removeContact(self, contactID):
+        """ Called when a contact fails to respond to an RPC; the contact is
+            removed after C{constants.contactFailureLimit} consecutive
+            failures, together with the replicas of its tuples """
+        if self.contacts.contactFailed(contactID):
+            self.purgeOwner(contactID)
+    
+    def _findKeys(self, template, numberOfResults=1):
+        """ Finds the data store keys of the tuples matching a template
+        
+        @param template: The template, or a template in the wire format
+        @param numberOfResults: The maximum number of keys to return; if set
+                                to 0 or lower, return all matching keys
+        
+        @rtype: list
+        """
+        template = self._template(template)
+        keys = self._index.match(template, numberOfResults)
+        if self._replicaCache != None:
+            for key in keys:
+                if key in self._replicaCache:
+                    self._cacheReplica(key)
+        return keys
+    
+    def _findOwnedKeys(self, template, numberOfResults=1):
+        """ Finds the data store keys of the tuples owned by this peer that
+        match a template, as in C{_findKeys()} """
+        template = self._template(template)
+        keys = [key for key in self._index.match(template, 0) if key[0] == self.id]
+        if numberOfResults > 0:
+            return keys[:numberOfResults]
+        return keys
+    
+    def _addWaiter(self, template, consume, numberOfResults, timeout):
+        """ Registers a blocked get/read operation for a template
+        
+        @return: The waiter, whose C{deferred} fires with the matching tuple
+                 (or list of tuples), or None if the timeout expires first
+        @rtype: _Waiter
+        """
+        template = self._template(template)
+        self._waiterSequence += 1
+        waiter = _Waiter(self._waiterSequence, template, consume, numberOfResults)
+        waiter.deferred = defer.Deferred(lambda df: self._removeWaiter(waiter))
+        if timeout != None:
+            waiter.timeoutCall = reactor.callLater(timeout, self._waiterTimedOut, waiter)
+        self._waiters.setdefault(template, []).append(waiter)
+        return waiter
+    
+    def _removeWaiter(self, waiter):
+        """ Removes a waiter from its queue, and cancels its timeout """
+        queue = self._waiters.get(waiter.template)
+        if queue != None and waiter in queue:
+            queue.remove(waiter)
+            if len(queue) == 0:
+                del self._waiters[waiter.template]
+        if waiter.timeoutCall != None and waiter.timeoutCall.active():
+            waiter.timeoutCall.cancel()
+    
+    def _waiterTimedOut(self, waiter):
+        waiter.timeoutCall = None
+        self._removeWaiter(waiter)
+        waiter.deferred.callback(None)
+    
+    def _wakeWaiters(self, key, sTuple):
+        """ Hands a newly-put tuple to the operations waiting for it
+        
+        Every waiting C{read()} receives a copy of the tuple; the waiting
+        C{get()} that was started first (if any) consumes it, or claims it
+        from its owner if it is a replica.
+        """
+        if len(self._waiters) == 0:
+            return
+        matched = []
+        for template, queue in self._waiters.items():
+            if templateMatches(template, sTuple):
+                matched.extend(queue)
+        if len(matched) == 0:
+            return
+        matched.sort(key=lambda waiter: waiter.sequence)
+        readers = []
+        consumer = None
+        for waiter in matched:
+            if waiter.consume:
+                if consumer == None and not waiter.claiming:
+                    consumer = waiter
+            else:
+                readers.append(waiter)
+        if consumer != None and key[0] != self.id:
+            self._claimForWaiter(consumer, key)
+            consumer = None
+        # Dequeue everyone first, since callbacks may put or get tuples
+        for waiter in readers:
+            self._removeWaiter(waiter)
+        if consumer != None:
+            self._removeWaiter(consumer)
+            self._removeKey(key)
+        for waiter in readers:
+            if waiter.numberOfResults == 1:
+                waiter.deferred.callback(sTuple)
+            else:
+                waiter.deferred.callback([sTuple])
+        if consumer != None:
+            consumer.deferred.callback(sTuple)
+    
+    def _claimForWaiter(self, waiter, key):
+        """ Claims a replica from its owner for a waiting C{get()}, which
+        keeps waiting if the claim is refused """
+        waiter.claiming = True
+        contact = self.findContact(key[0])
+        if contact == None:
+            df = defer.succeed(None)
+        else:
+            df = self._claimFrom(contact, key[1])
+        def claimed(sTuple):
+            waiter.claiming = False
+            self._replicaClaimed(key, sTuple != None)
+            if sTuple == None:
+                return
+            if waiter.deferred.called:
+                # Timed out (or cancelled) while the owner was responding
+                self.releaseTuple(sTuple, key[0])
+                return
+            self._removeWaiter(waiter)
+            waiter.deferred.callback(sTuple)
+        df.addCallback(claimed)
+    
+    def _queryResponded(self, response, query, contactID):
+        """ Adds the tuples found by a peer to the results of a query """
+        if query.pending.pop(contactID, None) == None:
+            return
+        query.responses += 1
+        if query.numberOfResults == 1:
+            response = response != None and [response] or []
+        for sTuple in response:
+            try:
+                sTuple = decodeTuple(sTuple)
+            except DataFormatError:
+                continue
+            if sTuple not in query.found:
+                query.found.add(sTuple)
+                query.results.append(sTuple)
+                if self._replicaCache != None:
+                    self._cacheFetchedTuple(sTuple)
+        if self._querySettled(query):
+            self._finishQuery(query)
+    
+    def _queryFailed(self, error, query, contactID):
+        """ Called when a peer fails to respond to a query """
+        if query.pending.pop(contactID, None) == None:
+            return
+        if self._querySettled(query):
+            self._finishQuery(query)
+    
+    def _querySettled(self, query):
+        """ Checks whether a query has found enough tuples (once a quorum of the
+        queried peers has responded, if required), or all of the queried peers
+        have responded """
+        if query.numberOfResults > 0 and len(query.results) >= query.numberOfResults and \
+           query.responses >= query.quorum:
+            return True
+        return query.dispatched and len(query.pending) == 0
+    
+    def _queryTimedOut(self, query):
+        query.timeoutCall = None
+        self._finishQuery(query)
+    
+    def _settleQuery(self, query):
+        """ Cancels the outstanding RPCs and the timeout of a query """
+        if query.timeoutCall != None and query.timeoutCall.active():
+            query.timeoutCall.cancel()
+        query.timeoutCall = None
+        pending = query.pending.values()
+        query.pending = {}
+        for df in pending:
+            df.cancel()
+    
+    def _finishQuery(self, query):
+        """ Settles a query, and returns its results """
+        if query.deferred.called:
+            return
+        self._settleQuery(query)
+        if query.responses < query.quorum:
+            query.deferred.errback(QuorumError('Only %d of the %d responses needed were received' % (query.responses, query.quorum)))
+            return
+        results = query.results
+        if query.numberOfResults > 0:
+            results = results[:query.numberOfResults]
+        if query.numberOfResults == 1:
+            results = len(results) > 0 and results[0] or None
+        query.deferred.callback(results)
+    
+    def _addCopies(self, key, sTuple, copies):
+        """ Adds copies of a tuple to the index
+        
+        @return: The number of copies of the tuple now stored
+        @rtype: int
+        """
+        if key in self._index:
+            copies += self._copies.get(key, 1)
+        else:
+            self._index.add(key, sTuple)
+            self._summary.add(sTuple)
+        if copies > 1:
+            self._copies[key] = copies
+        if key[0] != self.id:
+            self._cacheReplica(key)
+        return copies
+    
+    def _cacheReplica(self, key):
+        """ Marks the replica identified by C{key} as the most recently used
+            one in the replica cache (if the cache is bounded) """
+        cache = self._replicaCache
+        if cache == None:
+            return
+        size = cache.pop(key, None)
+        if size == None:
+            sTuple = key[1]
+            size = sys.getsizeof(sTuple) + sum([sys.getsizeof(field) for field in sTuple])
+            self._replicaCacheUsage += size
+        cache[key] = size
+    
+    def _uncacheReplica(self, key):
+        if self._replicaCache != None and key in self._replicaCache:
+            self._replicaCacheUsage -= self._replicaCache.pop(key)
+    
+    def _evictReplicas(self):
+        """ Evicts the least recently used replicas from the replica cache
+            until it is within its bounds, in a single data store operation """
+        cache = self._replicaCache
+        if cache == None:
+            return
+        evicted = []
+        while len(cache) > 0 and \
+              ((self.replicaCacheSize != None and len(cache) > self.replicaCacheSize) or \
+               (self.replicaCacheBytes != None and self._replicaCacheUsage > self.replicaCacheBytes)):
+            key, size = cache.popitem(last=False)
+            self._replicaCacheUsage -= size
+            self._index.remove(key)
+            self._summary.remove(key[1])
+            self._copies.pop(key, None)
+            self._versions.pop(key, None)
+            self._pendingChanges.pop(key, None)
+            evicted.append(key)
+        if len(evicted) > 0:
+            self.dataStore.removeItems(evicted)
+    
+    def _cacheFetchedTuple(self, sTuple):
+        """ Stores a replica of another peer's tuple fetched by a query in the
+            replica cache, unless it is already replicated here
+        
+        @note: A single copy of the tuple is stored; further copies are only
+               known once its owner's changes are applied
+        """
+        ownerID = self._tupleOwner(sTuple)
+        if ownerID != self.id and (ownerID, sTuple) not in self._index:
+            self.put(sTuple, ownerID)
+    
+    def _removeKey(self, key, allCopies=False, version=None):
+        """ Removes a copy of the tuple identified by C{key} from the tuple
+        space
+        
+        @param allCopies: If set, remove every copy of the tuple
+        @type allCopies: bool
+        @param version: The version of the remaining copies of a replica, as
+                        assigned by its owner
+        @type version: int
+        
+        @return: The removed tuple
+        """
+        ownerID, sTuple = key
+        copies = self._copies.pop(key, 1)
+        removed = allCopies and copies or 1
+        copies -= removed
+        if copies > 0:
+            if copies > 1:
+                self._copies[key] = copies
+            version = self._changeVersion(key, version)
+            self.dataStore.setItem(key, (copies, version), int(time.time()), 0, ownerID)
+        else:
+            version = 0
+            del self.dataStore[key]
+            del self._versions[key]
+            self._index.remove(key)
+            self._summary.remove(key[1])
+            self._uncacheReplica(key)
+        if ownerID == self.id:
+            for i in range(removed):
+                self._logChange('take', sTuple, version)
+        return sTuple
+    
+    def _changeVersion(self, key, version=None):
+        """ Gives a tuple that changed its new version
+        
+        @param version: The version assigned by the owner of a replica; if
+                        not specified, the replica keeps its version
+        
+        @return: The new version
+        @rtype: int
+        """
+        if key[0] == self.id:
+            self._version += 1
+            version = self._version
+        elif version == None:
+            version = self._versions.get(key, 0)
+        self._versions[key] = version
+        return version
+    
+    def _setVersion(self, key, version):
+        """ Updates the version of a replica to the one assigned by its owner """
+        if self._versions.get(key) != version:
+            self._versions[key] = version
+            self.dataStore.setItem(key, (self._copies.get(key, 1), version), int(time.time()), 0, key[0])
+    
+    def _logChange(self, operation, sTuple, version):
+        """ Records a change to a tuple owned by this peer """
+        self._sequence += 1
+        self._changeLog.append((self._sequence, operation, sTuple, version))
+        if len(self._changeLog) > 2 * constants.changeLogSize:
+            del self._changeLog[:-constants.changeLogSize]
+        if len(self._watchers) > 0:
+            self._notifyWatchers(sTuple)
+        if self.partitioned:
+            key = self._tupleKey(sTuple, self.id)
+            if operation == 'put':
+                self._addToPartition(key, sTuple)
+            elif key not in self._index:
+                self._removeFromPartition(key, sTuple)
+            # Changes made in the same reactor iteration are replicated together
+            self._pendingReplication.append((operation, sTuple, version))
+            if self._replicationCall == None:
+                self._replicationCall = reactor.callLater(0, self._replicateChanges)
+    
+    def _addToPartition(self, key, sTuple):
+        partitionKey = self._partitionKey(sTuple)
+        if partitionKey != None:
+            self._partitions.setdefault(partitionKey, set()).add(key)
+    
+    def _removeFromPartition(self, key, sTuple):
+        partitionKey = self._partitionKey(sTuple)
+        keys = self._partitions.get(partitionKey)
+        if keys != None:
+            keys.discard(key)
+            if len(keys) == 0:
+                del self._partitions[partitionKey]
+    
+    def _partitionKey(self, template):
+        """ Determines the partition key of a tuple (or template)
         
-    def removeContact(self, contact):
-        """ remove the contact """        
+        In partitioned mode, tuples are replicated to the peers closest to the
+        SHA-1 hash of their first C{constants.partitionFields} fields (such
+        as C{('resource', 'ivr')}), so templates that specify these fields
+        are only looked up at those peers.
+        
+        @return: The partition key, or None if one of the partition fields is
+                 a wildcard or a range (in which case tuples are not
+                 replicated, and templates are looked up at every contact)
+        @rtype: str
+        """
+        fields = template[:constants.partitionFields]
+        for field in fields:
+            if not isExact(field):
+                return None
+        return hashlib.sha1(serializeKey(fields)).digest()
+    
+    def _replicateChanges(self):
+        """ Sends the pending changes to this peer's tuples to the peers
+            responsible for them, in one RPC per peer and partition
+            
+            @return: The deferreds of the partitions (see
+                     C{_replicatePartition()}): C{{<partitionKey>: <Deferred>}}
+            @rtype: dict
+        """
+        self._replicationCall = None
+        pendingReplication = self._pendingReplication
+        self._pendingReplication = []
+        # { <partitionKey>: [[<operation>, <tuple in the wire format>, <version>], ...] }
+        partitions = {}
+        for operation, sTuple, version in pendingReplication:
+            partitionKey = self._partitionKey(sTuple)
+            if partitionKey != None:
+                partitions.setdefault(partitionKey, []).append([operation, encodeTuple(sTuple), version])
+        dfs = {}
+        for partitionKey, changes in partitions.iteritems():
+            dfs[partitionKey] = self._replicatePartition(partitionKey, changes, False)
+        return dfs
+    
+    def _republish(self):
+        """ Sends a snapshot of each of this peer's partitions to the peers
+            currently responsible for it
+            
+            This renews the leases on the replicas, and repairs replicas that
+            missed changes, or that moved to other peers as peers joined or
+            left the network.
+            
+            @rtype: twisted.internet.defer.Deferred
+        """
+        dfs = []
+        for partitionKey, keys in self._partitions.items():
+            dfs.append(self._replicatePartition(partitionKey, self._snapshot(keys), True))
+        return defer.DeferredList(dfs, consumeErrors=True)
+    
+    def _replicatePartition(self, partitionKey, changes, isSnapshot):
+        """ Sends changes to the peers responsible for a partition
+        
+        @return: Deferred, which fires with the number of peers that stored
+                 the changes (including this peer, if it is one of them)
+        @rtype: twisted.internet.defer.Deferred
+        """
+        def sendChanges(closestContacts):
+            contacts, responsible = self._responsiblePeers(partitionKey, closestContacts)
+            dfs = [contact.replicate(partitionKey, changes, isSnapshot) for contact in contacts]
+            # Peers that fail to respond receive a snapshot when this peer next republishes
+            df = defer.DeferredList(dfs, consumeErrors=True)
+            df.addCallback(lambda results: int(responsible) + [success for success, result in results].count(True))
+            return df
+        
+        df = self._iterativeFind(partitionKey)
+        df.addCallback(sendChanges)
+        return df
+    
+    def _responsiblePeers(self, partitionKey, closestContacts):
+        """ Determines the C{replicationFactor} peers responsible for a
+        partition, from the closest contacts found by C{_iterativeFind()}
+        
+        @return: The responsible contacts, and whether this peer is one of the
+                 responsible peers too (it counts as one of them, if it is one
+                 of the closest)
+        @rtype: tuple
+        """
+        contacts = closestContacts[:self.replicationFactor]
+        responsible = len(contacts) < self.replicationFactor or \
+                      distance(partitionKey, self.id) < distance(partitionKey, contacts[-1].id)
+        if responsible and len(contacts) == self.replicationFactor:
+            contacts.pop()
+        return contacts, responsible
+    
+    def _tupleOwner(self, sTuple, originalPublisherID=None):
+        """ Determines the node ID of the owner of a tuple
+        
+        @return: C{originalPublisherID} if specified, otherwise the third field
+                 of the tuple (as in handler and resource tuples), or this
+                 peer's ID for shorter tuples
+        """
+        if originalPublisherID != None:
+            return originalPublisherID
+        elif len(sTuple) > 2:
+            return sTuple[2]
+        else:
+            return self.id
+    
+    def _tupleKey(self, sTuple, originalPublisherID=None):
+        """ Generates the data store key of a tuple
+        
+        The key is C{(ownerID, sTuple)}, with the owner determined as in
+        C{_tupleOwner()}; the value stored under it is the number of copies
+        of the tuple put by that owner. Equal tuples of different owners are
+        thus stored separately, and equal tuples of the same owner share a
+        key.
+        
+        @note: The tuple object itself is part of the key, and is shared by
+               the data store and the index; nothing is serialized or hashed
+               on the local read/write path.
+        """
+        try:
+            hash(sTuple)
+        except TypeError:
+            raise DataFormatError("Error, all fields of a tuple must be hashable")
+        return (self._tupleOwner(sTuple, originalPublisherID), sTuple)
+    
+    def _template(self, template):
+        """ Checks a template passed locally (as a tuple), or converts one
+        received from another peer in the wire format (see
+        C{wireformat.decodeTemplate()})
+        
+        @rtype: tuple
+        """
+        if isinstance(template, list):
+            return decodeTemplate(template)
+        elif not isinstance(template, tuple):
+            raise DataFormatError("Error, expected a tuple or a template in the wire format as input")
+        return template
+    
+    def _tuple(self, sTuple):
+        """ Checks a tuple passed locally, or converts one received from
+        another peer in the wire format (see C{wireformat.decodeTuple()})
+        
+        @rtype: tuple
+        """
+        if isinstance(sTuple, list):
+            return decodeTuple(sTuple)
+        elif not isinstance(sTuple, tuple):
+            raise DataFormatError("Error, expected a tuple or a tuple in the wire format as input")
+        return sTuple
     
     def _generateID(self):
         """ Generates a 160-bit pseudo-random identifier
@@ -0,0 +1,354 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2009 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+#    http://epydoc.sf.net                                                    #
+
+"""
+@author: Bryan McAlister
+
+Provides the template matching engine used by the Static Tuple Space
+"""
+
+#!/usr/bin/env python
+
+from bisect import bisect_left, bisect_right
+
+_numberTypes = (int, long, float)
+
+class Range(object):
+    """ A template field that matches numbers within a range
+
+    For example, the template C{('resource', 'ivr', str, Range(5), 'gp')}
+    matches resource tuples with at least 5 free channels in the region "gp".
+    Only numeric values (C{int}, C{long} and C{float}) match a range. If the
+    field is declared as a sorted field of the L{TupleIndex}, matching tuples
+    are found by seeking in the sorted index instead of checking every
+    candidate tuple.
+    """
+    def __init__(self, low=None, high=None, lowInclusive=True, highInclusive=True):
+        """
+        @param low: The lower bound of the range; if C{None}, the range is not
+                    bounded below
+        @param high: The upper bound of the range; if C{None}, the range is
+                     not bounded above
+        @param lowInclusive: Whether the lower bound itself is in the range
+        @type lowInclusive: bool
+        @param highInclusive: Whether the upper bound itself is in the range
+        @type highInclusive: bool
+        """
+        self.low = low
+        self.high = high
+        self.lowInclusive = lowInclusive
+        self.highInclusive = highInclusive
+
+    def matches(self, value):
+        """ Checks whether a value is within the range """
+        if not isinstance(value, _numberTypes):
+            return False
+        if self.low is not None:
+            if value < self.low or (value == self.low and not self.lowInclusive):
+                return False
+        if self.high is not None:
+            if value > self.high or (value == self.high and not self.highInclusive):
+                return False
+        return True
+
+    def slice(self, values):
+        """ Finds the positions of the values within the range in a sorted
+        list of numbers
+
+        @return: The start and end positions, as used to slice the list
+        @rtype: tuple
+        """
+        if self.low is None:
+            start = 0
+        elif self.lowInclusive:
+            start = bisect_left(values, self.low)
+        else:
+            start = bisect_right(values, self.low)
+        if self.high is None:
+            end = len(values)
+        elif self.highInclusive:
+            end = bisect_right(values, self.high)
+        else:
+            end = bisect_left(values, self.high)
+        return start, max(start, end)
+
+    def _bounds(self):
+        return (self.low, self.high, self.lowInclusive, self.highInclusive)
+
+    def __eq__(self, other):
+        return isinstance(other, Range) and self._bounds() == other._bounds()
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self._bounds())
+
+    def __repr__(self):
+        return 'Range(%r, %r, %r, %r)' % self._bounds()
+
+def isWildcard(field):
+    """ Checks whether a template field is a wildcard
+
+    A template field is a wildcard if it is C{None} (matches any value) or a
+    type, such as C{str} (matches any value of that type)
+    """
+    return field is None or isinstance(field, type)
+
+def isExact(field):
+    """ Checks whether a template field only matches values equal to it
+    (i.e. it is neither a wildcard nor a L{Range}) """
+    return not isWildcard(field) and not isinstance(field, Range)
+
+def fieldMatches(field, value):
+    """ Checks whether a single template field matches a tuple field """
+    if field is None:
+        return True
+    elif isinstance(field, type):
+        return isinstance(value, field)
+    elif isinstance(field, Range):
+        return field.matches(value)
+    else:
+        return field == value
+
+def templateMatches(template, sTuple):
+    """ Checks whether a template matches a tuple
+
+    A template matches a tuple if both have the same number of fields, and
+    every field of the template either is a wildcard, is a L{Range}
+    containing the corresponding field of the tuple, or is equal to it.
+
+    @type template: tuple
+    @type sTuple: tuple
+
+    @rtype: bool
+    """
+    if len(template) != len(sTuple):
+        return False
+    for position in range(len(template)):
+        if not fieldMatches(template[position], sTuple[position]):
+            return False
+    return True
+
+
+class TupleIndex(object):
+    """ In-memory index over the tuples stored by a peer
+
+    Every tuple is indexed by its arity, and every field of a tuple is
+    indexed by its arity, position and value. A template lookup starts from
+    the smallest of the index entries selected by its non-wildcard fields,
+    so the work done is proportional to the number of candidate tuples, not
+    the size of the tuple space.
+
+    Numeric fields that are queried with L{Range} template fields can be
+    declared as sorted fields; their values are also kept in a sorted index,
+    so a range is looked up with a binary search.
+
+    @note: Fields of indexed tuples must be hashable
+    """
+    def __init__(self, sortedFields=()):
+        """
+        @param sortedFields: The sorted fields to declare, as
+                             C{(<arity>, <position>)} pairs (see
+                             C{addSortedField()})
+        @type sortedFields: list
+        """
+        # { <key>: <tuple> }
+        self._tuples = {}
+        # { <arity>: set(<key>, ...) }
+        self._arityIndex = {}
+        # { (<arity>, <position>, <value>): set(<key>, ...) }
+        self._fieldIndex = {}
+        # The numeric values of sorted fields in ascending order, and the keys
+        # of their tuples: { (<arity>, <position>): ([<value>, ...], [<key>, ...]) }
+        self._sortedIndex = {}
+        for arity, position in sortedFields:
+            self.addSortedField(arity, position)
+
+    def addSortedField(self, arity, position):
+        """ Declares a sorted field, and indexes the tuples already added
+
+        @param arity: The number of fields of the tuples
+        @type arity: int
+        @param position: The position of the field in the tuples (starting
+                         from 0)
+        @type position: int
+        """
+        if (arity, position) in self._sortedIndex:
+            return
+        entry = self._sortedIndex[(arity, position)] = ([], [])
+        for key in self._arityIndex.get(arity, ()):
+            self._insertSorted(entry, self._tuples[key][position], key)
+
+    def __len__(self):
+        return len(self._tuples)
+
+    def __contains__(self, key):
+        return key in self._tuples
+
+    def add(self, key, sTuple):
+        """ Add a tuple to the index, identified by C{key} """
+        if key in self._tuples:
+            self.remove(key)
+        arity = len(sTuple)
+        self._tuples[key] = sTuple
+        arityEntry = self._arityIndex.get(arity)
+        if arityEntry is None:
+            arityEntry = self._arityIndex[arity] = set()
+        arityEntry.add(key)
+        fieldIndex = self._fieldIndex
+        for position in range(arity):
+            indexKey = (arity, position, sTuple[position])
+            entry = fieldIndex.get(indexKey)
+            if entry is None:
+                fieldIndex[indexKey] = set([key])
+            else:
+                entry.add(key)
+        if self._sortedIndex:
+            for position in range(arity):
+                entry = self._sortedIndex.get((arity, position))
+                if entry is not None:
+                    self._insertSorted(entry, sTuple[position], key)
+
+    def remove(self, key):
+        """ Remove the tuple identified by C{key} from the index (if present) """
+        sTuple = self._tuples.pop(key, None)
+        if sTuple is None:
+            return
+        arity = len(sTuple)
+        self._discard(self._arityIndex, arity, key)
+        fieldIndex = self._fieldIndex
+        for position in range(arity):
+            indexKey = (arity, position, sTuple[position])
+            entry = fieldIndex[indexKey]
+            entry.discard(key)
+            if not entry:
+                del fieldIndex[indexKey]
+        if self._sortedIndex:
+            for position in range(arity):
+                entry = self._sortedIndex.get((arity, position))
+                if entry is not None:
+                    self._removeSorted(entry, sTuple[position], key)
+
+    def get(self, key):
+        """ Get the tuple identified by C{key}, or None if it is not indexed """
+        return self._tuples.get(key)
+
+    def match(self, template, numberOfResults=0):
+        """ Find the keys of the tuples matching a template
+
+        @param template: The template to match; C{None} or a type in a field
+                         of the template acts as a wildcard, and a L{Range}
+                         matches the numbers within it
+        @type template: tuple
+        @param numberOfResults: The maximum number of keys to return; if set
+                                to 0 or lower, return all matching keys
+        @type numberOfResults: int
+
+        @return: The keys of the matching tuples
+        @rtype: list
+        """
+        arity = len(template)
+        candidates = self._arityIndex.get(arity)
+        if not candidates:
+            return []
+        # Use the most selective field index as the candidate set; the
+        # remaining fields are checked against each candidate
+        valueChecks = []
+        typeChecks = []
+        rangeChecks = []
+        for position in range(arity):
+            field = template[position]
+            if field is None:
+                continue
+            elif isinstance(field, type):
+                typeChecks.append((position, field))
+                continue
+            elif isinstance(field, Range):
+                rangeChecks.append((position, field))
+                entry = self._sortedIndex.get((arity, position))
+                if entry is not None:
+                    start, end = field.slice(entry[0])
+                    if end - start < len(candidates):
+                        candidates = entry[1][start:end]
+                continue
+            entry = self._fieldIndex.get((arity, position, field))
+            if not entry:
+                return []
+            valueChecks.append((position, field))
+            if len(entry) < len(candidates):
+                candidates = entry
+        keys = []
+        tuples = self._tuples
+        for key in candidates:
+            sTuple = tuples[key]
+            for position, field in valueChecks:
+                if sTuple[position] != field:
+                    break
+            else:
+                for position, field in typeChecks:
+                    if not isinstance(sTuple[position], field):
+                        break
+                else:
+                    for position, field in rangeChecks:
+                        if not field.matches(sTuple[position]):
+                            break
+                    else:
+                        keys.append(key)
+                        if len(keys) == numberOfResults:
+                            break
+        return keys
+
+    @staticmethod
+    def _insertSorted(entry, value, key):
+        if isinstance(value, _numberTypes):
+            values, keys = entry
+            position = bisect_right(values, value)
+            values.insert(position, value)
+            keys.insert(position, key)
+
+    @staticmethod
+    def _removeSorted(entry, value, key):
+        if isinstance(value, _numberTypes):
+            values, keys = entry
+            start = bisect_left(values, value)
+            end = bisect_right(values, value)
+            position = keys.index(key, start, end)
+            del values[position]
+            del keys[position]
+
+    @staticmethod
+    def _discard(index, indexKey, key):
+        entry = index.get(indexKey)
+        if entry is not None:
+            entry.discard(key)
+            if not entry:
+                del index[indexKey]
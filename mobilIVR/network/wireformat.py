@@ -0,0 +1,165 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2009 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+#    http://epydoc.sf.net                                                    #
+
+
+"""
+@author: Bryan McAlister
+
+Provides the format in which tuples and templates are exchanged between
+peers
+"""
+
+#!/usr/bin/env python
+
+from tupleindex import Range
+
+#: Maximum nesting depth of tuple fields that are tuples themselves
+maxDepth = 8
+
+# The types a template field may match, by name
+_types = {'str': str, 'unicode': unicode, 'int': int, 'long': long, 'float': float, 'bool': bool, 'tuple': tuple}
+_typeNames = dict([(fieldType, name) for name, fieldType in _types.items()])
+_numberTypes = (int, long, float)
+
+class DataFormatError(Exception):
+    """ Raised when the format of data to be published or found is not correct 
+    """
+
+def encodeTuple(sTuple):
+    """ Converts a tuple to its wire format
+    
+    The wire format of a tuple is a list of its fields, which the Bencode
+    encoder of the RPC protocol handles directly: C{None}, strings and
+    numbers are sent as they are, and other fields are sent as tagged lists,
+    e.g. C{['bool', 1]} or C{['tuple', [...]]}. Nothing received from the
+    network is ever unpickled.
+    
+    @type sTuple: tuple
+    
+    @rtype: list
+    """
+    return _encodeFields(sTuple, False, 0)
+
+def encodeTemplate(template):
+    """ Converts a template to its wire format, as in C{encodeTuple()}
+    
+    Type wildcards are sent as C{['type', <name>]} (for the types in
+    C{_types} only), and C{tupleindex.Range} fields as C{['range', <low>,
+    <high>, <lowInclusive>, <highInclusive>]}.
+    
+    @type template: tuple
+    
+    @rtype: list
+    """
+    return _encodeFields(template, True, 0)
+
+def decodeTuple(data):
+    """ Recreates a tuple from its wire format (see C{encodeTuple()})
+    
+    The data is checked against the wire format; string fields are interned,
+    so the node IDs and type names repeated across many received tuples are
+    stored only once.
+    
+    @raise DataFormatError: The data is not a tuple in the wire format
+    
+    @rtype: tuple
+    """
+    return _decodeFields(data, False, 0)
+
+def decodeTemplate(data):
+    """ Recreates a template from its wire format (see C{encodeTemplate()})
+    
+    @raise DataFormatError: The data is not a template in the wire format
+    
+    @rtype: tuple
+    """
+    return _decodeFields(data, True, 0)
+
+
+def _encodeFields(fields, isTemplate, depth):
+    if not isinstance(fields, tuple):
+        raise DataFormatError("Error, expected a tuple")
+    if depth > maxDepth:
+        raise DataFormatError("Error, tuple fields are nested too deeply")
+    return [_encodeField(field, isTemplate, depth) for field in fields]
+
+def _encodeField(field, isTemplate, depth):
+    fieldType = type(field)
+    if field is None or fieldType in (str, int, long, float):
+        return field
+    elif fieldType is bool:
+        return ['bool', int(field)]
+    elif fieldType is unicode:
+        return ['unicode', field.encode('utf-8')]
+    elif fieldType is tuple:
+        return ['tuple', _encodeFields(field, isTemplate, depth + 1)]
+    elif isTemplate and fieldType is type and field in _typeNames:
+        return ['type', _typeNames[field]]
+    elif isTemplate and fieldType is Range:
+        return ['range', field.low, field.high, int(field.lowInclusive), int(field.highInclusive)]
+    raise DataFormatError("Error, cannot send a field of type %s" % fieldType.__name__)
+
+def _decodeFields(data, isTemplate, depth):
+    if not isinstance(data, list):
+        raise DataFormatError("Error, expected a tuple in the wire format")
+    if depth > maxDepth:
+        raise DataFormatError("Error, tuple fields are nested too deeply")
+    return tuple([_decodeField(field, isTemplate, depth) for field in data])
+
+def _decodeField(field, isTemplate, depth):
+    fieldType = type(field)
+    if fieldType is str:
+        return intern(field)
+    elif field is None or fieldType in _numberTypes:
+        return field
+    elif fieldType is not list or len(field) == 0:
+        raise DataFormatError("Error, invalid tuple field in the wire format")
+    tag = field[0]
+    if tag == 'bool' and len(field) == 2 and field[1] in (0, 1):
+        return bool(field[1])
+    elif tag == 'unicode' and len(field) == 2 and type(field[1]) is str:
+        try:
+            return field[1].decode('utf-8')
+        except UnicodeDecodeError:
+            raise DataFormatError("Error, invalid unicode field in the wire format")
+    elif tag == 'tuple' and len(field) == 2:
+        return _decodeFields(field[1], isTemplate, depth + 1)
+    elif isTemplate and tag == 'type' and len(field) == 2 and type(field[1]) is str and field[1] in _types:
+        return _types[field[1]]
+    elif isTemplate and tag == 'range' and len(field) == 5:
+        low, high, lowInclusive, highInclusive = field[1:]
+        for bound in (low, high):
+            if bound is not None and type(bound) not in _numberTypes:
+                raise DataFormatError("Error, invalid range bound in the wire format")
+        if lowInclusive not in (0, 1) or highInclusive not in (0, 1):
+            raise DataFormatError("Error, invalid range in the wire format")
+        return Range(low, high, bool(lowInclusive), bool(highInclusive))
+    raise DataFormatError("Error, invalid tuple field in the wire format")
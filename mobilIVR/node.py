@@ -37,7 +37,7 @@ Provides class that encapsultes a MobilIVR Node. A node can be set up to provide
 Kannel SMS), and/or can be set up to provide the applications that use the resources 
 """
 
-import sys, os, random
+import sys, os, random, time
 import threading
 from ConfigParser import SafeConfigParser
 
@@ -47,7 +47,7 @@ from network.rpc.protocol import TimeoutError
 
 import twisted.internet.reactor
 
-from twisted.internet.defer import inlineCallbacks, returnValue, Deferred
+from twisted.internet.defer import inlineCallbacks, returnValue, Deferred, succeed
 
 from network.staticTupleSpace import rpcmethod
 
@@ -65,8 +65,49 @@ from mobilIVR.logger import setupLogger
 
 class MobilIVRNode(StaticTupleSpacePeer):
     """ Node in a MobilIVR network """
-    def __init__(self, udpPort=4000):
-        StaticTupleSpacePeer.__init__(self, udpPort=udpPort)
+    # Remote tuples kept up to date locally, so that calls can be routed and
+    # resources found without contacting other nodes
+    _watchedTemplates = (('handler', str, str), ('handler', str, str, None, None),
+                         ('resource', str, str), ('resource', str, str, str))
+    
+    def __init__(self, udpPort=4000, dataStore=None, id=None, replicaCacheSize=None, replicaCacheBytes=None,
+                 multicastDiscovery=False, site=None, superNode=None, federationPort=None, federationAddresses=None):
+        """
+        @param dataStore: The data store for the node's tuples; pass a
+                          persistent data store (such as a
+                          C{network.datastore.LogDataStore}), together with a
+                          fixed C{id}, to recover the node's tuples after a
+                          restart
+        @param replicaCacheSize: The maximum number of other nodes' tuples to
+                                 keep replicas of, for nodes with little
+                                 memory (see C{StaticTupleSpacePeer})
+        @type replicaCacheSize: int
+        @param replicaCacheBytes: The maximum memory size of the replicas of
+                                  other nodes' tuples, in bytes
+        @type replicaCacheBytes: int
+        @param multicastDiscovery: If set, the node finds the other nodes on
+                                   the local network by multicast, if it is
+                                   not given any known nodes to join through
+        @type multicastDiscovery: bool
+        @param site: The site of the node in hierarchy mode, in which only
+                     the super-node of each site communicates with the other
+                     sites (see C{StaticTupleSpacePeer})
+        @type site: str
+        @param superNode: Whether the node is the super-node of its site; by
+                          default, the super-node is elected
+        @type superNode: bool
+        @param federationPort: The UDP port on which the super-node
+                               communicates with the other sites
+        @type federationPort: int
+        @param federationAddresses: The addresses of the super-nodes of other
+                                    sites, as C{(<ip address>, <udp port>)}
+                                    tuples
+        @type federationAddresses: list
+        """
+        StaticTupleSpacePeer.__init__(self, id=id, udpPort=udpPort, dataStore=dataStore,
+                                      replicaCacheSize=replicaCacheSize, replicaCacheBytes=replicaCacheBytes,
+                                      multicastDiscovery=multicastDiscovery, site=site, superNode=superNode,
+                                      federationPort=federationPort, federationAddresses=federationAddresses)
 
         self._localSMSHandlers = []
         self._localIVRHandlers = []
@@ -74,6 +115,9 @@ class MobilIVRNode(StaticTupleSpacePeer):
         self.fastAGIServer = None
         self._joinedNetwork = False
         self._callQueue = []
+        # Handlers registered before joining the network, published in a
+        # single batch once the node has joined
+        self._handlerQueue = []
         self.claimedResources = 0 # Counter to keep track of how many consumable resources we are using
         self._log = setupLogger(debug=True, name='mobilIVR')
         
@@ -99,17 +143,32 @@ class MobilIVRNode(StaticTupleSpacePeer):
         
         @type asteriskManAPIPort: int
         @param asteriskManAPIChannels: A list of Asterisk channels that this
-                                       MobilIVR node should publish
-        @type asteriskManAPIChannels: list
+                                       MobilIVR node should publish, or a
+                                       string in the same format as the
+                                       "channels" option of the IVR
+                                       configuration file, which allows
+                                       specifying the number of simultaneous
+                                       calls per channel (e.g. "DAHDI/g1:30")
+        @type asteriskManAPIChannels: list or str
         """
         settings = {}
         settings['host'] = asteriskManAPIHost
         settings['port'] = int(asteriskManAPIPort)
         if type(asteriskManAPIChannels) == str:
-            asteriskManAPIChannels = [asteriskManAPIChannels]
-        settings['channels'] = asteriskManAPIChannels
+            channels, capacities = mobilIVR.configuration.parseChannels(asteriskManAPIChannels)
+        else:
+            channels = list(asteriskManAPIChannels)
+            capacities = dict([(channel, 1) for channel in channels])
+        settings['channels'] = channels
+        settings['channel_capacity'] = capacities
         settings['username'] = asteriskManAPIUsername
         settings['secret'] = asteriskManAPIPassword
+        settings['gateway_address'] = None
+        settings['prefix'] = None
+        settings['internal_extension_length'] = None
+        settings['speech_server_address'] = '127.0.0.1'
+        settings['speech_server_port'] = '9000'
+        self.resourceConfig['ivr']['tx'] = settings
         
     def setupIVRGeneral(self, fastAGIPort, defaultTTS):
         """ Set general IVR settings
@@ -136,14 +195,6 @@ class MobilIVRNode(StaticTupleSpacePeer):
         """ Starts all required servers and publishes all resources, as per
         the node's configuration """
         resourcesToPublish = []
-        outerDf = Deferred()
-        def publishNextResource(result=None):
-            if len(resourcesToPublish) > 0:
-                resType = resourcesToPublish.pop()
-                df = self.publishResource(resType)
-                df.addCallback(publishNextResource)
-            else:
-                outerDf.callback(None)
         
         if 'sms' in self.resourceConfig:
             if 'tx' in self.resourceConfig['sms']:
@@ -181,23 +232,51 @@ class MobilIVRNode(StaticTupleSpacePeer):
             
                 
                 
-        publishNextResource()
+        # Resources recovered from a persistent data store are replaced, rather
+        # than having copies added to them
+        self._removeRecoveredTuples(('resource', None, self.id), ('resource', None, self.id, None))
+        # Publish all of the node's resources in a single batch
+        resourceTuples = []
+        for resType in resourcesToPublish:
+            self._log.info('Publishing resource: ' + resType)
+            resourceTuples.extend(self._resourceTuples(resType, self.id))
+        self.putMany(resourceTuples)
         #print 'returning from startServices'
-        return outerDf
+        return succeed(None)
 
-    @inlineCallbacks
     def publishResource(self, resType, originalPublisherID=None, returnCallbackFunc=None):
-        """ stub for publishing resources """
+        """ Publishes a resource of this node in the tuple space
+        
+        Outgoing IVR resources are published per Asterisk channel, in the
+        format: C{('resource', 'ivr', nodeID, channel)}, with one copy for
+        every call the channel supports; other resources are published as
+        C{('resource', resType, nodeID)}
+        """
         if originalPublisherID == None:
             resourceOwnerID = self.id
         else:
             resourceOwnerID = originalPublisherID
-        resourceTuple = ('resource', resType, resourceOwnerID)
         #print 'publishing resource:', resType
         self._log.info('Publishing resource: ' + resType)
-        yield self.put(resourceTuple, originalPublisherID=originalPublisherID)
+        self.putMany(self._resourceTuples(resType, resourceOwnerID), originalPublisherID=originalPublisherID)
         if callable(returnCallbackFunc):
             returnCallbackFunc()
+        return succeed(None)
+    
+    def _resourceTuples(self, resType, resourceOwnerID):
+        """ Builds the tuples describing a resource owned by C{resourceOwnerID}
+        
+        @see: C{publishResource()}
+        
+        @rtype: list
+        """
+        resourceTuples = []
+        if resType == 'ivr' and resourceOwnerID == self.id:
+            for channel in self.resourceConfig['ivr']['tx']['channels']:
+                resourceTuples.extend([('resource', resType, resourceOwnerID, channel)] * self._channelCapacity(channel))
+        else:
+            resourceTuples.append(('resource', resType, resourceOwnerID))
+        return resourceTuples
         
     @inlineCallbacks
     def notifyEvent(self, event, callbackFunc=None):
@@ -206,9 +285,10 @@ class MobilIVRNode(StaticTupleSpacePeer):
         #NOTE: these checks are "hardcoded" on purpose, since the handler tuple templates may change
         if event['type'] == 'sms':
             handlerTemplate = ('handler', 'sms', str)
-            def removeSMSHandler(result=None):
-                self.getIfExists(handlerTemplate, getListenerTuple=True)    
             handlerTuple = yield self.readIfExists(handlerTemplate)
+            def removeSMSHandler(result=None):
+                # The handler's node is dead/unreachable - drop everything it published
+                self.purgeOwner(handlerTuple[2])
             #print '====>handlerTuple:', handlerTuple
             if handlerTuple != None:
                 remoteNodeID = handlerTuple[2]
@@ -225,18 +305,13 @@ class MobilIVRNode(StaticTupleSpacePeer):
             callbackResult = None
             # IVR handler template format: ('handler', 'ivr', nodeID, channelID, callerID)
             handlerTemplate = ('handler', 'ivr', str, None, None)
-            # Find any application handlers that exist - set <numberOfResults> to 0 to get all results
-            returnTuples = yield self.readIfExists(handlerTemplate, numberOfResults=0)
-            
-            handlerTupleList = []
-            #Check for a single tuple, if so place it into a list
-            if isinstance(returnTuples, tuple):
-                handlerTupleList.append(returnTuples)
+            # Find all application handlers that exist in a single lookup - set <numberOfResults> to 0 to get all results
+            handlerTupleList = yield self.readIfExists(handlerTemplate, numberOfResults=0)
             
             #print '====>handlerTupleList:', handlerTupleList
             self._log.info('Finding IVR Handler | SESSION ID: ' + event['uniqueID'])
             # In the case of IVR, only one handler can handle the call
-            if handlerTupleList != None:
+            if len(handlerTupleList) > 0:
                 # Some possibly suitable handlers were found
                 filteredGenericHandlers = [] # will contain applications that didn't specify callerID/channelID
                 filteredChannelIDHandlers = [] # specified the dnid/channel ID
@@ -267,21 +342,22 @@ class MobilIVRNode(StaticTupleSpacePeer):
                     if callerIDMatched and channelIDMatched:
                         filteredSpecificHandlers.append(handlerTuple)
                     elif channelIDMatched:
-                        filteredCallerIDHandlers.append(handlerTuple)
+                        filteredChannelIDHandlers.append(handlerTuple)
                     elif callerIDMatched:
                         filteredCallerIDHandlers.append(handlerTuple)
                     else:
                         filteredGenericHandlers.append(handlerTuple)
                 
                 callHandled = False
+                handlerGroups = (filteredSpecificHandlers, filteredChannelIDHandlers, filteredCallerIDHandlers, filteredGenericHandlers)
                 # This loop provides provides priority to apps that were more specific in their requirements than others
-                for appHandlerGroup in (filteredSpecificHandlers, filteredChannelIDHandlers, filteredCallerIDHandlers, filteredGenericHandlers):
+                for appHandlerGroup in handlerGroups:
                     #print 'trying new group'        
                     groupLen = len(appHandlerGroup)
                     while groupLen > 0 and callHandled == False:
                         #print '  trying tuple in group'         
-                        # Pick a random application from this group (intra-group priorities are not supported)
-                        handlerTuple = appHandlerGroup[random.randint(0,groupLen-1)]
+                        # Pick the application at the most responsive node in this group (intra-group priorities are not supported)
+                        handlerTuple = self._preferredHandler(appHandlerGroup)
                         remoteNodeID = handlerTuple[2]
                         if remoteNodeID == self.id:
                             self._log.info('Local IVR Handler found | SESSION ID: ' + event['uniqueID'])
@@ -298,22 +374,17 @@ class MobilIVRNode(StaticTupleSpacePeer):
                             except TimeoutError:
                                 self._log.error('RPC Timeout! Unable to locate Remote IVR Handler, no response obtained | SESSION ID: ' \
                                                 + event['uniqueID'])
-                                # Remote node is dead/unreachable - remove this handler from the tuple space
+                                # Remote node is dead/unreachable - remove its tuples from the tuple space
                                 #print '========Warning: Removing application handler from tuple space due to dead node (remote node not responding to handle RPC)'
-                                #hmm = yield self.getIfExists(handlerTuple, getListenerTuple=False)
-                                hmm = yield self.readIfExists(handlerTemplate, numberOfResults=0)
-                                #print '========mobilIVRNode:  removed:', hmm
-                                appHandlerGroup.remove(handlerTuple)
-                                groupLen -= 1
+                                self._purgeHandlerNode(remoteNodeID, handlerGroups)
+                                groupLen = len(appHandlerGroup)
                             else:
                                 callbackResult = (remoteContact.address, remoteFastAGIPort)
                         else:
-                            # Remote node is dead/unreachable - remove this handler from the tuple space
+                            # Remote node is dead/unreachable - remove its tuples from the tuple space
                             #print '=========Warning: Removing application handler from tuple space due to dead node (remote node unknown)'
-                            hmm = yield self.getIfExists(handlerTuple, getListenerTuple=False)
-                            #print '=========mobilIVRNode: removed:', hmm
-                            appHandlerGroup.remove(handlerTuple)
-                            groupLen -= 1
+                            self._purgeHandlerNode(remoteNodeID, handlerGroups)
+                            groupLen = len(appHandlerGroup)
                     if callHandled:
                         #print '--breaking out of for loop'
                         break # out of for loop
@@ -326,8 +397,33 @@ class MobilIVRNode(StaticTupleSpacePeer):
                 callbackFunc(callbackResult)
         #didn't notify anyone - we should probably log this...
 
+    def _purgeHandlerNode(self, nodeID, handlerGroups):
+        """ Removes all of the tuples published by a dead node from the tuple
+        space, and its handlers from the handler candidates of an event """
+        self.purgeOwner(nodeID)
+        for handlerGroup in handlerGroups:
+            handlerGroup[:] = [handlerTuple for handlerTuple in handlerGroup if handlerTuple[2] != nodeID]
+
+    def _preferredHandler(self, handlerTuples):
+        """ Chooses the handler to try first: a local handler if there is one,
+        otherwise one at the healthiest, lowest-latency node (chosen randomly
+        among equally good nodes); nodes suspected of having failed are only
+        tried if there are no others """
+        bestRank = None
+        bestHandlers = []
+        for handlerTuple in handlerTuples:
+            if handlerTuple[2] == self.id:
+                return handlerTuple
+            rank = (self.membership.isSuspect(handlerTuple[2]), self.contacts.rank(handlerTuple[2]))
+            if bestRank == None or rank < bestRank:
+                bestRank = rank
+                bestHandlers = [handlerTuple]
+            elif rank == bestRank:
+                bestHandlers.append(handlerTuple)
+        return random.choice(bestHandlers)
+
     @inlineCallbacks
-    def getTupleCallback(self, dTuple, returnCallbackFunc, blocking=True, removeTuple=True):
+    def getTupleCallback(self, dTuple, returnCallbackFunc, blocking=True, removeTuple=True, timeout=None):
         """
         Convenience method to get a tuple from the tuple space, and return
         the value to a specific callback function (used for getting tuples from
@@ -338,15 +434,19 @@ class MobilIVRNode(StaticTupleSpacePeer):
                                    takes one parameter: the returned tuple,
                                    or None (if not found and not blocking)
         @type returnCallbackFunc: function
+        @param timeout: The maximum time (in seconds) a blocking operation
+                        should wait for a matching tuple
+        @type timeout: float
         """
         if removeTuple:
             if blocking:
-                resourceTuple = yield self.get(dTuple)
+                resourceTuple = yield self.get(dTuple, timeout=timeout)
             else:
-                resourceTuple = yield self.getIfExists(dTuple)
+                # Tuples of other nodes can only be taken from their owners
+                resourceTuple = yield self.claimTuple(dTuple)
         else:
             if blocking:
-                resourceTuple = yield self.read(dTuple)
+                resourceTuple = yield self.read(dTuple, timeout=timeout)
             else:
                 resourceTuple = yield self.readIfExists(dTuple)
         
@@ -355,7 +455,7 @@ class MobilIVRNode(StaticTupleSpacePeer):
         returnValue(resourceTuple)
 
     @inlineCallbacks
-    def getResource(self, resType, returnCallbackFunc, blocking=True, removeResource=True):
+    def getResource(self, resType, returnCallbackFunc, blocking=True, removeResource=True, timeout=None):
         """ 
         Retrieves an IVR or SMS resource from the MobilIVR tuple space
         
@@ -375,21 +475,41 @@ class MobilIVRNode(StaticTupleSpacePeer):
                          read the resource information, leaving it in the tuple
                          space
         @type removeResource: bool
+        @param timeout: The maximum time (in seconds) a blocking operation
+                        should wait for a resource to become available; if not
+                        specified, wait indefinitely
+        @type timeout: float
         """
         
-        resourceTemplate = ('resource', resType, str)
-        found = [0]
+        resourceTemplate = self._resourceTemplate(resType)
+        if timeout != None:
+            deadline = time.time() + timeout
 
+        # Blocking operations wait on the tuple space until a resource tuple is
+        # put; the loop only repeats to skip resources of unreachable nodes
         while 1:
-            #print '...loop getResource'
             if removeResource:
-                if blocking:
-                    resourceTuple = yield self.get(resourceTemplate)
+                # Claim the resource from the node that owns it, so that no
+                # other node can be handed the same resource
+                if self._replicaCache == None:
+                    resourceTuple = yield self.claimTuple(resourceTemplate)
                 else:
-                    resourceTuple = yield self.getIfExists(resourceTemplate)
+                    # The replicas of the resource may have been evicted from
+                    # the cache; ask the other nodes if there are none here
+                    resourceTuple = yield self.getDistributed(resourceTemplate)
+                if resourceTuple == None and blocking:
+                    # Wait until a resource is (re)published, then try to claim it
+                    if timeout == None:
+                        available = yield self.read(resourceTemplate)
+                    elif deadline > time.time():
+                        available = yield self.read(resourceTemplate, timeout=deadline-time.time())
+                    else:
+                        available = None
+                    if available != None:
+                        continue
             else:
                 if blocking:
-                    resourceTuple = yield self.read(resourceTemplate)
+                    resourceTuple = yield self.read(resourceTemplate, timeout=timeout)
                 else:
                     resourceTuple = yield self.readIfExists(resourceTemplate)
 
@@ -398,26 +518,30 @@ class MobilIVRNode(StaticTupleSpacePeer):
             #print '---------------------------'
             if resourceTuple != None:
                 remoteNodeID = resourceTuple[2]
+                # Outgoing IVR resources specify the Asterisk channel to use
+                resourceArgs = resourceTuple[3:]
                 if remoteNodeID ==  self.id:
                     self._log.info('Local resource found')
-                    returnCallbackFunc(None, self.invokeResource(resType), resourceTuple)
+                    returnCallbackFunc(None, self.invokeResource(resType, *resourceArgs), resourceTuple)
                     return
                 contact = yield self.findContact(remoteNodeID)
                 if contact == None:
                     # The resource entry was found on the DHT, but the remote node responsible for it no longer exists
-                    if not removeResource:
-                        # Since this resource is useless now (and we haven't removed it with a get) delete the resource entry by simply issueing a "get"
-                        yield self.getIfExists(resourceTemplate)
+                    # Since its resources are useless now, delete all of them
+                    self.purgeOwner(remoteNodeID)
                 else:
                     #print '-- contact found ---'
                     #print contact
                     #print '---------------------------'
                     try:
-                        resourceInfo = yield contact.invokeResource(resType)
+                        resourceInfo = yield contact.invokeResource(resType, *resourceArgs)
                         self._log.info('Remote resource found: ' + str(resourceInfo))
                     except TimeoutError:
                         self._log.error('RPC Timeout error, no response from remote contact!')
                         resourceInfo = None
+                        if removeResource:
+                            # Don't keep the owner's lease pinned (best effort)
+                            self.releaseTuple(resourceTuple)
                     #print '--- resource info ---'
                     #print resourceInfo
                     #print
@@ -427,12 +551,47 @@ class MobilIVRNode(StaticTupleSpacePeer):
                 returnCallbackFunc(None, None, None)
                 return
     
+    @inlineCallbacks
+    def releaseResource(self, resourceTuple, returnCallbackFunc=None):
+        """ Returns a resource obtained with C{getResource()} to the node that
+        published it, so that it can be claimed again
+        
+        @param resourceTuple: The resource tuple passed to the C{getResource()}
+                              callback function
+        @type resourceTuple: tuple
+        @param returnCallbackFunc: A callable object that is called (without
+                                   arguments) once the resource was released
+        @type returnCallbackFunc: function
+        """
+        self._log.info('Releasing resource: ' + resourceTuple[1])
+        released = yield self.releaseTuple(resourceTuple)
+        if not released:
+            self._log.warning('Resource owner did not accept the released resource: ' + str(resourceTuple))
+        if callable(returnCallbackFunc):
+            returnCallbackFunc()
+    
+    def _channelCapacity(self, channel):
+        """ Returns the number of simultaneous calls the specified local
+        Asterisk channel supports """
+        return self.resourceConfig['ivr']['tx'].get('channel_capacity', {}).get(channel, 1)
+    
+    def _resourceTemplate(self, resType):
+        if resType == 'ivr':
+            # ('resource', 'ivr', nodeID, channel)
+            return ('resource', resType, str, str)
+        return ('resource', resType, str)
+    
     @rpcmethod
-    def invokeResource(self, resType):
+    def invokeResource(self, resType, channel=None):
         """ Called by a remote peer node to indicate that it wants to use a
         resource published by this node; what is returned is dependant on the
         actual resource, but is usually direct-access information for the relevant
         physical resource (e.g. the address/port of a Kannel SMS gateway)
+        
+        @param channel: The Asterisk channel that was claimed (for IVR
+                        resources); if not specified, the first configured
+                        channel is used
+        @type channel: str
         """
         if resType not in self.resourceConfig:
             return None
@@ -446,8 +605,10 @@ class MobilIVRNode(StaticTupleSpacePeer):
             if 'tx' not in self.resourceConfig['ivr']:
                 return None
             settings = self.resourceConfig['ivr']['tx']
-            #TODO: Have more than one channel - tuple would need updating as well
-            useChan = settings['channels'][0]
+            if channel in settings['channels']:
+                useChan = channel
+            else:
+                useChan = settings['channels'][0]
             self._log.info('Handing over location information of the local outgoing IVR resource')
             return settings['host'], settings['port'], useChan, settings['username'], settings['secret'],             settings['gateway_address'], settings['prefix'], settings['internal_extension_length']
         
@@ -477,13 +638,10 @@ class MobilIVRNode(StaticTupleSpacePeer):
                 self._log.info('Handing over location information of the local IVR Handler')
                 return self.resourceConfig['ivr']['fastagi_port']
         elif event['type'] == 'shutdown':
-            # A node has been shut down; remove it from our routing table
-            #TODO: The following code should be moved into Entangled, by means of a "purgeContact" or similar (or simply a "force" parameter to RoutingTable.removeContact())
-            contactBucketIndex = self._routingTable._kbucketIndex(event['nodeID'])
-            try:
-                self._routingTable._buckets[contactBucketIndex].removeContact(event['nodeID'])
-            except ValueError:
-                pass
+            # A node has been shut down; remove it from our contact table,
+            # together with everything it published
+            self.contacts.remove(event['nodeID'])
+            self.purgeOwner(event['nodeID'])
             return 'OK'
 
     def _doRunApplication(self, app):
@@ -495,6 +653,12 @@ class MobilIVRNode(StaticTupleSpacePeer):
 
     def publishHandler(self, handlerType, args={}):
         """ stub for publishing applications """
+        self._log.info('Publishing handler: ' + handlerType)
+        df = self.put(self._handlerTuple(handlerType, args))
+        return df
+
+    def _handlerTuple(self, handlerType, args={}):
+        """ Builds the tuple describing a local handler of C{handlerType} """
         if handlerType == 'ivr':
             handlerTuple = ('handler', 'ivr', self.id, args.get('channel', ''), args.get('callerID', ''))
             #print 'putting handler:',handlerTuple
@@ -503,10 +667,7 @@ class MobilIVRNode(StaticTupleSpacePeer):
         else:
             handlerTuple = ('handler', handlerType, self.id)
             #print 'putting handler:',handlerTuple
-        #print 'publishing handler:', handlerType
-        self._log.info('Publishing handler: ' + handlerType)
-        df = self.put(handlerTuple)
-        return df
+        return handlerTuple
 
     def runApplication(self, app, args={}):
         """ Schedule a call for this application in the reactor
@@ -540,7 +701,7 @@ class MobilIVRNode(StaticTupleSpacePeer):
         if hasattr(app, 'handleSMS'):
             if callable(app.handleSMS):
                 if self._joinedNetwork == False:
-                    self._callQueue.append((self.publishHandler, 'sms'))
+                    self._handlerQueue.append(('sms', {}))
                 else:
                     self.publishHandler('sms')
                 self._localSMSHandlers.append(app)
@@ -548,7 +709,7 @@ class MobilIVRNode(StaticTupleSpacePeer):
         if hasattr(app, 'handleIVR'):
             if callable(app.handleIVR):
                 if self._joinedNetwork == False:
-                    self._callQueue.append((self.publishHandler, 'ivr', args))
+                    self._handlerQueue.append(('ivr', args))
                 else:
                     self.publishHandler('ivr')
                 self._localIVRHandlers.append((app, args))
@@ -584,10 +745,32 @@ class MobilIVRNode(StaticTupleSpacePeer):
     def joinNetwork(self, knownNodeAddresses=None):
         self._log.info('Joining network')
         StaticTupleSpacePeer.joinNetwork(self, knownNodeAddresses)
+        self._joinDeferred.addCallback(self._watchTuples)
+        self._joinDeferred.addCallback(self._removeRecoveredHandlers)
         self._joinDeferred.addCallback(self.startServices)
         self._joinDeferred.addCallback(self._execCallQueue)
         self._joinDeferred.addErrback(self._joinFailed)
         
+    def _watchTuples(self, result):
+        """ Subscribes to the handlers and resources of the other nodes """
+        self.subscribe(*self._watchedTemplates)
+        return result
+        
+    def _removeRecoveredHandlers(self, result):
+        """ Removes the handlers this node published before a restart, which
+        were recovered from a persistent data store; the node's current
+        handlers are published once it has joined """
+        self._removeRecoveredTuples(('handler', None, self.id), ('handler', None, self.id, None, None))
+        return result
+        
+    def _removeRecoveredTuples(self, *templates):
+        """ Removes every copy of the tuples owned by this node that match
+        any of the templates """
+        for template in templates:
+            for key in self._findKeys(template, 0):
+                if key[0] == self.id:
+                    self._removeKey(key, allCopies=True)
+        
     def _joinFailed(self, error):
         error.trap(Exception)
         msg = error.getErrorMessage()
@@ -596,6 +779,11 @@ class MobilIVRNode(StaticTupleSpacePeer):
         
     def _execCallQueue(self, result):
         #self._joinDeferred = None
+        if len(self._handlerQueue) > 0:
+            for handlerType, args in self._handlerQueue:
+                self._log.info('Publishing handler: ' + handlerType)
+            self.putMany([self._handlerTuple(handlerType, args) for handlerType, args in self._handlerQueue])
+            self._handlerQueue = []
         if len(self._callQueue) > 0:
             queuedCall = self._callQueue.pop()
             func = queuedCall[0]
@@ -612,6 +800,7 @@ if __name__ == '__main__':
         print 'Usage:\n%s UDP_PORT  [KNOWN_NODE_IP  KNOWN_NODE_PORT]' % sys.argv[0]
         print 'or:\n%s UDP_PORT  [FILE_WITH_KNOWN_NODES]' % sys.argv[0]
         print '\nIf a file is specified, it should containg one IP address and UDP port\nper line, seperated by a space.'
+        print 'If no known node is specified, nodes are discovered by multicast on the local network.'
         sys.exit(1)
     try:
         int(sys.argv[1])
@@ -620,6 +809,7 @@ if __name__ == '__main__':
         print 'Usage:\n%s UDP_PORT  [KNOWN_NODE_IP  KNOWN_NODE_PORT]' % sys.argv[0]
         print 'or:\n%s UDP_PORT  [FILE_WITH_KNOWN_NODES]' % sys.argv[0]
         print '\nIf a file is specified, it should contain one IP address and UDP port\nper line, seperated by a space.'
+        print 'If no known node is specified, nodes are discovered by multicast on the local network.'
         sys.exit(1)
 
     
@@ -639,7 +829,8 @@ if __name__ == '__main__':
 
 
 
-    node = MobilIVRNode(int(sys.argv[1]), )
+    # Without known nodes, find the nodes on the local network
+    node = MobilIVRNode(int(sys.argv[1]), multicastDiscovery=(knownNodes == None))
 
     # Set up the node to publish some resources
     configDir = os.path.abspath(sys.path[0])+'/etc'
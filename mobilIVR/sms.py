@@ -99,35 +99,47 @@ class SMSSender(mobilIVR.resources.Resource):
     sending SMS messages)
     """
     def __init__(self, node):
-        self._gotResource = False
         self._localNode = node
         self.kannelAddress = None
         self.kannelPort = None
         self.kannelUsername = None
         self.kannelPassword = None
 
-    def getResource(self):
-        def gotResourceDetails(remoteContact, resourceInfo, resourceTuple):
-            self._gotResource = True
-            if resourceInfo != None:
-                self.kannelAddress, self.kannelPort, self.kannelUsername, self.kannelPassword = resourceInfo
-                if self.kannelAddress in ('127.0.0.1', 'localhost') and remoteContact != None:
-                    self.kannelAddress = remoteContact.address
-        twisted.internet.reactor.callFromThread(self._localNode.getResource, 'sms', gotResourceDetails, removeResource=False) #IGNORE:E1101
-        while self._gotResource == False:
-            time.sleep(0.1)
+    def getResource(self, timeout=None):
+        """ Find and retrieve an SMS gateway; blocking operation
+        
+        @param timeout: The maximum time (in seconds) to wait for an SMS
+                        gateway to be published; if not specified, wait
+                        indefinitely
+        @type timeout: float
+        """
+        self._requestResource(blocking=True, timeout=timeout)
 
     def getResourceIfExists(self):
+        """ Find and retrieve an SMS gateway; non-blocking operation """
+        self._requestResource(blocking=False)
+        return self.kannelAddress != None
+
+    def _requestResource(self, blocking, timeout=None):
+        """ Asks the local node for an SMS gateway, and waits (without
+        polling) until the node's reactor thread has answered """
         def gotResourceDetails(remoteContact, resourceInfo, resourceTuple):
-            self._gotResource = True
             if resourceInfo != None:
                 self.kannelAddress, self.kannelPort, self.kannelUsername, self.kannelPassword = resourceInfo
                 if self.kannelAddress in ('127.0.0.1', 'localhost') and remoteContact != None:
                     self.kannelAddress = remoteContact.address
-        twisted.internet.reactor.callFromThread(self._localNode.getResource, 'sms', gotResourceDetails, blocking=False, removeResource=False) #IGNORE:E1101
-        while self._gotResource == False:
-            time.sleep(0.1)
-        return self.kannelAddress != None
+            resourceFound.set()
+        def requestFailed(failure):
+            # Report the failure as "no gateway found", rather than leaving
+            # the calling thread waiting forever
+            self._localNode._log.error('Error while locating SMS gateway: ' + failure.getErrorMessage())
+            resourceFound.set()
+        def requestResource():
+            df = self._localNode.getResource('sms', gotResourceDetails, blocking=blocking, removeResource=False, timeout=timeout)
+            df.addErrback(requestFailed)
+        resourceFound = threading.Event()
+        twisted.internet.reactor.callFromThread(requestResource) #IGNORE:E1101
+        resourceFound.wait()
 
     def sendMessage(self, message, destination, origin='MobilIVR'):
         """ Sends an SMS to one or many numbers
@@ -45,6 +45,7 @@ if __name__ == '__main__':
         print 'Usage:\n%s UDP_PORT  [KNOWN_NODE_IP  KNOWN_NODE_PORT]' % sys.argv[0]
         print 'or:\n%s UDP_PORT  [FILE_WITH_KNOWN_NODES]' % sys.argv[0]
         print '\nIf a file is specified, it should containg one IP address and UDP port\nper line, seperated by a space.'
+        print 'If no known node is specified, nodes are discovered by multicast on the local network.'
         sys.exit(1)
     try:
         int(sys.argv[1])
@@ -53,6 +54,7 @@ if __name__ == '__main__':
         print 'Usage:\n%s UDP_PORT  [KNOWN_NODE_IP  KNOWN_NODE_PORT]' % sys.argv[0]
         print 'or:\n%s UDP_PORT  [FILE_WITH_KNOWN_NODES]' % sys.argv[0]
         print '\nIf a file is specified, it should contain one IP address and UDP port\nper line, seperated by a space.'
+        print 'If no known node is specified, nodes are discovered by multicast on the local network.'
         sys.exit(1)
 
     if len(sys.argv) == 4:
@@ -68,9 +70,10 @@ if __name__ == '__main__':
     else:
         knownNodes = None
 
-    node = StaticTupleSpacePeer( udpPort=int(sys.argv[1]) )
+    # Without known nodes, find the nodes on the local network
+    node = StaticTupleSpacePeer( udpPort=int(sys.argv[1]), multicastDiscovery=(knownNodes == None) )
     node.put(('handler', 'jokeapp'), node.id)
     node.put(('ivr', 'english', 'time'), node.id)
-    node.put('otherTuple', 'jjksl33434')
+    node.put(('otherTuple',), 'jjksl33434')
     node.joinNetwork(knownNodes)
     twisted.internet.reactor.run()
\ No newline at end of file
@@ -0,0 +1,139 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2008 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+#    http://epydoc.sf.net                                                    #
+
+"""
+@author: Bryan McAlister
+
+Provides an in-process network of StaticTupleSpace peers, shared by the unit tests
+"""
+
+#!/usr/bin/env python
+
+import sys
+sys.path.append('../../')
+from network.staticTupleSpace import StaticTupleSpacePeer
+from network.rpc.msgtypes import ResponseMessage
+from network.rpc.contact import Contact
+from network.rpc.encoding import Bencode
+from network.rpc.protocol import TimeoutError
+from twisted.internet import defer
+
+
+class LoopbackRPCProtocol(object):
+    """ Fake RPC protocol that delivers RPCs directly to other peers in the same process
+    
+    RPC arguments and results are passed through the Bencode encoder, just as
+    they would be when sent over the network, and membership updates are
+    piggybacked on requests and responses. RPCs to peers that have been
+    removed from the network (or that are listed as unreachable) time out
+    immediately.
+    """
+    def __init__(self, network):
+        self.network = network
+        self.encoder = Bencode()
+        self.node = None
+        self.sentRPCs = []
+        # The node IDs of peers this peer cannot reach (e.g. due to a network partition)
+        self.unreachable = set()
+        
+    def sendRPC(self, contact, method, args, rawResponse=False):
+        self.sentRPCs.append((contact.id, method))
+        peer = self.network.get((contact.address, contact.port))
+        if peer == None or contact.id in self.unreachable:
+            return defer.fail(TimeoutError(contact.id))
+        func = getattr(peer, method, None)
+        if func == None:
+            return defer.fail(TimeoutError(contact.id))
+        args = self.encoder.decode(self.encoder.encode(args))
+        self._gossip(self.node, peer)
+        senderContact = Contact(self.node.id, '127.0.0.1', self.node.port, peer._protocol)
+        try:
+            try:
+                result = func(*args, **{'_rpcNodeID': self.node.id, '_rpcNodeContact': senderContact})
+            except TypeError:
+                result = func(*args)
+        except Exception, e:
+            return defer.fail(e)
+        df = defer.maybeDeferred(lambda: result)
+        df.addCallback(lambda result: self.encoder.decode(self.encoder.encode(result)))
+        df.addCallback(self._receiveGossip, peer)
+        if rawResponse:
+            df.addCallback(lambda result: (ResponseMessage('rpcId', peer.id, result), (contact.address, contact.port)))
+        return df
+    
+
+    def _receiveGossip(self, result, peer):
+        self._gossip(peer, self.node)
+        return result
+    
+    def _gossip(self, sender, receiver):
+        # Super-nodes do not run the membership protocol between sites
+        if getattr(receiver, 'membership', None) != None:
+            receiver.membership.received(sender.id, self.encoder.decode(self.encoder.encode(sender.membership.piggyback())))
+
+
+class FederationLoopbackProtocol(LoopbackRPCProtocol):
+    """ Fake RPC protocol of the federation of a (possible) super-node, which
+    sends its RPCs as the peer's current federation """
+    def __init__(self, network, peer):
+        LoopbackRPCProtocol.__init__(self, network)
+        self.peer = peer
+    
+    node = property(lambda self: self.peer.federation, lambda self, node: None)
+
+
+class FederationEndpoint(object):
+    """ Receives the federation RPCs sent to a peer, while it is a super-node """
+    def __init__(self, peer):
+        self.peer = peer
+    
+    def __getattr__(self, name):
+        return getattr(self.peer.federation, name)
+
+
+def createLoopbackNetwork(numberOfPeers, **kwargs):
+    """ Creates peers that communicate via LoopbackRPCProtocol, and know each other as contacts
+    
+    Keyword arguments are passed on to the constructor of each peer
+    """
+    network = {}
+    peers = []
+    for i in range(numberOfPeers):
+        peerProtocol = LoopbackRPCProtocol(network)
+        peer = StaticTupleSpacePeer(id='peer%d' % i, udpPort=5000+i, networkProtocol=peerProtocol, **kwargs)
+        peerProtocol.node = peer
+        network[('127.0.0.1', peer.port)] = peer
+        peers.append(peer)
+    for peer in peers:
+        for other in peers:
+            if other != peer:
+                peer.contacts.add(Contact(other.id, '127.0.0.1', other.port, peer._protocol))
+    return network, peers
@@ -0,0 +1,132 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2009 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+#    http://epydoc.sf.net                                                    #
+
+
+"""
+@author: Bryan McAlister
+
+Provides unit tests for the Bloom filter tuple summaries of the StaticTupleSpace
+"""
+
+#!/usr/bin/env python
+
+import cPickle
+import unittest
+
+import sys
+sys.path.append('../../')
+from network.bloom import CountingBloomFilter, BloomFilter, TupleSummary, PeerSummary, groupKey
+
+
+class BloomFilterTest(unittest.TestCase):
+    """ Tests adding, removing and testing items of Bloom filters """
+    def setUp(self):
+        self.filter = CountingBloomFilter(256, 3)
+
+    def testMembership(self):
+        for i in range(20):
+            self.filter.add(('node', i))
+        for i in range(20):
+            self.failUnless(('node', i) in self.filter, 'Bloom filters should not give false negatives')
+        falsePositives = len([i for i in range(20, 220) if ('node', i) in self.filter])
+        self.failUnless(falsePositives < 20, 'Too many false positives: %d' % falsePositives)
+
+    def testRemove(self):
+        self.filter.add('a')
+        self.filter.add('a')
+        self.filter.add('b')
+        self.filter.remove('a')
+        self.failUnless('a' in self.filter, 'Items added twice should remain after one removal')
+        self.filter.remove('a')
+        self.filter.remove('b')
+        self.failIf('a' in self.filter)
+        self.failUnlessEqual(self.filter.bits(), '\x00' * 32)
+
+    def testBits(self):
+        for i in range(20):
+            self.filter.add(('node', i))
+        received = BloomFilter(self.filter.bits(), 3)
+        for i in range(30):
+            self.failUnlessEqual(('node', i) in received, ('node', i) in self.filter)
+
+
+class TupleSummaryTest(unittest.TestCase):
+    """ Tests summarising tuples per group, and exchanging the summaries """
+    def setUp(self):
+        self.summary = TupleSummary()
+        self.summary.add(('resource', 'ivr', 'node1', 3, 'gp'))
+        self.summary.add(('handler', 'sms', 'node2'))
+
+    def testMayMatch(self):
+        self.failUnless(self.summary.mayMatch(('resource', 'ivr', str, None, 'gp')))
+        self.failUnless(self.summary.mayMatch(('handler', str, 'node2')))
+        self.failUnless(self.summary.mayMatch(('resource', 'ivr', 'node1', 3.0, 'gp')), 'Equal numbers should match')
+        self.failIf(self.summary.mayMatch(('resource', 'sms', str, None, None)))
+        self.failIf(self.summary.mayMatch(('handler', 'sms', 'node3')))
+        self.failIf(self.summary.mayMatch(('handler', 'sms', str, str)), 'Templates should only match tuples of the same length')
+
+    def testIncrementalChanges(self):
+        peerSummary = PeerSummary()
+        changes = self.summary.changes(peerSummary.versions())
+        self.failUnlessEqual(len(changes), 2)
+        peerSummary.update(changes)
+        self.failUnless(peerSummary.mayMatch(('handler', 'sms', 'node2')))
+        self.failUnlessEqual(self.summary.changes(peerSummary.versions()), [], 'Unchanged summaries should not be sent again')
+        self.summary.add(('handler', 'sms', 'node3'))
+        changes = self.summary.changes(peerSummary.versions())
+        self.failUnlessEqual(len(changes), 1, 'Only the changed group should be sent')
+        peerSummary.update(changes)
+        self.failUnless(peerSummary.mayMatch(('handler', 'sms', 'node3')))
+        self.summary.remove(('handler', 'sms', 'node2'))
+        self.summary.remove(('handler', 'sms', 'node3'))
+        peerSummary.update(self.summary.changes(peerSummary.versions()))
+        self.failIf(peerSummary.mayMatch(('handler', str, str)), 'The summaries of emptied groups should be dropped')
+        self.failUnless(peerSummary.mayMatch(('resource', 'ivr', str, int, str)))
+
+    def testMalformedChanges(self):
+        peerSummary = PeerSummary()
+        bits = self.summary.changes({})[0][2]
+        maliciousKey = cPickle.dumps(('resource', 'ivr'))
+        peerSummary.update([[maliciousKey, 1, bits], ['l8:resourcee', 'x', bits], ['li1e', 1, bits], ['l8:handlere', 1, ''], 'entry'])
+        self.failUnlessEqual(peerSummary.versions(), {}, 'Malformed summaries should be skipped, and never unpickled')
+        peerSummary.update([[groupKey(('handler', 'sms')), 1, bits]])
+        self.failUnlessEqual(peerSummary.versions(), {groupKey(('handler', 'sms')): 1})
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(BloomFilterTest))
+    suite.addTest(unittest.makeSuite(TupleSummaryTest))
+    return suite
+
+if __name__ == '__main__':
+    # If this module is executed from the commandline, run all its tests
+    unittest.TextTestRunner().run(suite())
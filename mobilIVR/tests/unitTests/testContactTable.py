@@ -0,0 +1,104 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2009 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+#    http://epydoc.sf.net                                                    #
+
+"""
+@author: Bryan McAlister
+
+Provides unit tests for the contact table of the StaticTupleSpace
+"""
+
+#!/usr/bin/env python
+
+import unittest
+
+import sys
+sys.path.append('../../')
+from network.contacttable import ContactTable
+from network.rpc.contact import Contact
+from network.rpc import constants
+
+
+class ContactTableTest(unittest.TestCase):
+    """ Tests interning of contacts, and recording of their liveness """
+    def setUp(self):
+        self.table = ContactTable()
+
+    def testIntern(self):
+        contact = self.table.intern('node1', '127.0.0.1', 4000, None)
+        self.failUnless(self.table.intern('node1', '127.0.0.1', 4000, None) is contact, 'Only one object should exist per node ID')
+        self.failUnless(self.table.add(Contact('node1', '10.0.0.1', 4001, None)) is contact)
+        self.failUnlessEqual((contact.address, contact.port), ('10.0.0.1', 4001), 'The address of a known contact should be updated')
+        self.failUnless(self.table.get('node1') is contact)
+        self.failUnlessEqual(self.table.get('node2'), None)
+        self.failUnless('node1' in self.table)
+
+    def testOrder(self):
+        for contactID in ('node3', 'node1', 'node2'):
+            self.table.intern(contactID, '127.0.0.1', 4000, None)
+        self.failUnlessEqual([contact.id for contact in self.table], ['node3', 'node1', 'node2'])
+
+    def testSmoothedRTT(self):
+        contact = self.table.intern('node1', '127.0.0.1', 4000, None)
+        contact.seen(0.1)
+        self.failUnlessEqual(contact.rtt, 0.1)
+        contact.seen(0.9)
+        self.failUnlessAlmostEqual(contact.rtt, 0.1 + 0.8 * constants.rttSmoothing)
+        contact.seen()
+        self.failUnlessAlmostEqual(contact.rtt, 0.1 + 0.8 * constants.rttSmoothing, msg='Messages other than responses should not affect the RTT')
+        self.failIfEqual(contact.lastSeen, 0)
+
+    def testFailures(self):
+        contact = self.table.intern('node1', '127.0.0.1', 4000, None)
+        self.failIf(self.table.contactFailed('node1'))
+        contact.seen()
+        self.failUnlessEqual(contact.failures, 0, 'A response should reset the failure count')
+        for i in range(constants.contactFailureLimit - 1):
+            self.failIf(self.table.contactFailed('node1'))
+        self.failUnless(self.table.contactFailed('node1'))
+        self.failIf('node1' in self.table, 'Dead contacts should be removed')
+        self.failIf(self.table.contactFailed('node1'))
+
+    def testPreference(self):
+        for contactID, rtt in (('slow', 0.3), ('fast', 0.01), ('failing', 0.001), ('new', None)):
+            self.table.intern(contactID, '127.0.0.1', 4000, None).seen(rtt)
+        self.table.contactFailed('failing')
+        self.failUnlessEqual(self.table.preferred(['unknown', 'failing', 'new', 'slow', 'fast']), \
+                             ['fast', 'slow', 'new', 'failing', 'unknown'])
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ContactTableTest))
+    return suite
+
+if __name__ == '__main__':
+    # If this module is executed from the commandline, run all its tests
+    unittest.TextTestRunner().run(suite())
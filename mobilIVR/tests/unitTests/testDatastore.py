@@ -45,8 +45,12 @@ Provides unit tests to test the Mobiled.network.datastore module
 import unittest
 import time
 import random
+import os, tempfile
+import sqlite3, cPickle
 
-import entangled.kademlia.datastore
+import sys
+sys.path.append('../../')
+import network.datastore
 
 import hashlib
 
@@ -54,7 +58,7 @@ class DictDataStoreTest(unittest.TestCase):
     """ Basic tests case for the reference DataStore API and implementation """
     def setUp(self):
         if not hasattr(self, 'ds'):
-            self.ds = entangled.kademlia.datastore.DictDataStore()
+            self.ds = network.datastore.DictDataStore()
         h = hashlib.sha1()
         h.update('g')
         hashKey = h.digest()
@@ -173,14 +177,206 @@ class DictDataStoreTest(unittest.TestCase):
 
 class SQLiteDataStoreTest(DictDataStoreTest):
     def setUp(self):
-        self.ds = entangled.kademlia.datastore.SQLiteDataStore()
+        self.ds = network.datastore.SQLiteDataStore()
         DictDataStoreTest.setUp(self)
 
 
+class StaticTupleSpaceDictDataStoreTest(DictDataStoreTest):
+    """ Tests the data stores used by the Static Tuple Space, including their
+    bulk and single-row operations """
+    def setUp(self):
+        if not hasattr(self, 'ds'):
+            self.ds = network.datastore.DictDataStore()
+        DictDataStoreTest.setUp(self)
+    
+    def testGetRecord(self):
+        now = int(time.time())
+        for key, value in self.cases:
+            self.ds.setItem(key, value, now, now - 10, 'node1')
+        for key, value in self.cases:
+            self.failUnlessEqual(self.ds.getRecord(key), (value, now, now - 10, 'node1'))
+        self.failUnlessRaises(KeyError, self.ds.getRecord, 'nonExistentKey')
+    
+    def testSetItems(self):
+        now = int(time.time())
+        self.ds.setItem(self.cases[0][0], 'abc', now, now, 'node1')
+        self.ds.setItems([(key, value, now, now, 'node2') for key, value in self.cases])
+        self.failUnlessEqual(len(self.ds.keys()), len(self.cases))
+        for key, value in self.cases:
+            self.failUnlessEqual(self.ds[key], value)
+            self.failUnlessEqual(self.ds.originalPublisherID(key), 'node2')
+    
+    def testPublisherKeys(self):
+        now = int(time.time())
+        half = len(self.cases) / 2
+        self.ds.setItems([(key, value, now, now, 'node1') for key, value in self.cases[:half]])
+        self.ds.setItems([(key, value, now, now, 'node2') for key, value in self.cases[half:]])
+        self.failUnlessEqual(sorted(self.ds.publisherKeys('node1')), sorted([key for key, value in self.cases[:half]]))
+        self.failUnlessEqual(self.ds.publisherKeys('node3'), [])
+        # Keys move to their new publisher when they are set again
+        self.ds.setItem(self.cases[0][0], 'abc', now, now, 'node2')
+        self.failIf(self.cases[0][0] in self.ds.publisherKeys('node1'))
+        self.failUnless(self.cases[0][0] in self.ds.publisherKeys('node2'))
+        del self.ds[self.cases[-1][0]]
+        self.failUnlessEqual(len(self.ds.publisherKeys('node2')), len(self.cases) - half)
+    
+    def testRemoveItems(self):
+        now = int(time.time())
+        self.ds.setItems([(key, value, now, now, 'node1') for key, value in self.cases])
+        self.ds.removeItems(self.ds.publisherKeys('node1')[1:])
+        self.failUnlessEqual(len(self.ds), 1)
+        self.failUnlessEqual(len(self.ds.publisherKeys('node1')), 1)
+
+
+class StaticTupleSpaceSQLiteDataStoreTest(StaticTupleSpaceDictDataStoreTest):
+    def setUp(self):
+        self.ds = network.datastore.SQLiteDataStore()
+        StaticTupleSpaceDictDataStoreTest.setUp(self)
+    
+    def testPersistence(self):
+        dbFile = tempfile.mktemp()
+        try:
+            ds = network.datastore.SQLiteDataStore(dbFile)
+            ds.setItems([(key, value, 1, 2, 'node1') for key, value in self.cases])
+            ds.close()
+            ds = network.datastore.SQLiteDataStore(dbFile)
+            for key, value in self.cases:
+                self.failUnlessEqual(ds.getRecord(key), (value, 1, 2, 'node1'))
+            ds.close()
+        finally:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(dbFile + suffix):
+                    os.remove(dbFile + suffix)
+    
+    def testUpgrade(self):
+        """ Entries of databases created by the previous version (with hex-encoded keys) should be dropped """
+        dbFile = tempfile.mktemp()
+        try:
+            db = sqlite3.connect(dbFile)
+            db.execute('CREATE TABLE data(key, value, lastPublished, originallyPublished, originalPublisherID)')
+            for key, value in self.cases:
+                db.execute('INSERT INTO data(key, value, lastPublished, originallyPublished, originalPublisherID) VALUES (?, ?, ?, ?, ?)', \
+                           (key.encode('hex'), buffer(cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)), 1, 2, 'node1'))
+            db.commit()
+            db.close()
+            ds = network.datastore.SQLiteDataStore(dbFile)
+            self.failUnlessEqual(ds.keys(), [])
+            ds.setItem(self.cases[0][0], self.cases[0][1], 1, 2, 'node1')
+            self.failUnlessEqual(ds.getRecord(self.cases[0][0]), (self.cases[0][1], 1, 2, 'node1'))
+            ds.close()
+        finally:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(dbFile + suffix):
+                    os.remove(dbFile + suffix)
+
+
+class LogDataStoreTest(StaticTupleSpaceDictDataStoreTest):
+    def setUp(self):
+        self.logFile = tempfile.mktemp()
+        self.ds = network.datastore.LogDataStore(self.logFile)
+        StaticTupleSpaceDictDataStoreTest.setUp(self)
+    
+    def tearDown(self):
+        self.ds.close()
+        os.remove(self.logFile)
+    
+    def reopen(self):
+        self.ds.close()
+        self.ds = network.datastore.LogDataStore(self.logFile)
+    
+    def testRecovery(self):
+        now = int(time.time())
+        for key, value in self.cases:
+            self.ds.setItem(key, 'abc', now, now, 'node1')
+        self.ds.setItems([(key, value, now, now - 10, 'node2') for key, value in self.cases])
+        del self.ds[self.cases[0][0]]
+        self.reopen()
+        self.failUnlessEqual(len(self.ds), len(self.cases) - 1)
+        self.failIf(self.cases[0][0] in self.ds, 'Deleted items should not be recovered')
+        for key, value in self.cases[1:]:
+            self.failUnlessEqual(self.ds.getRecord(key), (value, now, now - 10, 'node2'))
+        self.failUnlessEqual(sorted(self.ds.publisherKeys('node2')), sorted([key for key, value in self.cases[1:]]))
+        self.failUnlessEqual(self.ds.publisherKeys('node1'), [])
+    
+    def testIncompleteRecord(self):
+        for key, value in self.cases:
+            self.ds.setItem(key, value, 1, 1, 'node1')
+        logSize = os.path.getsize(self.logFile)
+        self.ds.setItem('lastKey', 'some data', 1, 1, 'node1')
+        self.ds.close()
+        # Simulate a crash while the last record was being written
+        logFile = open(self.logFile, 'r+b')
+        logFile.truncate(os.path.getsize(self.logFile) - 3)
+        logFile.close()
+        self.ds = network.datastore.LogDataStore(self.logFile)
+        self.failIf('lastKey' in self.ds)
+        self.failUnlessEqual(os.path.getsize(self.logFile), logSize, 'The incomplete record should be discarded')
+        for key, value in self.cases:
+            self.failUnlessEqual(self.ds[key], value)
+        self.ds.setItem('lastKey', 'other data', 1, 1, 'node1')
+        self.reopen()
+        self.failUnlessEqual(self.ds['lastKey'], 'other data')
+    
+    def testKeyTooLarge(self):
+        self.ds.setItem('a', 'data', 1, 1, 'node1')
+        largeKey = 'k' * (self.ds.maxKeySize + 1)
+        self.failUnlessRaises(ValueError, self.ds.setItem, largeKey, 'data', 1, 1, 'node1')
+        self.failUnlessRaises(ValueError, self.ds.setItems, [('b', 'data', 1, 1, 'node1'), (largeKey, 'data', 1, 1, 'node1')])
+        self.failIf('b' in self.ds, 'No item of a batch with an invalid key should be written')
+        self.reopen()
+        self.failUnlessEqual(self.ds.keys(), ['a'])
+        
+    def testCompaction(self):
+        for i in range(10):
+            self.ds.setItems([(key, (value, i), i, 0, 'node1') for key, value in self.cases])
+        del self.ds[self.cases[0][0]]
+        self.failIf(self.ds.compact(), 'Small logs should not be compacted')
+        logSize = os.path.getsize(self.logFile)
+        self.failUnless(self.ds.compact(force=True))
+        self.failUnless(os.path.getsize(self.logFile) < logSize / 5)
+        for key, value in self.cases[1:]:
+            self.failUnlessEqual(self.ds.getRecord(key), ((value, 9), 9, 0, 'node1'))
+        # The compacted log should remain usable
+        self.ds.setItem('newKey', 'data', 1, 1, 'node1')
+        self.reopen()
+        self.failUnlessEqual(len(self.ds), len(self.cases))
+        self.failUnlessEqual(self.ds['newKey'], 'data')
+        self.failUnlessEqual(self.ds[self.cases[1][0]], (self.cases[1][1], 9))
+        
+    def testIncrementalCompaction(self):
+        for i in range(10):
+            self.ds.setItems([(key, (value, i), i, 0, 'node1') for key, value in self.cases])
+        logSize = os.path.getsize(self.logFile)
+        self.failIf(self.ds.compact(force=True, maxBytes=1))
+        self.failUnless(self.ds.compactionPending())
+        # The data store remains usable while it is being compacted
+        self.ds.setItem(self.cases[1][0], 'changed', 10, 0, 'node2')
+        del self.ds[self.cases[2][0]]
+        self.ds.setItem('newKey', 'data', 1, 1, 'node1')
+        self.failUnlessEqual(self.ds[self.cases[1][0]], 'changed')
+        steps = 1
+        while not self.ds.compact(maxBytes=1):
+            steps += 1
+        self.failUnless(steps > 1, 'Each step should only rewrite a bounded amount of data')
+        self.failIf(self.ds.compactionPending())
+        self.failUnless(os.path.getsize(self.logFile) < logSize / 5)
+        self.reopen()
+        self.failUnlessEqual(len(self.ds), len(self.cases))
+        self.failIf(self.cases[2][0] in self.ds)
+        self.failUnlessEqual(self.ds.getRecord(self.cases[1][0]), ('changed', 10, 0, 'node2'))
+        self.failUnlessEqual(self.ds['newKey'], 'data')
+        for key, value in self.cases[3:]:
+            self.failUnlessEqual(self.ds.getRecord(key), ((value, 9), 9, 0, 'node1'))
+        self.failUnlessEqual(sorted(self.ds.publisherKeys('node2')), [self.cases[1][0]])
+
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(DictDataStoreTest))
     suite.addTest(unittest.makeSuite(SQLiteDataStoreTest))
+    suite.addTest(unittest.makeSuite(StaticTupleSpaceDictDataStoreTest))
+    suite.addTest(unittest.makeSuite(StaticTupleSpaceSQLiteDataStoreTest))
+    suite.addTest(unittest.makeSuite(LogDataStoreTest))
     return suite
 
 
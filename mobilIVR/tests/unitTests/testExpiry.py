@@ -0,0 +1,100 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2009 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+#    http://epydoc.sf.net                                                    #
+
+"""
+@author: Bryan McAlister
+
+Provides unit tests for the lease expiry scheduler of the StaticTupleSpace
+"""
+
+#!/usr/bin/env python
+
+import unittest
+
+import sys
+sys.path.append('../../')
+from twisted.internet import task
+from network.expiry import ExpiryScheduler
+
+
+class ExpirySchedulerTest(unittest.TestCase):
+    """ Tests expiring items at their deadlines """
+    def setUp(self):
+        self.clock = task.Clock()
+        self.expired = []
+        self.scheduler = ExpiryScheduler(self.expired.append, self.clock)
+
+    def testExpiryOrder(self):
+        self.scheduler.schedule('c', 30)
+        self.scheduler.schedule('a', 10)
+        self.scheduler.schedule('b', 20)
+        self.failUnlessEqual(len(self.clock.getDelayedCalls()), 1, 'Only one timer should be pending')
+        self.clock.advance(15)
+        self.failUnlessEqual(self.expired, ['a'])
+        self.clock.advance(15)
+        self.failUnlessEqual(self.expired, ['a', 'b', 'c'])
+        self.failUnlessEqual(len(self.scheduler), 0)
+        self.failUnlessEqual(self.clock.getDelayedCalls(), [])
+
+    def testRenew(self):
+        self.scheduler.schedule('a', 10)
+        self.clock.advance(5)
+        self.scheduler.schedule('a', 10)
+        self.clock.advance(5)
+        self.failUnlessEqual(self.expired, [], 'A renewed item should not expire at its old deadline')
+        self.failUnlessEqual(self.scheduler.deadline('a'), 15)
+        self.clock.advance(5)
+        self.failUnlessEqual(self.expired, ['a'])
+
+    def testShorterDeadline(self):
+        self.scheduler.schedule('a', 60)
+        self.scheduler.schedule('b', 5)
+        self.clock.advance(5)
+        self.failUnlessEqual(self.expired, ['b'], 'The timer should be moved forward for an earlier deadline')
+
+    def testCancel(self):
+        self.scheduler.schedule('a', 10)
+        self.scheduler.schedule('b', 20)
+        self.scheduler.cancel('a')
+        self.failIf('a' in self.scheduler)
+        self.clock.advance(20)
+        self.failUnlessEqual(self.expired, ['b'])
+        self.scheduler.cancel('a')
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ExpirySchedulerTest))
+    return suite
+
+if __name__ == '__main__':
+    # If this module is executed from the commandline, run all its tests
+    unittest.TextTestRunner().run(suite())
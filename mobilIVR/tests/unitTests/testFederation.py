@@ -0,0 +1,199 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2008 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+#    http://epydoc.sf.net                                                    #
+
+"""
+@author: Bryan McAlister
+
+Provides unit tests for the federation of StaticTupleSpace sites (hierarchy mode)
+"""
+
+#!/usr/bin/env python
+
+import cPickle
+import unittest
+
+import sys
+sys.path.append('../../')
+import network.staticTupleSpace
+import network.rpc.constants
+from network.staticTupleSpace import StaticTupleSpacePeer, DataFormatError
+from network.rpc.contact import Contact
+from network.bloom import groupKey
+from twisted.internet import task
+from loopbackNetwork import LoopbackRPCProtocol, FederationLoopbackProtocol, FederationEndpoint
+
+
+class FederationTest(unittest.TestCase):
+    """ This test suite tests the hierarchy mode, in which sites communicate through their super-nodes
+    """
+    def setUp(self):
+        self.clock = task.Clock()
+        self._reactor = network.staticTupleSpace.reactor
+        network.staticTupleSpace.reactor = self.clock
+        self.network = {}
+        self.siteA = self.createSite('a', 3, 5000)
+        self.siteB = self.createSite('b', 2, 5100, federationAddresses=[('127.0.0.1', 6000)])
+        self.resource = ('resource', 'ivr', 'a1')
+        for peer in self.siteA:
+            peer.put(self.resource, 'a1')
+        
+    def tearDown(self):
+        network.staticTupleSpace.reactor = self._reactor
+        
+    def createSite(self, site, numberOfPeers, firstPort, **kwargs):
+        peers = []
+        for i in range(numberOfPeers):
+            peerProtocol = LoopbackRPCProtocol(self.network)
+            peer = StaticTupleSpacePeer(id='%s%d' % (site, i), udpPort=firstPort+i, networkProtocol=peerProtocol,
+                                        site=site, federationPort=firstPort+1000+i, **kwargs)
+            peer._federationProtocol = FederationLoopbackProtocol(self.network, peer)
+            peerProtocol.node = peer
+            self.network[('127.0.0.1', peer.port)] = peer
+            self.network[('127.0.0.1', peer.federationPort)] = FederationEndpoint(peer)
+            peers.append(peer)
+        for peer in peers:
+            for other in peers:
+                if other != peer:
+                    peer.contacts.add(Contact(other.id, '127.0.0.1', other.port, peer._protocol))
+        return peers
+    
+    def elect(self, peers):
+        for peer in peers:
+            peer._electSuperNode()
+        # The other peers learn of the super-node from its announcement tuple
+        for peer in peers:
+            peer.refreshDataStore()
+        
+    def testElection(self):
+        self.elect(self.siteA)
+        self.failUnlessEqual([peer.federation != None for peer in self.siteA], [True, False, False], \
+                             "The peer with the lowest ID should be elected")
+        self.failUnlessEqual(self.siteA[2]._superNodeContact().id, 'a0')
+        self.siteA[1].superNode = True
+        self.elect(self.siteA)
+        self.failUnlessEqual([peer.federation != None for peer in self.siteA], [False, True, False], \
+                             "A configured super-node should take precedence over an elected one")
+        self.failUnlessEqual(self.siteA[2].readIfExists(('supernode', 'a', str, None), 0), [('supernode', 'a', 'a1', True)], \
+                             "A super-node that stepped down should withdraw its announcement")
+        self.failUnlessEqual(self.siteA[2]._superNodeContact().id, 'a1')
+        
+    def testCapacityPublished(self):
+        self.elect(self.siteA)
+        self.elect(self.siteB)
+        federationA, federationB = self.siteA[0].federation, self.siteB[0].federation
+        self.failUnlessEqual((federationA.sites(), federationB.sites()), (['b'], ['a']))
+        self.failUnlessEqual(federationB.capacity(('resource', 'ivr', str)), 1)
+        self.failUnlessEqual(federationB.capacity(('resource', 'sms', str)), 0)
+        self.failUnlessEqual(federationB.capacity(('supernode', str, str)), 0, "Announcements are not capacity")
+        # Capacity changes are published with the next refresh, with one RPC per site
+        self.siteA[2].put(('resource', 'ivr', 'a2'))
+        self.siteA[0].federation._protocol.sentRPCs = []
+        self.siteA[0].refreshDataStore()
+        self.failUnlessEqual(self.siteA[0].federation._protocol.sentRPCs, [('b0', 'exchangeSummaries')])
+        self.failUnlessEqual(federationB.capacity(('resource', 'ivr', str)), 2)
+        
+    def testMalformedSummaryIgnored(self):
+        self.elect(self.siteA)
+        federationA = self.siteA[0].federation
+        summary = [[cPickle.dumps(('resource', 'sms')), 1, 1], ['l8:resourcee', 'x', 1], ['entry'], [groupKey(('resource', 'sms')), 3, 2]]
+        federationA.exchangeSummaries('c', summary, [], _rpcNodeID='c0', _rpcNodeContact=Contact('c0', '127.0.0.1', 5000, None))
+        self.failUnlessEqual(federationA.capacity(('resource', 'sms', str)), 2, "Only the valid entries of a summary should be used")
+        self.failUnlessRaises(DataFormatError, federationA.siteClaim, cPickle.dumps(('resource', 'ivr', str)))
+        
+    def testCrossSiteClaim(self):
+        self.elect(self.siteA)
+        self.elect(self.siteB)
+        results = []
+        self.siteB[1].claimFederated(('resource', 'ivr', str)).addCallback(results.append)
+        self.siteB[1].claimFederated(('resource', 'ivr', str)).addCallback(results.append)
+        self.failUnlessEqual(results, [self.resource, None], "A tuple should only be claimed once across sites")
+        self.failUnlessEqual(self.siteA[1].readIfExists(self.resource), None)
+        self.siteB[1].releaseFederated(self.resource).addCallback(results.append)
+        self.failUnlessEqual(results[2:], [True])
+        self.failUnlessEqual(self.siteA[1].readIfExists(self.resource), self.resource, \
+                             "A released tuple should be put back by its owner in the other site")
+        
+    def testCrossSiteClaimReleasedWhenClaimantFails(self):
+        self.elect(self.siteA)
+        self.elect(self.siteB)
+        results = []
+        self.siteB[1].claimFederated(('resource', 'ivr', str)).addCallback(results.append)
+        self.failUnlessEqual(results, [self.resource])
+        self.failUnlessEqual(self.siteB[0].federation._claims, {('a1', self.resource): [('a', 'b1')]}, \
+                             "The super-node should record the peer it claimed the tuple for")
+        # The claiming peer dies; the super-node of its site keeps renewing
+        # the claim with the other site, but releases it for the dead peer
+        del self.network[('127.0.0.1', self.siteB[1].port)]
+        self.siteB[0]._memberFailed('b1')
+        self.failUnlessEqual(self.siteB[0].federation._claims, {})
+        self.failUnlessEqual(self.siteA[1].readIfExists(self.resource), self.resource, \
+                             "The tuple should be put back by its owner once its claimant has failed")
+        
+    def testCrossSiteClaimExpires(self):
+        self.elect(self.siteA)
+        self.elect(self.siteB)
+        results = []
+        self.siteB[1].claimFederated(('resource', 'ivr', str)).addCallback(results.append)
+        self.failUnlessEqual(results, [self.resource])
+        # The claim is kept while the claiming peer is heard from (and the
+        # super-node renews its own lease with the other site)...
+        self.clock.advance(network.rpc.constants.claimLease / 2)
+        self.siteB[0].internContact('b1', '127.0.0.1', self.siteB[1].port)
+        self.siteA[1].internContact('a0', '127.0.0.1', self.siteA[0].port)
+        self.clock.advance(network.rpc.constants.claimLease / 2 + 1)
+        self.failUnlessEqual(self.siteA[1].readIfExists(self.resource), None)
+        # ...but released once the claiming peer is no longer heard from
+        self.siteA[1].internContact('a0', '127.0.0.1', self.siteA[0].port)
+        self.clock.advance(network.rpc.constants.claimLease / 2 + 1)
+        self.failUnlessEqual(self.siteB[0].federation._claims, {})
+        self.failUnlessEqual(self.siteA[1].readIfExists(self.resource), self.resource)
+        
+    def testLocalClaimPreferred(self):
+        self.elect(self.siteA)
+        self.elect(self.siteB)
+        localResource = ('resource', 'ivr', 'b1')
+        for peer in self.siteB:
+            peer.put(localResource, 'b1')
+        self.siteB[0].federation._protocol.sentRPCs = []
+        results = []
+        self.siteB[1].claimFederated(('resource', 'ivr', str)).addCallback(results.append)
+        self.failUnlessEqual(results, [localResource])
+        self.failUnlessEqual(self.siteB[0].federation._protocol.sentRPCs, [], "No other site should be contacted")
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(FederationTest))
+    return suite
+
+if __name__ == '__main__':
+    # If this module is executed from the commandline, run all its tests
+    unittest.TextTestRunner().run(suite())
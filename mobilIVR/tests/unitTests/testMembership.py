@@ -0,0 +1,180 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2008 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+#    http://epydoc.sf.net                                                    #
+
+"""
+@author: Bryan McAlister
+
+Provides unit tests for the failure detection of StaticTupleSpace peers
+"""
+
+#!/usr/bin/env python
+
+import unittest
+
+import sys
+sys.path.append('../../')
+import network.staticTupleSpace
+import network.rpc.constants
+from network import membership
+from network.rpc import msgtypes
+from network.rpc.protocol import KademliaProtocol
+from twisted.internet import task
+from loopbackNetwork import createLoopbackNetwork
+
+
+class MembershipTest(unittest.TestCase):
+    """ This test suite tests the detection of failed peers, and the dissemination of membership changes 
+    """
+    def setUp(self):
+        self.clock = task.Clock()
+        self._reactor = network.staticTupleSpace.reactor
+        network.staticTupleSpace.reactor = self.clock
+        self.network, self.peers = createLoopbackNetwork(4)
+        self.handler = ('handler', 'ivr', self.peers[1].id, '', '')
+        for peer in self.peers:
+            peer.put(self.handler, self.peers[1].id)
+        self.results = []
+        
+    def tearDown(self):
+        for peer in self.peers:
+            peer.membership.stop()
+        network.staticTupleSpace.reactor = self._reactor
+        
+    def probe(self, peer, target):
+        peer.membership._round = [target.id]
+        peer.membership.probe().addCallback(self.results.append)
+        
+    def message(self, sender, receiver):
+        """ Sends an RPC, on which membership updates are piggybacked """
+        sender.findContact(receiver.id).ping()
+        
+    def testDirectProbe(self):
+        self.probe(self.peers[0], self.peers[1])
+        self.failUnlessEqual(self.results, [(self.peers[1].id, True)])
+        self.failIf((self.peers[1].id, 'pingRequest') in self.peers[0]._protocol.sentRPCs)
+        
+    def testIndirectProbe(self):
+        self.peers[0]._protocol.unreachable.add(self.peers[1].id)
+        self.probe(self.peers[0], self.peers[1])
+        self.failUnlessEqual(self.results, [(self.peers[1].id, True)], \
+                             "A peer reachable through other peers should not be suspected")
+        self.failUnlessEqual(self.peers[0].membership.state(self.peers[1].id), membership.ALIVE)
+        
+    def testFailureDetected(self):
+        del self.network[('127.0.0.1', self.peers[1].port)]
+        self.probe(self.peers[0], self.peers[1])
+        self.failUnlessEqual(self.results, [(self.peers[1].id, False)])
+        self.failUnlessEqual(self.peers[0].membership.state(self.peers[1].id), membership.SUSPECT)
+        self.failIfEqual(self.peers[0].readIfExists(self.handler), None, "A suspected peer's tuples should be kept")
+        # The suspicion is piggybacked on the next message
+        self.message(self.peers[0], self.peers[2])
+        self.failUnlessEqual(self.peers[2].membership.state(self.peers[1].id), membership.SUSPECT)
+        self.clock.advance(self.peers[0].membership._suspicionTimeout())
+        for peer in (self.peers[0], self.peers[2]):
+            self.failUnlessEqual(peer.membership.state(self.peers[1].id), membership.DEAD)
+            self.failUnlessEqual(peer.findContact(self.peers[1].id), None)
+            self.failUnlessEqual(peer.readIfExists(self.handler), None, "A dead peer's tuples should be purged")
+        # The peer that never heard of the suspicion learns of the death
+        self.message(self.peers[0], self.peers[3])
+        self.failUnlessEqual(self.peers[3].membership.state(self.peers[1].id), membership.DEAD)
+        self.failUnlessEqual(self.peers[3].readIfExists(self.handler), None)
+        
+    def testSuspicionRefuted(self):
+        for peer in self.peers:
+            peer._protocol.unreachable.add(self.peers[1].id)
+        self.probe(self.peers[0], self.peers[1])
+        self.failUnlessEqual(self.peers[0].membership.state(self.peers[1].id), membership.SUSPECT)
+        # The suspected peer hears of the suspicion, and refutes it
+        self.message(self.peers[0], self.peers[2])
+        self.message(self.peers[1], self.peers[2])
+        self.failUnlessEqual(self.peers[1].membership.incarnation, 1)
+        self.message(self.peers[1], self.peers[0])
+        self.failUnlessEqual(self.peers[0].membership.state(self.peers[1].id), membership.ALIVE)
+        self.clock.advance(self.peers[0].membership._suspicionTimeout())
+        self.failIfEqual(self.peers[0].readIfExists(self.handler), None, "A refuted suspicion should not expire")
+        
+    def testDeadPeerRejoins(self):
+        self.peers[0].membership._applyUpdate(membership.DEAD, self.peers[1].id, '127.0.0.1', self.peers[1].port, 0)
+        self.failUnlessEqual(self.peers[0].findContact(self.peers[1].id), None)
+        # The peer is told it was declared dead when it contacts the network again
+        self.message(self.peers[1], self.peers[0])
+        self.failUnlessEqual(self.peers[1].membership.incarnation, 1)
+        self.message(self.peers[1], self.peers[0])
+        self.failUnlessEqual(self.peers[0].membership.state(self.peers[1].id), membership.ALIVE)
+        self.failIfEqual(self.peers[0].findContact(self.peers[1].id), None)
+        
+    def testLateMessageFromDeadPeer(self):
+        peer, deadPeer = self.peers[0], self.peers[1]
+        peer.membership._applyUpdate(membership.DEAD, deadPeer.id, '127.0.0.1', deadPeer.port, 0)
+        networkProtocol = KademliaProtocol(peer)
+        def receive(gossip):
+            msg = msgtypes.RequestMessage(deadPeer.id, 'ping', [])
+            msg.gossip = gossip
+            networkProtocol.datagramReceived(networkProtocol._encoder.encode(networkProtocol._translator.toPrimitive(msg)), \
+                                             ('127.0.0.1', deadPeer.port))
+        receive([])
+        self.failUnlessEqual(peer.findContact(deadPeer.id), None, "A late message should not add a dead peer back to the contacts")
+        self.failUnlessEqual(peer.membership.state(deadPeer.id), membership.DEAD)
+        # The peer refutes its death with a higher incarnation number
+        receive([[membership.ALIVE, deadPeer.id, '127.0.0.1', deadPeer.port, 1]])
+        self.failIfEqual(peer.findContact(deadPeer.id), None)
+        self.failUnlessEqual(peer.membership.state(deadPeer.id), membership.ALIVE)
+        
+    def testDeadPeersForgotten(self):
+        self.peers[0].membership._applyUpdate(membership.DEAD, self.peers[1].id, '127.0.0.1', self.peers[1].port, 0)
+        self.clock.advance(network.rpc.constants.deadMemberRetention - 1)
+        self.failUnlessEqual(self.peers[0].membership.state(self.peers[1].id), membership.DEAD)
+        self.clock.advance(1)
+        self.failUnlessEqual(self.peers[0].membership._members, {}, "Dead peers should not be remembered forever")
+        
+    def testBoundedDetectionTime(self):
+        for peer in self.peers[:3]:
+            peer.membership.start()
+        del self.network[('127.0.0.1', self.peers[3].port)]
+        # Every contact is probed within two rounds
+        rounds = 2 * len(self.peers[0].contacts)
+        self.clock.pump([network.rpc.constants.probeInterval] * rounds)
+        self.clock.advance(self.peers[0].membership._suspicionTimeout())
+        for peer in self.peers[:3]:
+            self.failUnlessEqual(peer.membership.state(self.peers[3].id), membership.DEAD)
+        for peer in self.peers[:3]:
+            self.failUnlessEqual(len(peer._protocol.sentRPCs) <= 2 * rounds + 2 * network.rpc.constants.indirectProbes, True, \
+                                 "Each peer should send a bounded number of probes per interval")
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(MembershipTest))
+    return suite
+
+if __name__ == '__main__':
+    # If this module is executed from the commandline, run all its tests
+    unittest.TextTestRunner().run(suite())
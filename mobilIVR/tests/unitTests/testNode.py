@@ -0,0 +1,95 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2008 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+"""
+@author: Bryan McAlister
+
+Provides unit tests for the MobilIVR node
+"""
+
+#!/usr/bin/env python
+
+import os, tempfile
+import unittest
+
+import sys
+sys.path.append('../../')
+sys.path.append('../../../')
+from mobilIVR.node import MobilIVRNode
+from network.datastore import SQLiteDataStore, LogDataStore
+
+
+class IVRApplication(object):
+    def handleIVR(self, session):
+        pass
+
+
+class NodeRestartTest(unittest.TestCase):
+    """ This test suite tests that a node restarted with a persistent data store republishes its handlers
+    """
+    def setUp(self):
+        self.dataFile = tempfile.mktemp()
+        
+    def tearDown(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.dataFile + suffix):
+                os.remove(self.dataFile + suffix)
+        
+    def startNode(self, dataStoreClass):
+        node = MobilIVRNode(udpPort=4000, id='node1', dataStore=dataStoreClass(self.dataFile))
+        node.runApplication(IVRApplication())
+        # The callbacks run once the node has joined the network
+        node._removeRecoveredHandlers(None)
+        node._execCallQueue(None)
+        return node
+    
+    def testHandlersNotDuplicated(self):
+        for dataStoreClass in (SQLiteDataStore, LogDataStore):
+            node = self.startNode(dataStoreClass)
+            node.put(('handler', 'ivr', 'node2', '', ''), 'node2')
+            node.dataStore.close()
+            node = self.startNode(dataStoreClass)
+            self.failUnlessEqual(node.readIfExists(('handler', 'ivr', str, None, None), numberOfResults=0), \
+                                 [('handler', 'ivr', 'node1', '', ''), ('handler', 'ivr', 'node2', '', '')], \
+                                 "The node's handlers should be replaced after a restart, and other nodes' handlers kept")
+            self.failUnlessEqual(node.getIfExists(('handler', 'ivr', 'node1', None, None)), ('handler', 'ivr', 'node1', '', ''))
+            self.failUnlessEqual(node.getIfExists(('handler', 'ivr', 'node1', None, None)), None, \
+                                 "Only one copy of the handler should be published")
+            node.dataStore.close()
+            self.tearDown()
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(NodeRestartTest))
+    return suite
+
+if __name__ == '__main__':
+    # If this module is executed from the commandline, run all its tests
+    unittest.TextTestRunner().run(suite())
@@ -0,0 +1,182 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2008 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+#    http://epydoc.sf.net                                                    #
+
+"""
+@author: Bryan McAlister
+
+Provides unit tests for the partitioned mode of the StaticTupleSpace
+"""
+
+#!/usr/bin/env python
+
+import unittest
+
+import sys
+sys.path.append('../../')
+import network.staticTupleSpace
+import network.rpc.constants
+from network.staticTupleSpace import QuorumError
+from network.contacttable import distance
+from twisted.internet import task
+from loopbackNetwork import createLoopbackNetwork
+
+
+class PartitionedTupleSpaceTest(unittest.TestCase):
+    """ This test suite tests that tuples are only replicated to, and looked up at, the peers closest to their partition 
+    """
+    def setUp(self):
+        self.clock = task.Clock()
+        self._reactor = network.staticTupleSpace.reactor
+        network.staticTupleSpace.reactor = self.clock
+        self._k = network.rpc.constants.k
+        network.rpc.constants.k = 3
+        self.network, self.peers = createLoopbackNetwork(12, partitioned=True)
+        self.owner = self.peers[0]
+        self.resource = ('resource', 'ivr', self.owner.id)
+        self.partitionKey = self.owner._partitionKey(self.resource)
+        self.results = []
+        
+    def tearDown(self):
+        network.staticTupleSpace.reactor = self._reactor
+        network.rpc.constants.k = self._k
+        
+    def closestPeers(self, peers=None):
+        """ Returns the IDs of the k peers closest to the resource's partition """
+        if peers == None:
+            peers = self.peers
+        peerIDs = [peer.id for peer in peers]
+        peerIDs.sort(key=lambda peerID: distance(self.partitionKey, peerID))
+        return set(peerIDs[:network.rpc.constants.k])
+        
+    def holders(self, sTuple):
+        return set([peer.id for peer in self.peers if peer.readIfExists(sTuple) != None])
+        
+    def testRoutingTableSize(self):
+        for peer in self.peers:
+            self.failUnless(len(peer.contacts) < len(self.peers) - 1, "Full buckets should limit the size of the routing table")
+        
+    def testPartitionKey(self):
+        self.failUnlessEqual(self.owner._partitionKey(('resource', 'ivr', str)), self.partitionKey)
+        self.failUnlessEqual(self.owner._partitionKey(('resource', 'ivr', str, str)), self.partitionKey)
+        self.failIfEqual(self.owner._partitionKey(('resource', 'sms', str)), self.partitionKey)
+        self.failUnlessEqual(self.owner._partitionKey(('resource', str, str)), None)
+        
+    def testIterativeFind(self):
+        self.owner._iterativeFind(self.partitionKey).addCallback(self.results.append)
+        foundIDs = set([contact.id for contact in self.results[0]])
+        self.failUnlessEqual(foundIDs, self.closestPeers([peer for peer in self.peers if peer != self.owner]))
+        
+    def testReplicatedToClosestPeers(self):
+        self.owner.put(self.resource)
+        self.clock.advance(0)
+        self.failUnlessEqual(self.holders(self.resource), self.closestPeers() | set([self.owner.id]))
+        
+    def testLookup(self):
+        self.owner.put(self.resource)
+        self.clock.advance(0)
+        searcher = [peer for peer in self.peers if peer.id not in self.holders(self.resource)][0]
+        searcher.readDistributed(('resource', 'ivr', str)).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [self.resource])
+        queried = [contactID for contactID, method in searcher._protocol.sentRPCs if method == 'findTuple']
+        self.failUnless(len(queried) <= network.rpc.constants.k)
+        self.failUnlessEqual(searcher.readIfExists(('resource', 'ivr', str)), None, "The tuple should not be replicated to the searcher")
+        
+    def testTake(self):
+        self.owner.put(self.resource)
+        self.clock.advance(0)
+        self.owner.getIfExists(self.resource)
+        self.clock.advance(0)
+        self.failUnlessEqual(self.holders(self.resource), set())
+        
+    def testRepublish(self):
+        self.owner.put(self.resource)
+        self.clock.advance(0)
+        replica = [peer for peer in self.peers if peer != self.owner and peer.id in self.holders(self.resource)][0]
+        replica._removeKey((self.owner.id, self.resource))
+        self.owner.refreshDataStore()
+        self.failUnlessEqual(self.holders(self.resource), self.closestPeers() | set([self.owner.id]), \
+                             "Republishing should repair lost replicas")
+        self.clock.advance(network.rpc.constants.tupleLease)
+        self.failUnlessEqual(self.holders(self.resource), set([self.owner.id]), \
+                             "Replicas should lapse if their owner stops republishing them")
+        
+    def failAt(self, peerIDs, method):
+        """ Makes an RPC method fail at the specified peers """
+        def fail(*args, **kwargs):
+            raise IOError('Failure injected by the test')
+        for peer in self.peers:
+            if peer.id in peerIDs:
+                setattr(peer, method, fail)
+        
+    def testReplicationFactor(self):
+        self.network, self.peers = createLoopbackNetwork(12, partitioned=True, replicationFactor=2)
+        self.owner = self.peers[0]
+        self.owner.put(self.resource)
+        self.clock.advance(0)
+        closestIDs = sorted(self.closestPeers(), key=lambda peerID: distance(self.partitionKey, peerID))
+        self.failUnlessEqual(self.holders(self.resource), set(closestIDs[:2] + [self.owner.id]))
+        
+    def testPutReplicated(self):
+        self.owner.putReplicated(self.resource).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [self.resource], "The write quorum should be reached without waiting for a refresh")
+        self.failUnlessEqual(self.holders(self.resource), self.closestPeers() | set([self.owner.id]))
+        
+    def testWriteQuorumNotReached(self):
+        self.failAt(self.closestPeers(), 'replicate')
+        self.owner.putReplicated(self.resource).addErrback(lambda error: self.results.append(error.trap(QuorumError)))
+        self.failUnlessEqual(self.results, [QuorumError])
+        self.failIfEqual(self.owner.readIfExists(self.resource), None, "The tuple should still be stored by its owner")
+        
+    def testReadSurvivesReplicaFailure(self):
+        self.owner.putReplicated(self.resource)
+        holders = self.holders(self.resource) - set([self.owner.id])
+        failedID = sorted(holders, key=lambda peerID: distance(self.partitionKey, peerID))[0]
+        del self.network[('127.0.0.1', [peer for peer in self.peers if peer.id == failedID][0].port)]
+        searcher = [peer for peer in self.peers if peer.id not in self.holders(self.resource)][0]
+        searcher.readDistributed(('resource', 'ivr', str)).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [self.resource], "A read should succeed while a quorum of replicas responds")
+        
+    def testReadQuorumNotReached(self):
+        self.owner.putReplicated(self.resource)
+        searcher = [peer for peer in self.peers if peer.id not in self.holders(self.resource)][0]
+        self.failAt(set([peer.id for peer in self.peers]) - set([searcher.id]), 'findTuple')
+        searcher.readDistributed(('resource', 'ivr', str)).addErrback(lambda error: self.results.append(error.trap(QuorumError)))
+        self.failUnlessEqual(self.results, [QuorumError])
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(PartitionedTupleSpaceTest))
+    return suite
+
+if __name__ == '__main__':
+    # If this module is executed from the commandline, run all its tests
+    unittest.TextTestRunner().run(suite())
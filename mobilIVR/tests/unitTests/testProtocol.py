@@ -131,6 +131,18 @@ class ProtocolTest(unittest.TestCase):
         # Restore the global timeout
         network.rpc.constants.rpcTimeout = tempTimeout
         
+    def testRPCCancel(self):
+        """ Tests if a cancelled RPC stops waiting for its response, without counting against the remote node """
+        remoteContact = network.rpc.contact.Contact('node2', '127.0.0.1', 91825, self.protocol)
+        self.node.addContact(remoteContact)
+        errors = []
+        df = self.protocol.sendRPC(remoteContact, 'ping', {})
+        df.addErrback(lambda f: errors.append(f.check(defer.CancelledError)))
+        df.cancel()
+        self.failUnlessEqual(errors, [defer.CancelledError])
+        self.failUnlessEqual(self.protocol._sentMessages, {}, 'The cancelled RPC should no longer be waiting for a response')
+        self.failUnless(remoteContact in self.node.contacts, 'Contact should not be removed when an RPC is cancelled')
+        
     def testRPCRequest(self):
         """ Tests if a valid RPC request is executed and responded to correctly """
         remoteContact = network.rpc.contact.Contact('node2', '127.0.0.1', 91825, self.protocol)
@@ -0,0 +1,106 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2009 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+#    http://epydoc.sf.net                                                    #
+
+"""
+@author: Bryan McAlister
+
+Provides unit tests for the k-bucket routing table of the StaticTupleSpace
+"""
+
+#!/usr/bin/env python
+
+import unittest
+
+import sys
+sys.path.append('../../')
+from network.routingtable import RoutingTable
+from network.contacttable import distance
+from network.rpc import constants
+
+
+class RoutingTableTest(unittest.TestCase):
+    """ Tests the k-bucket structure of the routing table used in partitioned mode """
+    def setUp(self):
+        # Node IDs are single bytes, so the distance of contact chr(i) to the
+        # parent node is i, and contacts 4 to 7 share a bucket
+        self.table = RoutingTable('\x00', k=2)
+
+    def intern(self, *contactIDs):
+        for contactID in contactIDs:
+            self.table.intern(chr(contactID), '127.0.0.1', 4000, None)
+
+    def testDistance(self):
+        self.failUnlessEqual(distance('\x05', '\x03'), 6)
+        self.failUnlessEqual(distance('ab', 'ab'), 0)
+
+    def testBucketSize(self):
+        self.intern(4, 5, 6, 7, 1)
+        self.failUnlessEqual(self.table.bucket('\x04'), ['\x04', '\x05'], 'A full bucket should keep its long-lived contacts')
+        self.failUnlessEqual(len(self.table), 3)
+        self.failIf('\x06' in self.table)
+
+    def testReplacementPromoted(self):
+        self.intern(4, 5, 6, 7)
+        self.table.remove('\x04')
+        self.failUnlessEqual(self.table.bucket('\x04'), ['\x05', '\x07'], 'The most recently seen replacement should be promoted')
+        for i in range(constants.contactFailureLimit):
+            self.table.contactFailed('\x05')
+        self.failUnlessEqual(self.table.bucket('\x04'), ['\x07', '\x06'])
+
+    def testFailedContactReplaced(self):
+        self.intern(4, 5)
+        self.table.get('\x04').failed()
+        self.intern(6)
+        self.failUnlessEqual(self.table.bucket('\x04'), ['\x05', '\x06'], 'A contact that failed to respond should make way for a new one')
+
+    def testLeastRecentlySeenFirst(self):
+        self.intern(4, 5, 4)
+        self.failUnlessEqual(self.table.bucket('\x04'), ['\x05', '\x04'])
+        self.table.get('\x05').failed()
+        self.intern(6)
+        self.failUnlessEqual(self.table.bucket('\x04'), ['\x04', '\x06'])
+
+    def testFindCloseContacts(self):
+        self.intern(1, 2, 3, 4, 5)
+        closest = self.table.findCloseContacts('\x03', 3)
+        self.failUnlessEqual([contact.id for contact in closest], ['\x03', '\x02', '\x01'])
+        closest = self.table.findCloseContacts('\x03', 2, excludeID='\x03')
+        self.failUnlessEqual([contact.id for contact in closest], ['\x02', '\x01'])
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(RoutingTableTest))
+    return suite
+
+if __name__ == '__main__':
+    # If this module is executed from the commandline, run all its tests
+    unittest.TextTestRunner().run(suite())
@@ -37,16 +37,24 @@ Provides unit tests for the StaticTupleSpace
 
 #!/usr/bin/env python
 
-import hashlib
 import cPickle
+import os, tempfile
+import sqlite3, hashlib
 import unittest
 
 import sys
 sys.path.append('../../')
-from network.staticTupleSpace import StaticTupleSpacePeer
+import network.staticTupleSpace
+import network.rpc.constants
+from network.staticTupleSpace import StaticTupleSpacePeer, DataFormatError
+from network.datastore import SQLiteDataStore, LogDataStore
+from network.tupleindex import Range
 from network.rpc.msgtypes import ResponseMessage
 from network.rpc.contact import Contact
-from twisted.internet import protocol, defer, selectreactor
+from network.rpc.protocol import TimeoutError
+from network.wireformat import encodeTuple, decodeTuple, encodeTemplate
+from twisted.internet import protocol, defer, selectreactor, task
+from loopbackNetwork import createLoopbackNetwork
 
 
 class TuplePublishingAndLookupTest(unittest.TestCase):           
@@ -55,25 +63,40 @@ class TuplePublishingAndLookupTest(unittest.TestCase):
     def testPut(self):
         node = StaticTupleSpacePeer()
         inputData = ('resource','ivr',node.id)
-        parsedInput = (inputData[0], inputData[1])
-        serializedInput = cPickle.dumps(parsedInput)
         
             
         # Attempt to publish the data tuple
         node.put(inputData)
         
-        # Check that the data is in the data store
-        h = hashlib.sha1()
-        h.update(serializedInput)
-        mainKey = h.digest()
+        # Check that the data is in the data store (tuples are stored per owner, with their number of copies and version)
+        mainKey = (node.id, inputData)
         
                 
-        dataStoreTuple = node.dataStore.__getitem__(mainKey)
+        copies, version = node.dataStore.__getitem__(mainKey)
         ownerID = node.dataStore.originalPublisherID(mainKey)
         
-        self.failUnlessEqual(serializedInput, dataStoreTuple, "Input data not equal to the data found in the dataStore")
+        self.failUnlessEqual(copies, 1, "A single copy of the input data should be found in the dataStore")
+        self.failUnlessEqual(version, 1)
         self.failUnlessEqual(ownerID, node.id, "Input owner ID not equal to the owner ID found in the dataStore")
         
+    def testPutKeepsAllFields(self):
+        node = StaticTupleSpacePeer()
+        inputData = ('handler', 'ivr', node.id, 'SIP/1000', '0821234567')
+        
+        node.put(inputData)
+        
+        returnedTuple = node.findTuple(('handler', 'ivr', str, None, None))
+        self.failUnlessEqual(returnedTuple, inputData, "The channel and caller ID fields of a handler tuple should be stored")
+        
+    def testRangeQuery(self):
+        node = StaticTupleSpacePeer(sortedFields=[(5, 3)])
+        capacity = [('resource', 'ivr', 'node%d' % i, i, i % 2 and 'gp' or 'wc') for i in range(10)]
+        node.putMany(capacity, node.id)
+        returnedTuples = node.readIfExists(('resource', 'ivr', str, Range(5), 'gp'), numberOfResults=0)
+        returnedTuples.sort()
+        self.failUnlessEqual(returnedTuples, [capacity[5], capacity[7], capacity[9]])
+        node.getIfExists(capacity[7])
+        self.failUnlessEqual(node.countTuples(('resource', 'ivr', str, Range(5, 8), None)), 3)
         
     def testFindTuple(self):
         node = StaticTupleSpacePeer()
@@ -83,12 +106,54 @@ class TuplePublishingAndLookupTest(unittest.TestCase):
         node.put(inputData)
         
         # Attempt to find the data
-        returnedTuple = node.findTuple(('resource', 'ivr'))
+        returnedTuple = node.findTuple(('resource', 'ivr', str))
         
         # check that the expected result was returned
         expectedResult = ('resource', 'ivr', node.id)
         self.failUnlessEqual(returnedTuple, expectedResult, "Tuple returned from findTuple not the same as the expected result")
-                
+        
+    def testFindTupleMatching(self):
+        node = StaticTupleSpacePeer()
+        node.put(('resource', 'ivr', 'node1'))
+        node.put(('resource', 'sms', 'node1'))
+        node.put(('resource', 'ivr', 'node2'))
+        node.put(('resource', 'ivr', 'node3', 'SIP/1000'))
+        node.put(('counter', 5), 'node1')
+        
+        self.failUnlessEqual(node.findTuple(('resource', 'ivr')), None, "Templates should only match tuples with the same number of fields")
+        self.failUnlessEqual(node.findTuple(('resource', 'fax', str)), None, "No tuple should match this template")
+        self.failUnlessEqual(node.findTuple(('counter', str)), None, "Type wildcards should only match values of that type")
+        self.failUnlessEqual(node.findTuple(('counter', int)), ('counter', 5))
+        self.failUnlessEqual(node.findTuple(('resource', None, 'node2')), ('resource', 'ivr', 'node2'))
+        
+        returnedTuples = node.findTuple(('resource', 'ivr', str), numberOfResults=0)
+        returnedTuples.sort()
+        self.failUnlessEqual(returnedTuples, [('resource', 'ivr', 'node1'), ('resource', 'ivr', 'node2')], \
+                             "All matching tuples should be returned if numberOfResults is 0")
+        self.failUnlessEqual(len(node.readIfExists(('resource', None, str), numberOfResults=2)), 2, \
+                             "No more than numberOfResults tuples should be returned")
+        self.failUnlessEqual(node.readIfExists(('resource', 'fax', str), numberOfResults=0), [])
+        
+    def testGetIfExists(self):
+        node = StaticTupleSpacePeer()
+        node.put(('resource', 'ivr', 'node1'), node.id)
+        node.put(('resource', 'ivr', 'node2'), node.id)
+        
+        returnedTuple = node.getIfExists(('resource', 'ivr', 'node2'))
+        self.failUnlessEqual(returnedTuple, ('resource', 'ivr', 'node2'))
+        self.failUnlessEqual(node.readIfExists(('resource', 'ivr', str), numberOfResults=0), [('resource', 'ivr', 'node1')], \
+                             "getIfExists should remove the matching tuple (and only that tuple)")
+        self.failUnlessEqual(node.getIfExists(('resource', 'ivr', 'node2')), None)
+        self.failUnlessEqual(len(node.dataStore.keys()), 1)
+        node.put(('resource', 'ivr', 'node3'))
+        self.failUnlessEqual(node.getIfExists(('resource', 'ivr', 'node3')), None, \
+                             "Replicas of other peers' tuples should only be taken by their owners")
+        
+    def testPutInvalidData(self):
+        node = StaticTupleSpacePeer()
+        self.failUnlessRaises(DataFormatError, node.put, ['resource', 'ivr', node.id])
+        self.failUnlessRaises(DataFormatError, node.put, 'not a serialized tuple')
+        self.failUnlessRaises(DataFormatError, node.put, ('resource', ['ivr'], node.id))
         
     def testGetOwnedTuples(self):
         node = StaticTupleSpacePeer()
@@ -110,11 +175,11 @@ class TuplePublishingAndLookupTest(unittest.TestCase):
         # construct the expected result
         
         for i in range(2):
-            parsedStr = (inputData[i][0], inputData[i][1])
-            serializedStr = cPickle.dumps(parsedStr)
+            wireTuple = encodeTuple(inputData[i])
             
-            expectedResult.append([node.id, serializedStr])
-        expectedResult.reverse()
+            expectedResult.append([node.id, wireTuple])
+        expectedResult.sort()
+        returnedTuples.sort()
         
         
         # Only tuples owned by this node (has this nodes id) should be returned
@@ -138,16 +203,167 @@ class TuplePublishingAndLookupTest(unittest.TestCase):
         # construct the expected result
         
         for i in range(2):
-            parsedStr = (inputData[i][0], inputData[i][1])
-            serializedStr = cPickle.dumps(parsedStr)
+            wireTuple = encodeTuple(inputData[i])
             
-            expectedResult.append([inputData[i][2], serializedStr])
-                
+            expectedResult.append([inputData[i][2], wireTuple])
+        expectedResult.sort()
+        returnedTuples.sort()
               
         # All tuples should be returned, regardless of owner id
         self.failUnlessEqual(returnedTuples, expectedResult, "Tuples returned from getOwnedTuples not the same as the expected result."   \
                         " All tuples should be returned, regardless of owner id")
         
+    def testIncrementalCompaction(self):
+        logFile = tempfile.mktemp()
+        clock = task.Clock()
+        _reactor, stepSize = network.staticTupleSpace.reactor, network.rpc.constants.compactionStepSize
+        network.staticTupleSpace.reactor = clock
+        network.rpc.constants.compactionStepSize = 1
+        try:
+            node = StaticTupleSpacePeer(id='node1', dataStore=LogDataStore(logFile))
+            node.dataStore.minCompactionSize = 0
+            for i in range(20):
+                node.put(('counter', i))
+                node.getIfExists(('counter', i))
+            node.put(('resource', 'ivr', 'node1'))
+            node.put(('resource', 'ivr', 'node2'))
+            node.refreshDataStore()
+            self.failUnless(node.dataStore.compactionPending(), "The data store should be compacted in steps")
+            node.put(('resource', 'sms', 'node1'))
+            while node._compactionCall != None:
+                clock.advance(0)
+            self.failIf(node.dataStore.compactionPending())
+            node.dataStore.close()
+            node = StaticTupleSpacePeer(id='node1', dataStore=LogDataStore(logFile))
+            self.failUnlessEqual(sorted(node.readIfExists(('resource', None, str), numberOfResults=0)), \
+                                 [('resource', 'ivr', 'node1'), ('resource', 'ivr', 'node2'), ('resource', 'sms', 'node1')])
+            node.dataStore.close()
+        finally:
+            network.staticTupleSpace.reactor = _reactor
+            network.rpc.constants.compactionStepSize = stepSize
+            os.remove(logFile)
+        
+    def testLegacyDataStore(self):
+        dbFile = tempfile.mktemp()
+        try:
+            # The previous format stored the tuples under the hex-encoded digests of their keys
+            db = sqlite3.connect(dbFile)
+            db.execute('CREATE TABLE data(key, value, lastPublished, originallyPublished, originalPublisherID)')
+            sTuple = ('resource', 'ivr', 'node1')
+            db.execute('INSERT INTO data(key, value, lastPublished, originallyPublished, originalPublisherID) VALUES (?, ?, ?, ?, ?)', \
+                       (hashlib.sha1(cPickle.dumps(sTuple)).hexdigest(), buffer(cPickle.dumps(sTuple)), 1, 2, 'node1'))
+            db.commit()
+            db.close()
+            node = StaticTupleSpacePeer(id='node1', dataStore=SQLiteDataStore(dbFile))
+            self.failUnlessEqual(node.readIfExists(('resource', 'ivr', str)), None, "Entries in the previous format should be dropped")
+            node.put(sTuple)
+            self.failUnlessEqual(node.readIfExists(('resource', 'ivr', str)), sTuple)
+            node.dataStore.close()
+        finally:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(dbFile + suffix):
+                    os.remove(dbFile + suffix)
+        
+    def testPersistentDataStore(self):
+        logFile = tempfile.mktemp()
+        try:
+            for dataStoreClass in (SQLiteDataStore, LogDataStore):
+                dataStore = dataStoreClass(logFile)
+                node = StaticTupleSpacePeer(id='node1', dataStore=dataStore)
+                node.put(('resource', 'ivr', 'node1'))
+                node.put(('resource', 'ivr', 'node2'))
+                node.put(('handler', 'sms', 'node1'))
+                node.getIfExists(('handler', 'sms', str))
+                dataStore.close()
+                # A peer restarted with the same data store should find the tuples that were stored
+                node = StaticTupleSpacePeer(id='node1', dataStore=dataStoreClass(logFile))
+                resources = node.readIfExists(('resource', 'ivr', str), numberOfResults=0)
+                resources.sort()
+                self.failUnlessEqual(resources, [('resource', 'ivr', 'node1'), ('resource', 'ivr', 'node2')])
+                self.failUnlessEqual(node.readIfExists(('handler', 'sms', str)), None)
+                self.failUnlessEqual([[ownerID, decodeTuple(wireTuple)] for ownerID, wireTuple in node.getOwnedTuples()], \
+                                     [['node1', ('resource', 'ivr', 'node1')]])
+                self.failUnless('node2' in node._leaseScheduler, 'Restored replicas of other peers\' tuples should be leased')
+                self.failUnlessEqual(node.readVersioned(('resource', 'ivr', 'node1')), [('resource', 'ivr', 'node1'), 1])
+                node.put(('handler', 'ivr', 'node1'))
+                self.failUnlessEqual(node.readVersioned(('handler', 'ivr', str))[1], 2, 'Versions should continue from the stored tuples after a restart')
+                node.dataStore.close()
+                os.remove(logFile)
+        finally:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(logFile + suffix):
+                    os.remove(logFile + suffix)
+
+
+class BlockingOperationsTest(unittest.TestCase):
+    """ This test suite tests that get and read operations wait for matching tuples to be put 
+    """
+    def setUp(self):
+        self.clock = task.Clock()
+        self._reactor = network.staticTupleSpace.reactor
+        network.staticTupleSpace.reactor = self.clock
+        self.node = StaticTupleSpacePeer()
+        self.results = []
+        
+    def tearDown(self):
+        network.staticTupleSpace.reactor = self._reactor
+        
+    def testGetExistingTuple(self):
+        self.node.put(('resource', 'ivr', 'node1'), self.node.id)
+        self.node.get(('resource', 'ivr', str)).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [('resource', 'ivr', 'node1')])
+        self.failUnlessEqual(self.node.readIfExists(('resource', 'ivr', str)), None, "get should consume the tuple")
+        
+    def testGetWaitsForPut(self):
+        df = self.node.get(('resource', 'ivr', str))
+        df.addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [], "get should block until a matching tuple is put")
+        self.node.put(('resource', 'sms', 'node1'), self.node.id)
+        self.failUnlessEqual(self.results, [], "get should not be woken by a tuple that doesn't match")
+        self.node.put(('resource', 'ivr', 'node1'), self.node.id)
+        self.failUnlessEqual(self.results, [('resource', 'ivr', 'node1')])
+        self.failUnlessEqual(self.node.readIfExists(('resource', 'ivr', str)), None, "A tuple handed to a waiting get should be consumed")
+        
+    def testGetWaitersServedInOrder(self):
+        first = []
+        second = []
+        self.node.get(('resource', 'ivr', str)).addCallback(first.append)
+        self.node.get(('resource', None, 'node1')).addCallback(second.append)
+        self.node.put(('resource', 'ivr', 'node1'), self.node.id)
+        self.failUnlessEqual((first, second), ([('resource', 'ivr', 'node1')], []), \
+                             "A tuple should be handed to exactly one waiting get, in FIFO order")
+        self.node.put(('resource', 'sms', 'node1'), self.node.id)
+        self.failUnlessEqual(second, [('resource', 'sms', 'node1')])
+        self.failUnlessEqual(self.node._waiters, {})
+        
+    def testReadWaitersShareTuple(self):
+        readers = []
+        getters = []
+        self.node.read(('resource', 'ivr', str)).addCallback(readers.append)
+        self.node.read(('resource', 'ivr', str), numberOfResults=0).addCallback(readers.append)
+        self.node.get(('resource', 'ivr', str)).addCallback(getters.append)
+        self.node.put(('resource', 'ivr', 'node1'), self.node.id)
+        self.failUnlessEqual(readers, [('resource', 'ivr', 'node1'), [('resource', 'ivr', 'node1')]])
+        self.failUnlessEqual(getters, [('resource', 'ivr', 'node1')])
+        
+    def testTimeout(self):
+        self.node.get(('resource', 'ivr', str), timeout=5).addCallback(self.results.append)
+        self.clock.advance(4)
+        self.failUnlessEqual(self.results, [])
+        self.clock.advance(1)
+        self.failUnlessEqual(self.results, [None], "A waiting get should return None once its timeout expires")
+        self.node.put(('resource', 'ivr', 'node1'))
+        self.failUnlessEqual(self.results, [None])
+        self.failIfEqual(self.node.readIfExists(('resource', 'ivr', str)), None, "A timed-out get should not consume tuples")
+        
+    def testCancel(self):
+        df = self.node.get(('resource', 'ivr', str), timeout=5)
+        df.addErrback(lambda f: self.results.append(f.check(defer.CancelledError)))
+        df.cancel()
+        self.failUnlessEqual(self.results, [defer.CancelledError])
+        self.failUnlessEqual(self.node._waiters, {})
+        self.failUnlessEqual(self.clock.getDelayedCalls(), [])
+
 #    def testFindContact(self):
 
 #    def joinNetwork(self):
@@ -156,6 +372,7 @@ class TuplePublishingAndLookupTest(unittest.TestCase):
 
 """ Some scaffolding for the NetworkCreation class."""
 
+
 class FakeRPCProtocol(protocol.DatagramProtocol):
     def __init__(self):
         self.reactor = selectreactor.SelectReactor() 
@@ -178,7 +395,7 @@ class FakeRPCProtocol(protocol.DatagramProtocol):
     def sendRPC(self, contact, method, args, rawResponse=False):
         #print method + " " + str(args)
         
-        if method == "getOwnedTuples":        
+        if method == "getChanges":        
             # Determine which contact this is by using the address information
             for item in self.network:
                 if ((item[1][0] == contact.address) and (item[1][1] == contact.port)):
@@ -187,18 +404,533 @@ class FakeRPCProtocol(protocol.DatagramProtocol):
                     # get the resources at this node
                     for dataItem in self.dataStore:
                         if actualID == dataItem[0]:
-                            resources.append(dataItem)
+                            resources.append(['put', encodeTuple(dataItem[1]), 1])
                     
-                    message = ResponseMessage("rpcId", actualID, resources)
+                    message = ResponseMessage("rpcId", actualID, ['epoch', len(resources), True, resources])
                     
             df = defer.Deferred()
             df.callback((message,(contact.address, contact.port)))
             return df
+        elif method == "ping" and contact.address == network.rpc.constants.multicastGroup:
+            # Every node on the "local network" answers; the first answer is delivered
+            if len(self.network) == 0:
+                return defer.fail(TimeoutError(contact.id))
+            actualID, address = self.network[0]
+            return defer.succeed((ResponseMessage("rpcId", actualID, 'pong'), address))
       
     def _send(self, data, rpcID, address):
         """ fake sending data """
+
+
+class ResourceClaimTest(unittest.TestCase):
+    """ This test suite tests that tuples are claimed from, and released to, their owners 
+    """
+    def setUp(self):
+        self.network, self.peers = createLoopbackNetwork(3)
+        self.owner = self.peers[0]
+        self.resource = ('resource', 'ivr', self.owner.id)
+        # Publish the resource, and replicate it to the other peers
+        for peer in self.peers:
+            peer.put(self.resource, self.owner.id)
+        self.results = []
         
-            
+    def testLocalClaim(self):
+        self.failUnlessEqual(self.owner.claim(('resource', 'ivr', str)), self.resource)
+        self.failUnlessEqual(self.owner.claim(('resource', 'ivr', str)), None, "A claimed tuple should not be granted twice")
+        self.failUnlessEqual(self.peers[1].claim(('resource', 'ivr', str)), None, "Only the owner of a tuple should grant claims")
+        
+    def testConcurrentRemoteClaims(self):
+        self.peers[1].claimTuple(('resource', 'ivr', str)).addCallback(self.results.append)
+        self.peers[2].claimTuple(('resource', 'ivr', str)).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [self.resource, None], "The owner should only grant one of the claims")
+        for peer in self.peers:
+            self.failUnlessEqual(peer.readIfExists(('resource', 'ivr', str)), None, \
+                                 "No replica of a claimed (or refused) tuple should remain")
+        
+    def testClaimRetriesNextOwner(self):
+        otherResource = ('resource', 'ivr', self.peers[2].id)
+        self.peers[2].put(otherResource)
+        self.peers[1].put(otherResource)
+        # The first owner's tuple has already been claimed by someone else
+        self.owner.claim(self.resource)
+        self.peers[1].claimTuple(('resource', 'ivr', str)).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [otherResource])
+        
+    def testClaimFromDeadOwner(self):
+        del self.network[('127.0.0.1', self.owner.port)]
+        self.peers[1].claimTuple(('resource', 'ivr', str)).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [None])
+        self.failUnlessEqual(self.peers[1].readIfExists(('resource', 'ivr', str)), None)
+        
+    def testRelease(self):
+        self.peers[1].claimTuple(('resource', 'ivr', str)).addCallback(self.results.append)
+        self.peers[1].releaseTuple(self.resource).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [self.resource, True])
+        self.failUnlessEqual(self.owner.readIfExists(('resource', 'ivr', str)), self.resource, "A released tuple should be put back by its owner")
+        self.failUnlessEqual(self.peers[1].readIfExists(('resource', 'ivr', str)), self.resource)
+        self.failIf(self.owner.release(self.resource), "A tuple that isn't leased should not be released")
+        
+    def testReleaseOnlyByClaimant(self):
+        self.peers[1].claimTuple(('resource', 'ivr', str)).addCallback(self.results.append)
+        self.peers[2].findContact(self.owner.id).release(encodeTuple(self.resource)).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [self.resource, False], "Only the claimant should release a tuple")
+        self.failUnlessEqual(self.owner.readIfExists(self.resource), None)
+        self.peers[1].releaseTuple(self.resource).addCallback(self.results.append)
+        self.failUnlessEqual(self.results[2:], [True])
+        self.failUnlessEqual(self.owner._leases, {})
+        
+    def testGetClaimsReplicas(self):
+        self.peers[1].get(('resource', 'ivr', str)).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [self.resource])
+        self.failUnlessEqual(self.owner.readIfExists(('resource', 'ivr', str)), None, "A replica should be taken by claiming it from its owner")
+        self.failUnlessEqual(self.peers[2].getIfExists(('resource', 'ivr', str)), None, "Replicas should not be taken locally")
+        # A waiting get claims newly-replicated tuples from their owners
+        self.peers[2].get(('resource', 'ivr', str)).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [self.resource])
+        self.owner.put(self.resource)
+        self.peers[2].put(self.resource, self.owner.id)
+        self.failUnlessEqual(self.results, [self.resource, self.resource])
+        self.failUnlessEqual(self.owner.readIfExists(('resource', 'ivr', str)), None)
+        self.failUnlessEqual(self.peers[2]._waiters, {})
+        
+    def testGetWakesDuringRemoteClaim(self):
+        # The owner does not respond to the claim until later
+        pendingClaims = []
+        def claim(*args, **kwargs):
+            df = defer.Deferred()
+            pendingClaims.append((df, args, kwargs))
+            return df
+        self.owner.claim = claim
+        self.peers[1].get(('resource', 'ivr', str)).addCallback(self.results.append)
+        self.failUnlessEqual(len(pendingClaims), 1)
+        self.failUnlessEqual(self.results, [])
+        # A matching tuple put while the claim is in progress is handed over
+        localResource = ('resource', 'ivr', self.peers[1].id)
+        self.peers[1].put(localResource)
+        self.failUnlessEqual(self.results, [localResource])
+        # The owner grants the claim afterwards, so the tuple is released again
+        df, args, kwargs = pendingClaims[0]
+        df.callback(StaticTupleSpacePeer.claim(self.owner, *args, **kwargs))
+        self.failUnlessEqual(self.results, [localResource])
+        self.failUnlessEqual(self.owner.readIfExists(('resource', 'ivr', str)), self.resource)
+        self.failUnlessEqual(self.owner._leases, {})
+        self.failUnlessEqual(self.peers[1]._waiters, {})
+        
+    def testPickledDataRejected(self):
+        pickled = cPickle.dumps(('resource', 'ivr', str))
+        for method, args in [(self.owner.findTuple, (pickled,)), (self.owner.claim, (pickled,)), (self.owner.release, (pickled,)), \
+                             (self.owner.putMany, ([pickled],))]:
+            self.failUnlessRaises(DataFormatError, method, *args)
+
+
+class BatchOperationsTest(unittest.TestCase):
+    """ This test suite tests operations on many tuples at once, locally and via RPC 
+    """
+    def setUp(self):
+        self.network, self.peers = createLoopbackNetwork(2)
+        self.owner = self.peers[0]
+        self.resources = [('resource', 'ivr', self.owner.id, 'SIP/%d' % i) for i in range(3)]
+        self.results = []
+        
+    def testPutMany(self):
+        self.failUnlessEqual(self.owner.putMany(self.resources), 3)
+        self.failUnlessEqual(sorted(self.owner.readIfExists(('resource', 'ivr', str, str), numberOfResults=0)), self.resources)
+        self.failUnlessEqual(self.owner.getChanges({})[1], 3, "Every tuple in the batch should be logged as a change")
+        
+    def testPutManyInvalidData(self):
+        self.failUnlessRaises(DataFormatError, self.owner.putMany, [self.resources[0], ['resource', ['object', 'os.system']]])
+        self.failUnlessEqual(self.owner.readIfExists(('resource', None, None, None)), None, \
+                             "Nothing should be written if any tuple in the batch is invalid")
+        
+    def testPutManyWakesWaiters(self):
+        self.owner.get(('resource', 'ivr', str, str)).addCallback(self.results.append)
+        self.owner.read(('resource', 'ivr', str, str)).addCallback(self.results.append)
+        self.owner.putMany(self.resources)
+        self.failUnlessEqual(self.results, [self.resources[0], self.resources[0]])
+        self.failUnlessEqual(len(self.owner.readIfExists(('resource', 'ivr', str, str), numberOfResults=0)), 2)
+        
+    def testGetManyAndReadMany(self):
+        self.owner.putMany(self.resources)
+        templates = [('resource', 'ivr', str, 'SIP/0'), ('resource', 'sms', str), ('resource', 'ivr', str, str)]
+        results = self.owner.readMany(templates)
+        self.failUnlessEqual(results[:2], [self.resources[0], None])
+        self.failUnless(results[2] in self.resources)
+        results = self.owner.getMany(templates, numberOfResults=0)
+        self.failUnlessEqual(results[:2], [[self.resources[0]], []])
+        self.failUnlessEqual(sorted(results[2]), self.resources[1:], "Consumed tuples should not be returned twice")
+        self.failUnlessEqual(self.owner.readIfExists(('resource', 'ivr', str, str)), None)
+        
+    def testRemotePutAndReadMany(self):
+        contact = self.peers[1].findContact(self.owner.id)
+        contact.putMany([encodeTuple(resource) for resource in self.resources]).addCallback(self.results.append)
+        contact.readMany([encodeTemplate(('resource', 'ivr', str, str))], 0).addCallback(self.results.append)
+        self.failUnlessEqual(self.results[0], 3)
+        self.failUnlessEqual(sorted([decodeTuple(resource) for resource in self.results[1][0]]), self.resources)
+        self.failUnlessEqual(self.peers[1]._protocol.sentRPCs, [(self.owner.id, 'putMany'), (self.owner.id, 'readMany')])
+        self.failUnlessEqual(self.owner.getOwnedTuples(), [], "Tuples written via RPC should be owned by the caller")
+        self.failUnlessRaises(DataFormatError, self.owner.putMany, [encodeTuple(self.resources[0])], self.owner.id, _rpcNodeID=self.peers[1].id)
+        
+    def testClaimTuples(self):
+        for peer in self.peers:
+            peer.putMany(self.resources, self.owner.id)
+        template = ('resource', 'ivr', str, str)
+        self.peers[1].claimTuples([template, template, ('resource', 'sms', str)]).addCallback(self.results.extend)
+        self.failUnlessEqual(self.results[2], None)
+        self.failUnlessEqual(len(set(self.results[:2])), 2, "Each template should be granted a different tuple")
+        self.failUnlessEqual(self.peers[1]._protocol.sentRPCs, [(self.owner.id, 'claimMany')], \
+                             "The claims to an owner should be sent in a single RPC")
+        self.failUnlessEqual(len(self.owner.readIfExists(template, numberOfResults=0)), 1)
+        self.failUnlessEqual(len(self.peers[1].readIfExists(template, numberOfResults=0)), 1)
+
+
+class TransactionTest(unittest.TestCase):
+    """ This test suite tests that several tuples are claimed together, or not at all 
+    """
+    def setUp(self):
+        self.clock = task.Clock()
+        self._reactor = network.staticTupleSpace.reactor
+        network.staticTupleSpace.reactor = self.clock
+        self.network, self.peers = createLoopbackNetwork(3)
+        self.owner, self.node, self.smsOwner = self.peers
+        self.channel = ('resource', 'ivr', self.owner.id, 'SIP/0')
+        self.gateway = ('resource', 'sms', self.smsOwner.id)
+        self.templates = [('resource', 'ivr', str, str), ('resource', 'sms', str)]
+        # Publish the channel, and replicate it to the node
+        self.owner.put(self.channel)
+        self.node.put(self.channel, self.owner.id)
+        self.results = []
+        
+    def tearDown(self):
+        network.staticTupleSpace.reactor = self._reactor
+        
+    def publishGateway(self):
+        self.smsOwner.put(self.gateway)
+        self.node.put(self.gateway, self.smsOwner.id)
+        
+    def testTakeAll(self):
+        self.publishGateway()
+        self.node.takeAll(self.templates).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [[self.channel, self.gateway]])
+        self.failUnlessEqual(self.owner.countTuples(self.templates[0]), 0)
+        self.failUnlessEqual(self.smsOwner.countTuples(self.templates[1]), 0)
+        
+    def testPartialClaimRolledBack(self):
+        self.node.takeAll(self.templates, timeout=0).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [None])
+        self.failUnlessEqual(self.owner.countTuples(self.templates[0]), 1, "A partially claimed tuple should be released")
+        self.failUnlessEqual(self.owner._leases, {})
+        self.failUnlessEqual(self.node.countTuples(self.templates[0]), 1)
+        
+    def testWaitForMissingTuple(self):
+        self.node.takeAll(self.templates, timeout=5).addCallback(self.results.append)
+        self.clock.advance(0.1)
+        self.failUnlessEqual(self.results, [])
+        self.publishGateway()
+        self.failUnlessEqual(self.results, [[self.channel, self.gateway]])
+        
+    def testTimeout(self):
+        self.node.takeAll(self.templates, timeout=5).addCallback(self.results.append)
+        for i in range(10):
+            self.clock.advance(1)
+        self.failUnlessEqual(self.results, [None])
+        self.failUnlessEqual(self.node._waiters, {})
+        self.failUnlessEqual(self.owner.countTuples(self.templates[0]), 1)
+        
+    def testRetry(self):
+        self.node.takeAll(self.templates).addCallback(self.results.append)
+        # The gateway becomes available without the node being told
+        self.smsOwner.put(self.gateway)
+        self.node.refreshDataStore()
+        self.clock.advance(2 * network.rpc.constants.transactionRetryInterval)
+        self.failUnlessEqual(self.results, [[self.channel, self.gateway]])
+
+
+class DistributedQueryTest(unittest.TestCase):
+    """ This test suite tests queries that are scattered to other peers, and their results gathered 
+    """
+    def setUp(self):
+        self.clock = task.Clock()
+        self._reactor = network.staticTupleSpace.reactor
+        network.staticTupleSpace.reactor = self.clock
+        self.network, self.peers = createLoopbackNetwork(4)
+        self.node = self.peers[0]
+        self.resources = [('resource', 'ivr', 'peer1'), ('resource', 'ivr', 'peer2')]
+        # Each tuple is only stored by its owner
+        self.peers[1].put(self.resources[0])
+        self.peers[2].put(self.resources[1])
+        self.results = []
+        
+    def tearDown(self):
+        network.staticTupleSpace.reactor = self._reactor
+        
+    def hangRPCs(self, contactID):
+        """ Makes the RPCs sent to a peer wait for a response forever, unless cancelled """
+        cancelled = []
+        sendRPC = self.node._protocol.sendRPC
+        def hangingSendRPC(contact, method, args, rawResponse=False):
+            if contact.id == contactID:
+                return defer.Deferred(lambda df: cancelled.append(method))
+            return sendRPC(contact, method, args, rawResponse)
+        self.node._protocol.sendRPC = hangingSendRPC
+        return cancelled
+        
+    def testFirstMatchWins(self):
+        self.node.readDistributed(('resource', 'ivr', str)).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [self.resources[0]])
+        self.failUnlessEqual(self.node._protocol.sentRPCs, [('peer1', 'findTuple')], \
+                             "No more peers should be queried once the result is settled")
+        self.failUnlessEqual(self.node.readIfExists(('resource', 'ivr', str)), None, "Remote results should not be stored locally")
+        
+    def testSummariesLimitFanOut(self):
+        self.node.refreshSummaries()
+        self.node._protocol.sentRPCs = []
+        self.node.readDistributed(('resource', 'ivr', 'peer2')).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [self.resources[1]])
+        self.failUnlessEqual(self.node._protocol.sentRPCs, [('peer2', 'findTuple')], \
+                             "Only the peers whose summaries may contain a match should be queried")
+        self.node.readDistributed(('resource', 'sms', str), numberOfResults=0).addCallback(self.results.append)
+        self.failUnlessEqual(self.results[1], [])
+        self.failUnlessEqual(len(self.node._protocol.sentRPCs), 1, "No peer should be queried if no summary matches")
+        # New tuples are found by querying every peer, or once the summaries
+        # have been refreshed (or are out of date)
+        self.peers[3].put(('resource', 'sms', 'peer3'))
+        self.node.readDistributed(('resource', 'sms', str), useSummaries=False).addCallback(self.results.append)
+        self.failUnlessEqual(self.results[2], ('resource', 'sms', 'peer3'))
+        self.node.refreshSummaries()
+        self.node.readDistributed(('resource', 'sms', str)).addCallback(self.results.append)
+        self.failUnlessEqual(self.results[3], ('resource', 'sms', 'peer3'))
+        
+    def testStaleSummariesQueried(self):
+        self.node.refreshSummaries()
+        self.peers[3].put(('resource', 'sms', 'peer3'))
+        self.clock.advance(network.rpc.constants.refreshInterval + 1)
+        self.node.readDistributed(('resource', 'sms', str)).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [('resource', 'sms', 'peer3')], \
+                             "Peers whose summaries were not refreshed within the refresh interval should be queried")
+        
+    def testRangeQuery(self):
+        capacity = [('resource', 'ivr', 'peer%d' % i, i * 3, 'gp') for i in (1, 2, 3)]
+        for peer, sTuple in zip(self.peers[1:], capacity):
+            peer.put(sTuple)
+        self.node.readDistributed(('resource', 'ivr', str, Range(5), 'gp'), numberOfResults=0).addCallback(self.results.append)
+        self.failUnlessEqual(sorted(self.results[0]), capacity[1:])
+        
+    def testGatherAll(self):
+        self.peers[3].put(self.resources[0], 'peer1')
+        self.node.readDistributed(('resource', None, None), numberOfResults=0).addCallback(self.results.append)
+        self.failUnlessEqual(len(self.results), 1)
+        self.failUnlessEqual(sorted(self.results[0]), self.resources, "Each tuple found should only be returned once")
+        self.failUnlessEqual(len(self.node._protocol.sentRPCs), 3)
+        
+    def testGatherUpToN(self):
+        self.node.put(('resource', 'ivr', self.node.id))
+        self.node.readDistributed(('resource', 'ivr', str), numberOfResults=2).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [[('resource', 'ivr', self.node.id), self.resources[0]]])
+        self.node.readDistributed(('resource', 'ivr', str)).addCallback(self.results.append)
+        self.failUnlessEqual(self.results[1], ('resource', 'ivr', self.node.id))
+        self.failUnlessEqual(len(self.node._protocol.sentRPCs), 1, "Peers should not be queried if enough tuples are found locally")
+        
+    def testSelectedContacts(self):
+        self.node.readDistributed(('resource', 'ivr', str), contacts=[self.node.findContact('peer2')]).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [self.resources[1]])
+        self.failUnlessEqual(self.node._protocol.sentRPCs, [('peer2', 'findTuple')])
+        
+    def testNoMatch(self):
+        del self.network[('127.0.0.1', self.peers[3].port)]
+        self.node.readDistributed(('resource', 'sms', str)).addCallback(self.results.append)
+        self.node.readDistributed(('resource', 'sms', str), numberOfResults=0).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [None, []])
+        
+    def testTimeout(self):
+        cancelled = self.hangRPCs('peer3')
+        self.node.readDistributed(('resource', None, None), numberOfResults=0, timeout=2).addCallback(self.results.append)
+        self.clock.advance(1)
+        self.failUnlessEqual(self.results, [], "The query should wait for the peers that haven't responded")
+        self.clock.advance(1)
+        self.failUnlessEqual(len(self.results), 1)
+        self.failUnlessEqual(sorted(self.results[0]), self.resources, "The results found before the timeout should be returned")
+        self.failUnlessEqual(cancelled, ['findTuple'], "The outstanding RPCs should be cancelled")
+        
+    def testSettledQueryCancelsRPCs(self):
+        self.node.contacts.remove('peer1')
+        self.node.contacts.add(Contact('peer1', '127.0.0.1', self.peers[1].port, self.node._protocol))
+        # peer3 and peer2 are queried before peer1 (which responds with a match)
+        cancelled = self.hangRPCs('peer3')
+        self.node.readDistributed(('resource', 'ivr', 'peer1'), timeout=2).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [self.resources[0]])
+        self.failUnlessEqual(cancelled, ['findTuple'])
+        self.failUnlessEqual(self.clock.getDelayedCalls(), [])
+        
+    def testGetDistributed(self):
+        self.node.getDistributed(('resource', 'ivr', 'peer2')).addCallback(self.results.append)
+        self.node.getDistributed(('resource', 'ivr', 'peer2')).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [self.resources[1], None])
+        self.failUnlessEqual(self.peers[2].readIfExists(('resource', 'ivr', str)), None, "The tuple should be consumed at its owner")
+
+
+class MultisetTest(unittest.TestCase):
+    """ This test suite tests that tuples are stored per owner, with a number of copies 
+    """
+    def setUp(self):
+        self.network, self.peers = createLoopbackNetwork(3)
+        self.owner, self.replica, self.otherOwner = self.peers
+        self.channel = ('resource', 'ivr', self.owner.id, 'SIP/0')
+        self.results = []
+        
+    def testEqualTuplesOfDifferentOwners(self):
+        self.replica.put(('application', 'ivr'), self.owner.id)
+        self.replica.put(('application', 'ivr'), self.otherOwner.id)
+        self.failUnlessEqual(self.replica.readIfExists(('application', str), numberOfResults=0), [('application', 'ivr')] * 2, \
+                             "A tuple published by a second owner should not replace the first owner's tuple")
+        self.replica.purgeOwner(self.owner.id)
+        self.failUnlessEqual(self.replica.countTuples(('application', str)), 1)
+        
+    def testCopies(self):
+        self.owner.putMany([self.channel] * 2)
+        self.owner.put(self.channel)
+        self.failUnlessEqual(self.owner.countTuples(('resource', 'ivr', str, str)), 3)
+        self.failUnlessEqual(len(self.owner.dataStore), 1, "Copies of a tuple should share a data store entry")
+        self.failUnlessEqual([sTuple for ownerID, sTuple in self.owner.getAllTuples()], [encodeTuple(self.channel)] * 3)
+        for i in range(3):
+            self.failUnlessEqual(self.owner.claim(('resource', 'ivr', str, str)), self.channel)
+        self.failUnlessEqual(self.owner.claim(('resource', 'ivr', str, str)), None)
+        self.failUnlessEqual(len(self.owner.dataStore), 0)
+        self.failUnlessEqual([operation for operation, serializedTuple in self.owner.getChanges({})[3]], [])
+        self.failUnlessEqual(self.owner.getChanges([[self.owner.id, self.owner._epoch, 0]])[3], \
+                             [['put', encodeTuple(self.channel), version] for version in (1, 2, 3)] + \
+                             [['take', encodeTuple(self.channel), version] for version in (4, 5, 0)])
+        
+    def testTotalCapacity(self):
+        self.owner.putMany([self.channel] * 2)
+        self.otherOwner.put(('resource', 'ivr', self.otherOwner.id, 'SIP/0'))
+        self.replica.refreshDataStore()
+        self.failUnlessEqual(self.replica.countTuples(('resource', 'ivr', str, str)), 3, \
+                             "The capacity of every gateway node should be counted")
+        
+    def testReplicaOfClaimedCopy(self):
+        self.owner.putMany([self.channel] * 3)
+        self.replica.refreshDataStore()
+        self.replica.claimTuple(('resource', 'ivr', str, str)).addCallback(self.results.append)
+        self.failUnlessEqual(self.results, [self.channel])
+        self.failUnlessEqual(self.replica.countTuples(('resource', 'ivr', str, str)), 2)
+        # The owner's record of the claim should not be applied a second time
+        self.replica.refreshDataStore()
+        self.failUnlessEqual(self.replica.countTuples(('resource', 'ivr', str, str)), 2)
+        self.replica.releaseTuple(self.channel).addCallback(self.results.append)
+        self.replica.refreshDataStore()
+        self.failUnlessEqual(self.replica.countTuples(('resource', 'ivr', str, str)), 3)
+        self.failUnlessEqual(self.owner.countTuples(('resource', 'ivr', str, str)), 3)
+        
+    def testSnapshotCopies(self):
+        self.owner.putMany([self.channel] * 2)
+        self.replica.put(self.channel, self.owner.id)
+        self.replica.put(('resource', 'sms', self.owner.id))
+        self.replica.refreshDataStore()
+        self.failUnlessEqual(self.replica.countTuples(('resource', 'ivr', str, str)), 2, \
+                             "A snapshot should set the number of copies of each replica")
+        self.failUnlessEqual(self.replica.readIfExists(('resource', 'sms', str)), None)
+
+
+class ReplicaCacheTest(unittest.TestCase):
+    """ This test suite tests that the replicas of other peers' tuples are kept in a bounded cache 
+    """
+    def setUp(self):
+        self.network, self.peers = createLoopbackNetwork(3, replicaCacheSize=2)
+        self.node, self.owner = self.peers[:2]
+        self.resources = [('resource', 'ivr%d' % i, self.owner.id) for i in range(3)]
+        
+    def cachedTuples(self):
+        tuples = self.node.readIfExists(('resource', str, self.owner.id), numberOfResults=0)
+        tuples.sort()
+        return tuples
+        
+    def testEviction(self):
+        for resource in self.resources:
+            self.node.put(resource)
+        self.failUnlessEqual(self.cachedTuples(), self.resources[1:], "The least recently used replica should be evicted")
+        self.failUnlessEqual(len(self.node.dataStore), 2)
+        
+    def testOwnedTuplesNotEvicted(self):
+        self.node.putMany([('resource', 'ivr%d' % i, self.node.id) for i in range(5)])
+        self.node.putMany(self.resources)
+        self.failUnlessEqual(self.node.countTuples(('resource', str, self.node.id)), 5)
+        self.failUnlessEqual(len(self.cachedTuples()), 2)
+        
+    def testLeastRecentlyUsed(self):
+        self.node.put(self.resources[0])
+        self.node.put(self.resources[1])
+        self.node.readIfExists(self.resources[0])
+        self.node.put(self.resources[2])
+        self.failUnlessEqual(self.cachedTuples(), [self.resources[0], self.resources[2]])
+        
+    def testByteLimit(self):
+        node = StaticTupleSpacePeer(replicaCacheBytes=1)
+        node.put(self.resources[0])
+        node.put(('resource', 'sms', node.id))
+        self.failUnlessEqual(node.readIfExists(('resource', str, str), numberOfResults=0), [('resource', 'sms', node.id)])
+        
+    def testRefetch(self):
+        self.owner.putMany(self.resources)
+        self.node.refreshDataStore()
+        self.failUnlessEqual(len(self.cachedTuples()), 2)
+        evicted = [resource for resource in self.resources if resource not in self.cachedTuples()][0]
+        results = []
+        self.node.readDistributed(evicted, contacts=[self.node.findContact(self.owner.id)]).addCallback(results.append)
+        self.failUnlessEqual(results, [evicted])
+        self.failUnless(evicted in self.cachedTuples(), "A replica fetched from its owner should be cached")
+        # Changes to evicted replicas are ignored
+        self.owner.getIfExists(self.resources[0])
+        self.owner.getIfExists(self.resources[1])
+        self.node.refreshDataStore()
+        self.failUnless(len(self.cachedTuples()) <= 2)
+
+
+class VersionedTupleTest(unittest.TestCase):
+    """ This test suite tests tuple versions, and compare-and-swap updates 
+    """
+    def setUp(self):
+        self.network, self.peers = createLoopbackNetwork(2)
+        self.owner, self.replica = self.peers
+        self.counter = ('counter', 'calls', self.owner.id, 0)
+        self.template = ('counter', 'calls', self.owner.id, int)
+        
+    def testVersions(self):
+        self.owner.put(self.counter)
+        self.owner.put(('counter', 'calls', self.owner.id, 5))
+        self.failUnlessEqual(self.owner.readVersioned(self.counter), [self.counter, 1])
+        self.owner.put(self.counter)
+        self.failUnlessEqual(self.owner.readVersioned(self.counter), [self.counter, 3], "Every change should give a tuple a new version")
+        self.failUnlessEqual(self.owner.readVersioned(('counter', 'sms', str, int)), None)
+        
+    def testLocalCas(self):
+        self.owner.put(self.counter)
+        self.failUnlessEqual(self.owner.cas(self.template, 1, ('counter', 'calls', self.owner.id, 1)), 2)
+        self.failUnlessEqual(self.owner.readIfExists(self.template, numberOfResults=0), [('counter', 'calls', self.owner.id, 1)])
+        self.failUnlessEqual(self.owner.cas(self.template, 1, ('counter', 'calls', self.owner.id, 2)), None, "A stale version should be refused")
+        self.failUnlessEqual(self.owner.readVersioned(self.template), [('counter', 'calls', self.owner.id, 1), 2])
+        
+    def testCasOnlyByOwner(self):
+        self.replica.put(self.counter, self.owner.id)
+        self.failUnlessEqual(self.replica.cas(self.template, 0, ('counter', 'calls', self.owner.id, 1)), None)
+        
+    def testRemoteCas(self):
+        self.owner.put(self.counter)
+        self.replica.refreshDataStore()
+        sTuple, version = self.replica.readVersioned(self.template)
+        self.failUnlessEqual(version, 1, "Replicas should carry the version assigned by their owner")
+        results = []
+        contact = self.replica.findContact(self.owner.id)
+        contact.readVersioned(encodeTemplate(self.template)).addCallback(results.append)
+        contact.cas(encodeTemplate(self.template), version, encodeTuple(('counter', 'calls', self.owner.id, 1))).addCallback(results.append)
+        self.failUnlessEqual(results, [[encodeTuple(self.counter), 1], 2])
+        self.replica.refreshDataStore()
+        self.failUnlessEqual(self.replica.readIfExists(self.template, numberOfResults=0), [('counter', 'calls', self.owner.id, 1)])
+        self.failUnlessEqual(self.replica.readVersioned(self.template)[1], 2)
+        # A snapshot carries the versions as well
+        other = StaticTupleSpacePeer(id='peer2')
+        other._applyChanges(self.owner.id, self.owner.getChanges([]))
+        self.failUnlessEqual(other.readVersioned(self.template), [('counter', 'calls', self.owner.id, 1), 2])
+
 
 class NetworkCreationTest(unittest.TestCase):
     """ This test suite tests that a StaticTupleSpacePeer can contact its peers (know addresses) and 
@@ -235,7 +967,7 @@ class NetworkCreationTest(unittest.TestCase):
         # Attempt to join the network of known addresses
         self.node.joinNetwork(knownAddresses)
                        
-        # Check that the contacts have been added to the nodes contactsList
+        # Check that the contacts have been added to the nodes contact table
         # construct the contacts used for testing
         expectedContactsList = []
         for item in self.network:
@@ -246,7 +978,7 @@ class NetworkCreationTest(unittest.TestCase):
 #        for conti in expectedContactsList:
 #            print str(conti)
         
-        actualContactsList = self.node.contactsList
+        actualContactsList = list(self.node.contacts)
         
 #        print 'actual contacts list ' + str(actualContactsList)
 #        for conti in actualContactsList:
@@ -261,20 +993,33 @@ class NetworkCreationTest(unittest.TestCase):
         for item in self.dataStore:
             expectedTuple = item[1]
             #print 'searching for: ' + str(item[1])
-            returnedTuple = self.node.get(expectedTuple)
+            returnedTuple = self.node.readIfExists(expectedTuple)
             #print 'returned Tuple ' + str(returnedTuple)
             
             # Check that the returnedTuple is the same as the expected tuple
             self.failUnlessEqual(expectedTuple[1], returnedTuple[1], \
                                  "The data store was not populated correctly, expected tuple to be stored")
         
-        
-    
-                      
+    def testDiscoverPeers(self):
+        results = []
+        self.node.discoverPeers().addCallback(results.append)
+        self._protocol.createNetwork([])
+        self.node.discoverPeers().addCallback(results.append)
+        self.failUnlessEqual(results, [[('127.0.0.1', 12345)], None], \
+                             "The node that answered first should be joined through, or none if no node answered")
+
 
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TuplePublishingAndLookupTest))
+    suite.addTest(unittest.makeSuite(BlockingOperationsTest))
+    suite.addTest(unittest.makeSuite(ResourceClaimTest))
+    suite.addTest(unittest.makeSuite(BatchOperationsTest))
+    suite.addTest(unittest.makeSuite(TransactionTest))
+    suite.addTest(unittest.makeSuite(DistributedQueryTest))
+    suite.addTest(unittest.makeSuite(MultisetTest))
+    suite.addTest(unittest.makeSuite(ReplicaCacheTest))
+    suite.addTest(unittest.makeSuite(VersionedTupleTest))
     suite.addTest(unittest.makeSuite(NetworkCreationTest))
     return suite
 
@@ -0,0 +1,278 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2008 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+#    http://epydoc.sf.net                                                    #
+
+"""
+@author: Bryan McAlister
+
+Provides unit tests for the replication of tuples between StaticTupleSpace peers
+"""
+
+#!/usr/bin/env python
+
+import unittest
+
+import sys
+sys.path.append('../../')
+import network.staticTupleSpace
+import network.rpc.constants
+from network.staticTupleSpace import rpcmethod
+from network.wireformat import encodeTuple, encodeTemplate
+from twisted.internet import task
+from loopbackNetwork import createLoopbackNetwork
+
+
+class SynchronisationTest(unittest.TestCase):
+    """ This test suite tests the incremental synchronisation of replicated tuples 
+    """
+    def setUp(self):
+        self.network, self.peers = createLoopbackNetwork(2)
+        self.owner, self.replica = self.peers
+        self.changes = []
+        # Record the changes sent by the owner
+        getChanges = self.owner.getChanges
+        def recordChanges(digest):
+            changes = getChanges(digest)
+            self.changes.append(changes)
+            return changes
+        self.owner.getChanges = rpcmethod(recordChanges)
+        
+    def replicatedTuples(self):
+        tuples = self.replica.readIfExists((None, None, None), numberOfResults=0)
+        tuples.sort()
+        return tuples
+        
+    def testInitialSnapshot(self):
+        self.owner.put(('resource', 'ivr', self.owner.id))
+        self.owner.put(('handler', 'sms', self.owner.id))
+        self.replica.refreshDataStore()
+        self.failUnlessEqual(self.replicatedTuples(), [('handler', 'sms', self.owner.id), ('resource', 'ivr', self.owner.id)])
+        self.failUnless(self.changes[0][2], "A peer that never synchronised should receive a snapshot")
+        
+    def testIncrementalChanges(self):
+        for i in range(10):
+            self.owner.put(('resource', 'ivr%d' % i, self.owner.id))
+        self.replica.refreshDataStore()
+        self.owner.getIfExists(('resource', 'ivr3', str))
+        self.owner.put(('handler', 'ivr', self.owner.id))
+        self.replica.refreshDataStore()
+        self.failIf(self.changes[1][2], "Only the changes since the previous synchronisation should be sent")
+        self.failUnlessEqual(len(self.changes[1][3]), 2)
+        self.failUnlessEqual(self.replica.readIfExists(('resource', 'ivr3', str)), None, "Tuples taken at the owner should be removed")
+        self.failUnlessEqual(self.replica.readIfExists(('handler', 'ivr', str)), ('handler', 'ivr', self.owner.id))
+        self.failUnlessEqual(len(self.replicatedTuples()), 10)
+        # Nothing changed since the last pass
+        self.replica.refreshDataStore()
+        self.failUnlessEqual(self.changes[2][3], [])
+        
+    def testOwnerRestart(self):
+        self.owner.put(('resource', 'ivr', self.owner.id))
+        self.replica.refreshDataStore()
+        # The owner restarts (with a new epoch), and publishes something else
+        self.owner.getIfExists(('resource', 'ivr', str))
+        self.owner._epoch = self.owner._generateID()
+        self.owner.put(('resource', 'sms', self.owner.id))
+        self.replica.refreshDataStore()
+        self.failUnless(self.changes[1][2], "A snapshot should be sent after the owner restarted")
+        self.failUnlessEqual(self.replicatedTuples(), [('resource', 'sms', self.owner.id)])
+        
+    def testChangeLogOverflow(self):
+        self.replica.refreshDataStore()
+        for i in range(network.rpc.constants.changeLogSize * 2 + 1):
+            self.owner.put(('counter', i, self.owner.id))
+            self.owner.getIfExists(('counter', i, self.owner.id))
+        self.owner.put(('resource', 'ivr', self.owner.id))
+        self.replica.refreshDataStore()
+        self.failUnless(self.changes[1][2], "A snapshot should be sent if the changes are no longer known")
+        self.failUnlessEqual(self.replicatedTuples(), [('resource', 'ivr', self.owner.id)])
+
+
+class LeaseExpiryTest(unittest.TestCase):
+    """ This test suite tests that replicated tuples lapse if their owner stops renewing them 
+    """
+    def setUp(self):
+        self.clock = task.Clock()
+        self._reactor = network.staticTupleSpace.reactor
+        network.staticTupleSpace.reactor = self.clock
+        self.network, self.peers = createLoopbackNetwork(3)
+        self.handler = ('handler', 'ivr', self.peers[0].id, '', '0821234567')
+        self.peers[0].put(self.handler)
+        self.peers[1].put(('handler', 'ivr', self.peers[1].id, '', '0821234568'))
+        self.peers[2].refreshDataStore()
+        
+    def tearDown(self):
+        network.staticTupleSpace.reactor = self._reactor
+        
+    def testRenewedByOwner(self):
+        for i in range(5):
+            self.clock.advance(network.rpc.constants.refreshInterval)
+            self.peers[2].refreshDataStore()
+        self.failUnlessEqual(len(self.peers[2].readIfExists(('handler', 'ivr', str, None, None), numberOfResults=0)), 2)
+        
+    def testDeadOwnerExpires(self):
+        del self.network[('127.0.0.1', self.peers[0].port)]
+        for i in range(3):
+            self.clock.advance(network.rpc.constants.refreshInterval)
+            self.peers[2].refreshDataStore()
+        self.failUnlessEqual(self.peers[2].readIfExists(('handler', 'ivr', str, None, None), numberOfResults=0), \
+                             [('handler', 'ivr', self.peers[1].id, '', '0821234568')], \
+                             "Handlers of a dead owner should be evicted within one lease period")
+        # Once the owner is back, all of its tuples are fetched again
+        self.network[('127.0.0.1', self.peers[0].port)] = self.peers[0]
+        self.peers[2].refreshDataStore()
+        self.failUnlessEqual(self.peers[2].readIfExists(('handler', 'ivr', self.peers[0].id, None, None)), self.handler)
+        
+    def testClaimExpires(self):
+        owner, claimant = self.peers[0], self.peers[1]
+        results = []
+        claimant.findContact(owner.id).claim(encodeTemplate(self.handler)).addCallback(results.append)
+        self.failUnlessEqual(results, [encodeTuple(self.handler)])
+        self.clock.advance(network.rpc.constants.claimLease - 1)
+        # Any message from the claimant renews its claims
+        owner.internContact(claimant.id, '127.0.0.1', claimant.port)
+        self.clock.advance(network.rpc.constants.claimLease - 1)
+        self.failUnlessEqual(owner.readIfExists(self.handler), None)
+        self.clock.advance(2)
+        self.failUnlessEqual(owner.readIfExists(self.handler), self.handler, \
+                             "A claim should lapse if the claimant is not heard from within the lease")
+        self.failUnlessEqual(owner._leases, {})
+        
+    def testFailedClaimantReleased(self):
+        owner, claimant = self.peers[0], self.peers[1]
+        claimant.findContact(owner.id).claim(encodeTemplate(self.handler))
+        owner._memberFailed(claimant.id)
+        self.failUnlessEqual(owner.readIfExists(self.handler), self.handler, "The claims of a failed peer should be put back")
+        self.failIf(claimant.id in owner._claimScheduler)
+        
+    def testOwnTuplesDoNotExpire(self):
+        self.clock.advance(network.rpc.constants.tupleLease * 2)
+        self.failUnlessEqual(self.peers[0].readIfExists(('handler', 'ivr', str, None, None)), self.handler)
+        self.failUnlessEqual(self.peers[2].readIfExists(('handler', 'ivr', str, None, None)), None)
+        
+    def testPurgeOwner(self):
+        ownerID = self.peers[0].id
+        self.failUnlessEqual(self.peers[2].purgeOwner(ownerID), 1)
+        self.failUnlessEqual(self.peers[2].readIfExists(('handler', 'ivr', ownerID, None, None)), None)
+        self.failUnlessEqual(len(self.peers[2].readIfExists(('handler', 'ivr', str, None, None), numberOfResults=0)), 1)
+        self.failIf(ownerID in self.peers[2]._leaseScheduler, "The lease on a purged owner's tuples should be cancelled")
+        self.failIf(ownerID in self.peers[2]._syncState, "A full snapshot should be fetched if the owner comes back")
+        self.failUnlessEqual(self.peers[0].purgeOwner(ownerID), 0, "A peer should not purge its own tuples")
+        self.failUnlessEqual(self.peers[0].readIfExists(('handler', 'ivr', ownerID, None, None)), self.handler)
+        
+    def testDeadContactPurged(self):
+        for i in range(network.rpc.constants.contactFailureLimit):
+            self.peers[2].removeContact(self.peers[0].id)
+        self.failUnlessEqual(self.peers[2].findContact(self.peers[0].id), None)
+        self.failUnlessEqual(self.peers[2].readIfExists(('handler', 'ivr', self.peers[0].id, None, None)), None, \
+                             "The tuples of a dead contact should be purged")
+
+
+class SubscriptionTest(unittest.TestCase):
+    """ This test suite tests that changes to watched tuples are pushed to subscribers 
+    """
+    def setUp(self):
+        self.clock = task.Clock()
+        self._reactor = network.staticTupleSpace.reactor
+        network.staticTupleSpace.reactor = self.clock
+        self.network, self.peers = createLoopbackNetwork(2)
+        self.owner, self.subscriber = self.peers
+        self.owner.put(('resource', 'ivr', self.owner.id, 'SIP/1'))
+        self.subscriber.subscribe(('resource', str, str, str))
+        
+    def tearDown(self):
+        network.staticTupleSpace.reactor = self._reactor
+        
+    def pushes(self):
+        return [method for contactID, method in self.owner._protocol.sentRPCs if method == 'notifyChanges']
+        
+    def testInitialState(self):
+        self.failUnlessEqual(self.subscriber.readIfExists(('resource', 'ivr', str, str)), ('resource', 'ivr', self.owner.id, 'SIP/1'))
+        
+    def testPushedChanges(self):
+        self.owner.put(('resource', 'ivr', self.owner.id, 'SIP/2'))
+        self.owner.put(('resource', 'ivr', self.owner.id, 'SIP/3'))
+        self.owner.getIfExists(('resource', 'ivr', str, 'SIP/1'))
+        self.clock.advance(0)
+        self.failUnlessEqual(len(self.pushes()), 1, "Changes made together should be pushed together")
+        resources = self.subscriber.readIfExists(('resource', 'ivr', str, str), numberOfResults=0)
+        resources.sort()
+        self.failUnlessEqual(resources, [('resource', 'ivr', self.owner.id, 'SIP/2'), ('resource', 'ivr', self.owner.id, 'SIP/3')])
+        
+    def testUnwatchedChanges(self):
+        self.owner.put(('handler', 'ivr', self.owner.id))
+        self.clock.advance(0)
+        self.failUnlessEqual(self.pushes(), [], "Changes to tuples that aren't watched should not be pushed")
+        # ...but they are included with the next push, to keep the replicas consistent
+        self.owner.getIfExists(('resource', 'ivr', str, 'SIP/1'))
+        self.clock.advance(0)
+        self.failUnlessEqual(self.subscriber.readIfExists(('handler', 'ivr', str)), ('handler', 'ivr', self.owner.id))
+        self.failUnlessEqual(self.subscriber.readIfExists(('resource', 'ivr', str, str)), None)
+        
+    def testMissedChanges(self):
+        # The subscriber is unreachable while a change is pushed
+        del self.network[('127.0.0.1', self.subscriber.port)]
+        self.owner.put(('resource', 'ivr', self.owner.id, 'SIP/2'))
+        self.clock.advance(0)
+        self.failUnlessEqual(self.owner._watchers, {}, "Unreachable watchers should be dropped")
+        self.network[('127.0.0.1', self.subscriber.port)] = self.subscriber
+        # The subscription is restored by the next anti-entropy pass
+        self.subscriber.refreshDataStore()
+        self.failUnlessEqual(len(self.subscriber.readIfExists(('resource', 'ivr', str, str), numberOfResults=0)), 2)
+        self.owner.put(('resource', 'ivr', self.owner.id, 'SIP/3'))
+        self.clock.advance(0)
+        self.failUnlessEqual(len(self.subscriber.readIfExists(('resource', 'ivr', str, str), numberOfResults=0)), 3)
+        
+    def testSequenceGap(self):
+        # Changes pushed out of order are detected, and fetched from the owner
+        self.subscriber._syncState[self.owner.id] = (self.owner._epoch, 0)
+        self.subscriber.getIfExists(('resource', 'ivr', str, str))
+        del self.subscriber._protocol.sentRPCs[:]
+        self.owner.put(('resource', 'ivr', self.owner.id, 'SIP/2'))
+        self.clock.advance(0)
+        self.failUnlessEqual(self.subscriber._protocol.sentRPCs, [(self.owner.id, 'watch')])
+        self.failUnlessEqual(len(self.subscriber.readIfExists(('resource', 'ivr', str, str), numberOfResults=0)), 2)
+        
+    def testUnsubscribe(self):
+        self.subscriber.unsubscribe(('resource', str, str, str))
+        self.owner.put(('resource', 'ivr', self.owner.id, 'SIP/2'))
+        self.clock.advance(0)
+        self.failUnlessEqual(self.pushes(), [])
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(SynchronisationTest))
+    suite.addTest(unittest.makeSuite(LeaseExpiryTest))
+    suite.addTest(unittest.makeSuite(SubscriptionTest))
+    return suite
+
+if __name__ == '__main__':
+    # If this module is executed from the commandline, run all its tests
+    unittest.TextTestRunner().run(suite())
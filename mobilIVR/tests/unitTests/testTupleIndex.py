@@ -0,0 +1,157 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2009 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+#    http://epydoc.sf.net                                                    #
+
+"""
+@author: Bryan McAlister
+
+Provides unit tests for the template matching engine of the StaticTupleSpace
+"""
+
+#!/usr/bin/env python
+
+import unittest
+
+import sys
+sys.path.append('../../')
+from network.tupleindex import TupleIndex, Range, templateMatches
+
+
+class TemplateMatchingTest(unittest.TestCase):
+    """ Tests matching of single tuples against templates """
+    def testExactMatch(self):
+        self.failUnless(templateMatches(('resource', 'ivr', 'node1'), ('resource', 'ivr', 'node1')))
+        self.failIf(templateMatches(('resource', 'ivr', 'node1'), ('resource', 'ivr', 'node2')))
+
+    def testArity(self):
+        self.failIf(templateMatches(('resource', 'ivr'), ('resource', 'ivr', 'node1')), 'Templates should only match tuples of the same length')
+
+    def testWildcards(self):
+        self.failUnless(templateMatches(('handler', 'ivr', str, None, None), ('handler', 'ivr', 'node1', '', '0821234567')))
+        self.failUnless(templateMatches(('counter', int), ('counter', 5)))
+        self.failIf(templateMatches(('counter', str), ('counter', 5)), 'Type wildcards should only match values of that type')
+
+    def testRanges(self):
+        self.failUnless(templateMatches(('counter', Range(5)), ('counter', 5)))
+        self.failUnless(templateMatches(('counter', Range(5, 10)), ('counter', 7.5)))
+        self.failIf(templateMatches(('counter', Range(5, lowInclusive=False)), ('counter', 5)))
+        self.failIf(templateMatches(('counter', Range(high=10, highInclusive=False)), ('counter', 10)))
+        self.failIf(templateMatches(('counter', Range(5)), ('counter', '7')), 'Ranges should only match numbers')
+
+
+class TupleIndexTest(unittest.TestCase):
+    """ Tests lookups and maintenance of the tuple index """
+    def setUp(self):
+        self.index = TupleIndex()
+        self.tuples = {'k1': ('resource', 'ivr', 'node1'),
+                       'k2': ('resource', 'ivr', 'node2'),
+                       'k3': ('resource', 'sms', 'node1'),
+                       'k4': ('handler', 'ivr', 'node1', '', ''),
+                       'k5': ('handler', 'ivr', 'node2', 'SIP/1000', '')}
+        for key, sTuple in self.tuples.items():
+            self.index.add(key, sTuple)
+
+    def testMatch(self):
+        result = self.index.match(('resource', 'ivr', str))
+        result.sort()
+        self.failUnlessEqual(result, ['k1', 'k2'])
+        result = self.index.match((None, None, 'node1'))
+        result.sort()
+        self.failUnlessEqual(result, ['k1', 'k3'])
+        self.failUnlessEqual(self.index.match(('handler', 'ivr', str, 'SIP/1000', None)), ['k5'])
+        self.failUnlessEqual(self.index.match(('handler', 'fax', str)), [])
+        self.failUnlessEqual(self.index.match(('a', 'b', 'c', 'd', 'e', 'f')), [])
+
+    def testNumberOfResults(self):
+        self.failUnlessEqual(len(self.index.match(('resource', None, None), 2)), 2)
+        self.failUnlessEqual(len(self.index.match(('resource', None, None), 0)), 3)
+
+    def testRemove(self):
+        self.index.remove('k1')
+        self.failUnlessEqual(self.index.match(('resource', 'ivr', str)), ['k2'])
+        self.failIf('k1' in self.index)
+        # Removing an unknown key should be ignored
+        self.index.remove('k1')
+        self.failUnlessEqual(len(self.index), 4)
+        self.failUnlessEqual(self.index._fieldIndex.get((3, 2, 'node1')), set(['k3']), 'Index entries of removed tuples should be cleaned up')
+
+    def testReplace(self):
+        self.index.add('k1', ('resource', 'fax', 'node1'))
+        self.failUnlessEqual(self.index.match(('resource', 'fax', str)), ['k1'])
+        self.failIf('k1' in self.index.match(('resource', 'ivr', str)))
+
+
+class SortedIndexTest(unittest.TestCase):
+    """ Tests range lookups in sorted field indexes """
+    def setUp(self):
+        self.index = TupleIndex(sortedFields=[(5, 3)])
+        self.tuples = {}
+        for i in range(20):
+            self.tuples['k%d' % i] = ('resource', 'ivr', 'node%d' % i, i % 10, i < 10 and 'gp' or 'wc')
+        self.tuples['k20'] = ('resource', 'ivr', 'node20', 'unknown', 'gp')
+        for key, sTuple in self.tuples.items():
+            self.index.add(key, sTuple)
+
+    def match(self, template):
+        result = self.index.match(template, 0)
+        result.sort()
+        return result
+
+    def testRangeMatch(self):
+        self.failUnlessEqual(self.match(('resource', 'ivr', str, Range(8), 'gp')), ['k8', 'k9'])
+        self.failUnlessEqual(self.match(('resource', 'ivr', str, Range(2, 3), None)), ['k12', 'k13', 'k2', 'k3'])
+        self.failUnlessEqual(self.match(('resource', 'ivr', str, Range(9, lowInclusive=False), None)), [])
+        self.failUnlessEqual(len(self.index.match(('resource', 'ivr', str, Range(), None), 0)), 20)
+
+    def testSortedIndexMaintained(self):
+        self.index.remove('k9')
+        self.index.add('k8', ('resource', 'ivr', 'node8', 1, 'gp'))
+        self.failUnlessEqual(self.match(('resource', 'ivr', str, Range(8), 'gp')), [])
+        self.failUnlessEqual(self.index._sortedIndex[(5, 3)][0], sorted([sTuple[3] for key, sTuple in self.tuples.items() if key not in ('k8', 'k9', 'k20')] + [1]))
+
+    def testAddSortedField(self):
+        index = TupleIndex()
+        for key, sTuple in self.tuples.items():
+            index.add(key, sTuple)
+        index.addSortedField(5, 3)
+        self.failUnlessEqual(index._sortedIndex[(5, 3)][0], self.index._sortedIndex[(5, 3)][0])
+        self.failUnlessEqual(sorted(index.match(('resource', None, None, Range(high=0), None), 0)), ['k0', 'k10'])
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TemplateMatchingTest))
+    suite.addTest(unittest.makeSuite(TupleIndexTest))
+    suite.addTest(unittest.makeSuite(SortedIndexTest))
+    return suite
+
+if __name__ == '__main__':
+    # If this module is executed from the commandline, run all its tests
+    unittest.TextTestRunner().run(suite())
@@ -0,0 +1,96 @@
+#----------------------------------------------------------------------------#
+#                                                                            #
+#    Copyright (C) 2009 Department of Arts and Culture,                      #
+#                       Republic of South Africa                             #
+#    Contributer: Meraka Institute, CSIR                                     #
+#    Author: Bryan McAlister                                                 #
+#    Contact: bmcalister@csir.co.za                                          #
+#                                                                            #
+#    License:                                                                #
+#    Redistribution and use in source and binary forms, with or without      #
+#    modification, are permitted provided that the following conditions are  #
+#    met:                                                                    #
+#                                                                            #
+#     * Redistributions of source code must retain the above copyright       #
+#       notice, this list of conditions and disclaimer. <See COPYING file>   #
+#                                                                            #
+#     * Redistributions in binary form must reproduce the above copyright    #
+#       notice, this list of conditions and disclaimer <See COPYING file>    #
+#       in the documentation and/or other materials provided with the        #
+#       distribution.                                                        #
+#                                                                            #
+#     * Neither the name of the Department of Arts and Culture nor the names #
+#       of its contributors may be used to endorse or promote products       #
+#       derived from this software without specific prior written permission.#
+#----------------------------------------------------------------------------#
+
+
+#    The docstrings in this module contain epytext markup: API               #
+#    documentation  may be created by processing this file with epydoc:      #
+#    http://epydoc.sf.net                                                    #
+
+
+"""
+@author: Bryan McAlister
+
+Provides unit tests for the wire format of tuples and templates exchanged by the StaticTupleSpace
+"""
+
+#!/usr/bin/env python
+
+import cPickle
+import unittest
+
+import sys
+sys.path.append('../../')
+from network.wireformat import DataFormatError, encodeTuple, decodeTuple, encodeTemplate, decodeTemplate
+from network.tupleindex import Range
+from network.rpc.encoding import Bencode
+
+
+class WireFormatTest(unittest.TestCase):
+    """ Tests converting tuples and templates to and from the wire format """
+    def setUp(self):
+        self.encoder = Bencode()
+
+    def send(self, data):
+        return self.encoder.decode(self.encoder.encode(data))
+
+    def testTupleRoundTrip(self):
+        sTuple = ('resource', 'ivr', 'node1', 5, 2.5, None, True, u'caf\xe9', ('SIP', 'trunk1'), 10L)
+        self.failUnlessEqual(decodeTuple(self.send(encodeTuple(sTuple))), sTuple)
+        self.failUnless(decodeTuple(self.send(encodeTuple(sTuple)))[6] is True, 'Boolean fields should keep their type')
+
+    def testTemplateRoundTrip(self):
+        template = ('resource', str, None, Range(5), Range(1, 3, False, True), int, tuple)
+        self.failUnlessEqual(decodeTemplate(self.send(encodeTemplate(template))), template)
+
+    def testUnsupportedFields(self):
+        self.failUnlessRaises(DataFormatError, encodeTuple, ('resource', str))
+        self.failUnlessRaises(DataFormatError, encodeTuple, ('resource', Range(5)))
+        self.failUnlessRaises(DataFormatError, encodeTemplate, ('resource', dict))
+        self.failUnlessRaises(DataFormatError, encodeTuple, ('resource', ['ivr']))
+        self.failUnlessRaises(DataFormatError, encodeTuple, ['resource', 'ivr'])
+
+    def testInvalidData(self):
+        invalid = [cPickle.dumps(('resource', 'ivr')), {'resource': 'ivr'}, ['resource', {}], ['resource', []],
+                   ['resource', ['object', 'os.system']], ['resource', ['type', 'file']], ['resource', ['type', ['str']]],
+                   ['resource', ['range', 'a', None, 1, 1]], ['resource', ['bool', 2]], ['resource', ['unicode', '\xff']]]
+        for data in invalid:
+            self.failUnlessRaises(DataFormatError, decodeTemplate, data)
+        self.failUnlessRaises(DataFormatError, decodeTuple, ['resource', ['type', 'str']])
+        self.failUnlessRaises(DataFormatError, decodeTuple, ['resource', ['range', 1, 2, 1, 1]])
+        nested = 'x'
+        for i in range(20):
+            nested = ['tuple', [nested]]
+        self.failUnlessRaises(DataFormatError, decodeTuple, [nested])
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(WireFormatTest))
+    return suite
+
+if __name__ == '__main__':
+    # If this module is executed from the commandline, run all its tests
+    unittest.TextTestRunner().run(suite())
@@ -42,7 +42,8 @@ import mobilIVR.node
 def setupNode():
     knownNodes = parseArgs()
     # Set up our local node
-    node = mobilIVR.node.MobilIVRNode( int(sys.argv[1]) )
+    # Without known nodes, find the nodes on the local network
+    node = mobilIVR.node.MobilIVRNode( int(sys.argv[1]), multicastDiscovery=(knownNodes == None) )
     node.loadConfigIVR('etc/ivr.conf')
     node.loadConfigSMS('etc/sms.conf')
     node.joinNetwork(knownNodes)
@@ -55,6 +56,7 @@ def parseArgs():
         print 'Usage:\n%s UDP_PORT  [KNOWN_NODE_IP  KNOWN_NODE_PORT]' % sys.argv[0]
         print 'or:\n%s UDP_PORT  [FILE_WITH_KNOWN_NODES]' % sys.argv[0]
         print '\nIf a file is specified, it should containg one IP address and UDP port\nper line, seperated by a space.'
+        print 'If no known node is specified, nodes are discovered by multicast on the local network.'
         sys.exit(1)
     try:
         int(sys.argv[1])
@@ -63,6 +65,7 @@ def parseArgs():
         print 'Usage:\n%s UDP_PORT  [KNOWN_NODE_IP  KNOWN_NODE_PORT]' % sys.argv[0]
         print 'or:\n%s UDP_PORT  [FILE_WITH_KNOWN_NODES]' % sys.argv[0]
         print '\nIf a file is specified, it should contain one IP address and UDP port\nper line, seperated by a space.'
+        print 'If no known node is specified, nodes are discovered by multicast on the local network.'
         sys.exit(1)
     if len(sys.argv) == 4:
         knownNodes = [(sys.argv[2], int(sys.argv[3]))]